@@ -0,0 +1,761 @@
+"""
+性能基准测试 - 在本地模拟服务（fake_starlight.py）上测量监控程序的关键路径
+
+- poll:       单任务端到端轮询延迟（请求 + 解析），以及批量查询摊到每个任务的延迟
+- throughput: 稳定运行时每秒、每 CPU 秒能完成多少个任务的指标查询
+- parse:      大 spec.device 响应（多卡、密集采样）的 JSON 解析耗时和内存峰值
+- notify:     NotificationManager.send_all 发送到多个通知方式的延迟（同步 / 后台发送）
+- rss:        多任务引擎长时间运行时的内存（RSS）变化
+- fleet:      分片监控（fleet.py）用 1/2/4 个进程分担任务时的总查询吞吐量
+- startup:    新进程的导入耗时和从启动到完成首次轮询的耗时（无缓存 Token / 有缓存 Token），与 STARTUP_BUDGET_MS 比较
+- crash:      按 CHECK_INTERVAL 的真实节奏（每次轮询一个读数）回放显存曲线，测量单任务监控的进程退出检测延迟，
+              以及缓慢下降 / 短暂低谷是否被误判
+- idle:       按轮询节奏回放显存降为 0 的曲线（覆盖各种轮询相位），比较窗口闲置检测与只看最新值时的检测延迟，
+              以及单个噪声读数是否被误判
+
+模拟服务在子进程中运行，不占用被测进程的 CPU。结果以 JSON 输出，
+用 --compare 比较两次运行的结果，超过容差的退化会列出并返回非零退出码。
+
+用法：
+    python benchmark.py                                  # 运行全部基准，结果输出到屏幕
+    python benchmark.py poll parse --jobs 500 --output run.json
+    python benchmark.py --compare base.json run.json --tolerance 0.2
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import config
+
+
+def summarize(samples):
+    """延迟样本（秒）的统计，单位毫秒"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(q):
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": pct(0.5),
+        "p90_ms": pct(0.9),
+        "p99_ms": pct(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def rss_mb():
+    """当前进程的常驻内存（MB），无法获取时返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节（只能得到峰值）
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽被测代码的 print 输出"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+@contextlib.contextmanager
+def overrides(**values):
+    """临时修改 config 中的参数"""
+    saved = {key: getattr(config, key) for key in values}
+    for key, value in values.items():
+        setattr(config, key, value)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            setattr(config, key, value)
+
+
+@contextlib.contextmanager
+def fake_server(jobs, **scenario):
+    """
+    在子进程中启动模拟服务，并把 config 中的接口地址指向它
+
+    Yields:
+        tuple: (jobs.Job 列表, 模拟的钉钉 Webhook 地址)
+    """
+    import fake_starlight
+    from jobs import load_jobs
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    scenario_path = os.path.join(workdir, "scenario.json")
+    logs_path = os.path.join(workdir, "jobs.log")
+    with open(scenario_path, "w", encoding="utf-8") as f:
+        json.dump({"generate": {"count": jobs, "seed": 1}, **scenario}, f)
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_starlight.py"),
+         "--port", str(port), "--scenario", scenario_path, "--logs", logs_path],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while not os.path.exists(logs_path) or not _port_open(port):
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("模拟服务启动失败")
+            time.sleep(0.05)
+        saved_base = config.API_BASE
+        fake_starlight.use_server(f"http://127.0.0.1:{port}/api")
+        try:
+            with open(logs_path, encoding="utf-8") as f:
+                with quiet():
+                    job_list = load_jobs([line for line in f.read().splitlines() if line])
+            _login()
+            yield job_list, f"http://127.0.0.1:{port}/robot/send?access_token=fake"
+        finally:
+            fake_starlight.use_server(saved_base)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _port_open(port):
+    with socket.socket() as s:
+        return s.connect_ex(("127.0.0.1", port)) == 0
+
+
+def _login():
+    """向模拟服务登录（接受任意账号），更新 monitor.HEADERS"""
+    import monitor
+    from http_client import get_client
+
+    response = get_client().post(config.LOGIN_URL, json={"username": "bench", "password": ""})
+    monitor.update_headers(response.json()["spec"])
+
+
+def bench_poll(jobs=200, latency=0.0):
+    """单任务端到端轮询延迟，以及批量查询摊到每个任务的延迟"""
+    import monitor
+    from metrics import Watermarks, fetch_metric_batch
+
+    with fake_server(jobs, latency=latency) as (job_list, _):
+        single = []
+        with quiet():
+            for job in job_list:
+                start = time.perf_counter()
+                monitor.get_current_gpu_memory(job)
+                single.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            fetch_metric_batch(job_list, marks=Watermarks())
+            batched = time.perf_counter() - start
+    return {
+        "jobs": jobs,
+        "single": summarize(single),
+        "batched_per_job_ms": batched / jobs * 1000,
+    }
+
+
+def bench_throughput(jobs=500, duration=5.0):
+    """稳定运行（增量查询）时每秒、每 CPU 秒完成的任务查询数"""
+    from metrics import Watermarks, fetch_metric_batch
+
+    with fake_server(jobs, sample_interval=1) as (job_list, _):
+        marks = Watermarks()
+        with quiet():
+            fetch_metric_batch(job_list, marks=marks)  # 预热：建立连接和高水位
+            polled = 0
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            while time.perf_counter() - wall_start < duration:
+                fetch_metric_batch(job_list, marks=marks)
+                polled += len(job_list)
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+    return {
+        "jobs": jobs,
+        "jobs_per_sec": polled / wall,
+        "jobs_per_cpu_sec": polled / cpu if cpu else None,
+        "cpu_utilization": cpu / wall,
+    }
+
+
+def _fleet_worker(index, job_list, api_base, token, directory, duration, barrier, results):
+    """bench_fleet 的子进程：取得分配给本进程的任务的租约，然后持续查询这些任务"""
+    import fake_starlight
+    import monitor
+    from fleet import Fleet
+    from metrics import Watermarks, fetch_metric_batch
+
+    fake_starlight.use_server(api_base)
+    monitor.update_headers(token)
+    fleet = Fleet(directory, worker_id=f"bench-w{index}")
+    fleet.heartbeat()
+    barrier.wait()  # 所有进程的心跳都已写入
+    assigned = fleet.assigned([job.job_id for job in job_list])
+    mine = [job for job in job_list if job.job_id in assigned and fleet.acquire(job.job_id)]
+    marks = Watermarks()
+    with quiet():
+        if mine:
+            fetch_metric_batch(mine, marks=marks)
+        barrier.wait()
+        polled = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            if not mine:
+                break
+            fetch_metric_batch(mine, marks=marks)
+            polled += len(mine)
+    results.put((index, len(mine), polled, time.perf_counter() - start))
+    fleet.leave()
+
+
+def bench_fleet(jobs=500, duration=5.0, workers=(1, 2, 4), latency=0.02):
+    """
+    分片监控的吞吐量：workers 个进程通过租约分担 jobs 个任务，各自持续查询自己的任务
+
+    模拟服务每个请求增加 latency 秒延迟（接近真实 API），吞吐量应随进程数近似线性增长。
+    """
+    context = multiprocessing.get_context("spawn")
+    result = {"jobs": jobs}
+    with fake_server(jobs, latency=latency, sample_interval=1) as (job_list, _):
+        import monitor
+
+        for count in workers:
+            directory = tempfile.mkdtemp(prefix="bench-fleet-")
+            barrier = context.Barrier(count)
+            queue = context.Queue()
+            processes = [
+                context.Process(target=_fleet_worker, args=(
+                    i, job_list, config.API_BASE, monitor.HEADERS["bihu-token"], directory, duration, barrier, queue,
+                ))
+                for i in range(count)
+            ]
+            for process in processes:
+                process.start()
+            reports = [queue.get(timeout=duration + 120) for _ in processes]
+            for process in processes:
+                process.join()
+            owned = sorted(n for _, n, _, _ in reports)
+            result[f"workers_{count}"] = {
+                "jobs_per_sec": sum(polled / wall for _, _, polled, wall in reports if wall),
+                "owned_min": owned[0],
+                "owned_max": owned[-1],
+                "owned_total": sum(owned),
+            }
+    base = result.get(f"workers_{workers[0]}", {}).get("jobs_per_sec")
+    if base:
+        result["speedup"] = {
+            f"workers_{count}": result[f"workers_{count}"]["jobs_per_sec"] / base for count in workers
+        }
+    return result
+
+
+def metric_payload(devices=8, points=120, pods=1):
+    """构造 spec.device 响应（每个 Pod devices 张卡，每张卡 points 个数据点）"""
+    now = int(time.time())
+    entries = [
+        {"pod": f"bench-{p}", "device": f"gpu{d}", "node": "an1",
+         "data": [[now - (points - i) * 15, f"{(i * 37 + d) % 40000:.1f}"] for i in range(points)]}
+        for p in range(pods) for d in range(devices)
+    ]
+    return json.dumps({"code": 200, "info": "", "spec": {"device": entries}}).encode()
+
+
+def parse_latest(body):
+    """完整 json 解析后取每个设备最后一个数据点（METRIC_STREAMING = False 时的路径）"""
+    res_json = json.loads(body)
+    devices = res_json.get("spec", {}).get("device", [])
+    return max((float(dev["data"][-1][1]) for dev in devices if dev.get("data")), default=None)
+
+
+def parse_latest_stream(body):
+    """分块流式解析，每个设备只保留最后一个数据点（get_current_gpu_memory 的路径）"""
+    from metric_stream import parse_metric_stream
+
+    chunk = config.METRIC_STREAM_CHUNK
+    res_json = parse_metric_stream((body[i:i + chunk] for i in range(0, len(body), chunk)), keep=1)
+    devices = res_json.get("spec", {}).get("device", [])
+    return max((float(dev["data"][-1][1]) for dev in devices if dev.get("data")), default=None)
+
+
+def _bench_parser(parse, body, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(body)
+        samples.append(time.perf_counter() - start)
+    tracemalloc.start()
+    parse(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = summarize(samples)
+    result.update({
+        "mb_per_sec": len(body) / 2 ** 20 / (sum(samples) / len(samples)),
+        "peak_alloc_kb": peak / 1024,
+    })
+    return result
+
+
+def bench_parse(devices=8, points=240, repeat=200):
+    """大响应的解析耗时和内存峰值：完整解析与流式解析"""
+    body = metric_payload(devices, points)
+    return {
+        "payload_kb": len(body) / 1024,
+        "full": _bench_parser(parse_latest, body, repeat),
+        "stream": _bench_parser(parse_latest_stream, body, repeat),
+    }
+
+
+def bench_notify(channels=3, messages=30, latency=0.02):
+    """send_all 发送到 channels 个钉钉 Webhook（模拟服务）的延迟"""
+    from notifier import NotificationManager
+
+    with fake_server(1, latency=latency) as (_, webhook):
+        def manager():
+            notif_mgr = NotificationManager()
+            for _ in range(channels):
+                notif_mgr.add_dingtalk_notifier(webhook)
+            return notif_mgr
+
+        sync, enqueue = [], []
+        with quiet():
+            notif_mgr = manager()
+            for i in range(messages):
+                start = time.perf_counter()
+                notif_mgr.send_all(f"bench {i}", "benchmark message")
+                sync.append(time.perf_counter() - start)
+
+            notif_mgr = manager().start_dispatcher(
+                config.NOTIFY_WORKERS, max(config.NOTIFY_QUEUE_SIZE, messages), config.NOTIFY_TIMEOUT
+            )
+            drain_start = time.perf_counter()
+            for i in range(messages):
+                start = time.perf_counter()
+                notif_mgr.send_all(f"bench {i}", "benchmark message")
+                enqueue.append(time.perf_counter() - start)
+            notif_mgr.flush()
+            drain = time.perf_counter() - drain_start
+            notif_mgr.stop()
+    return {
+        "channels": channels,
+        "sync": summarize(sync),
+        "async_enqueue": summarize(enqueue),
+        "async_drain_per_message_ms": drain / messages * 1000,
+    }
+
+
+def bench_rss(jobs=200, duration=60.0, interval=1.0):
+    """多任务引擎持续运行 duration 秒，每 interval 秒记录一次 RSS"""
+    import asyncio
+
+    import engine
+    from notifier import NotificationManager
+
+    workdir = tempfile.mkdtemp(prefix="bench-rss-")
+    fast = dict(
+        CHECK_INTERVAL=1, SCHEDULER_MIN_INTERVAL=1, SCHEDULER_MAX_INTERVAL=2, SCHEDULER_SLOT=0,
+        SCHEDULER_STARTUP_SPREAD=1, METRIC_BATCH_WINDOW=0.2,
+        SAMPLE_STORE_DIR=os.path.join(workdir, "samples"),
+        TOKEN_CACHE_FILE=os.path.join(workdir, "token.json"),
+    )
+    samples = []
+
+    async def run(job_list):
+        monitor_engine = engine.MonitorEngine(job_list, NotificationManager())
+        task = asyncio.create_task(monitor_engine.run())
+        start = time.monotonic()
+        while time.monotonic() - start < duration:
+            samples.append((time.monotonic() - start, rss_mb()))
+            await asyncio.sleep(interval)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    with overrides(**fast), fake_server(jobs, sample_interval=1) as (job_list, _):
+        with quiet():
+            asyncio.run(run(job_list))
+    values = [rss for _, rss in samples if rss is not None]
+    if not values:
+        return {"jobs": jobs, "duration_s": duration, "rss_mb": None}
+    # 跳过启动阶段（前 1/4）后计算增长速率
+    steady = [(t, rss) for t, rss in samples[len(samples) // 4:] if rss is not None]
+    growth = None
+    if len(steady) >= 2 and steady[-1][0] > steady[0][0]:
+        growth = (steady[-1][1] - steady[0][1]) / (steady[-1][0] - steady[0][0]) * 60
+    return {
+        "jobs": jobs,
+        "duration_s": duration,
+        "start_mb": values[0],
+        "end_mb": values[-1],
+        "peak_mb": max(values),
+        "growth_mb_per_min": growth,
+    }
+
+
+# 启动耗时预算（毫秒）：被监督进程重启后应在该时间内恢复轮询
+STARTUP_BUDGET_MS = {
+    "import_ms": 500,          # 导入 engine（含 monitor / notifier / http_client 等）
+    "warm_first_poll_ms": 1500,  # 有缓存 Token 时，从启动进程到完成第一次指标查询
+}
+
+# bench_startup 在新进程中运行的脚本：argv[1] 为 config 覆盖值（JSON），argv[2] 为任务日志
+_STARTUP_DRIVER = r"""
+import json, os, sys, threading, time, types
+start = time.perf_counter()
+import config
+for key, value in json.loads(sys.argv[1]).items():
+    setattr(config, key, value)
+try:
+    import private_config
+except ImportError:  # 模拟服务接受任意账号
+    sys.modules["private_config"] = types.SimpleNamespace(username="bench", password_plain="")
+import monitor
+monitor_done = time.perf_counter()
+import engine
+import_done = time.perf_counter()
+fetch = engine.fetch_metric_batch
+reported = threading.Lock()
+
+def first_poll(*args):
+    # 各指标并发获取，只由第一个完成的请求报告
+    result = fetch(*args)
+    if reported.acquire(blocking=False):
+        print(json.dumps({
+            "import_monitor_ms": (monitor_done - start) * 1000,
+            "import_ms": (import_done - start) * 1000,
+            "smtplib_loaded": "smtplib" in sys.modules,
+        }), flush=True)
+        os._exit(0)
+    return result
+
+engine.fetch_metric_batch = first_poll
+import asyncio
+asyncio.run(engine.MonitorEngine(engine.load_jobs([sys.argv[2]]), monitor.setup_notifications()).run())
+"""
+
+
+def bench_startup(repeat=5):
+    """
+    冷启动耗时：每次启动一个新进程，导入 engine、取得 Token、完成第一次指标查询
+
+    第一次运行没有 Token 缓存（需要登录），之后 repeat 次使用缓存的 Token。
+    首次检查的随机分散、时间槽对齐和批量查询窗口是有意的等待，测量时设为 0。
+    """
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    with fake_server(1) as (job_list, webhook):
+        settings = {
+            "API_BASE": config.API_BASE, "LOGIN_URL": config.LOGIN_URL, "METRIC_URL": config.METRIC_URL,
+            "JOB_LIST_URL": config.JOB_LIST_URL, "DINGTALK_WEBHOOK": webhook, "DINGTALK_SECRET": "",
+            "TOKEN_CACHE_FILE": os.path.join(workdir, "token.json"),
+            "CHECKPOINT_DIR": os.path.join(workdir, "state"), "SAMPLE_STORE_DIR": "", "METRICS_PORT": 0,
+            "SCHEDULER_STARTUP_SPREAD": 0, "SCHEDULER_SLOT": 0, "METRIC_BATCH_WINDOW": 0,
+        }
+        log = f"Successfully assigned 0/{job_list[0].pod_name} to {job_list[0].node_name}"
+        runs = []
+        for _ in range(repeat + 1):
+            start = time.perf_counter()
+            process = subprocess.run(
+                [sys.executable, "-c", _STARTUP_DRIVER, json.dumps(settings), log],
+                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=60,
+            )
+            elapsed = time.perf_counter() - start
+            lines = [line for line in process.stdout.splitlines() if line.startswith("{")]
+            if not lines:
+                raise RuntimeError(f"启动测试进程失败: {process.stderr[-2000:]}")
+            runs.append(dict(json.loads(lines[-1]), first_poll=elapsed))
+    cold, warm = runs[0], runs[1:]
+    result = {
+        "import_monitor_ms": sorted(r["import_monitor_ms"] for r in warm)[len(warm) // 2],
+        "import_ms": sorted(r["import_ms"] for r in warm)[len(warm) // 2],
+        "cold_first_poll_ms": cold["first_poll"] * 1000,
+        "warm_first_poll": summarize([r["first_poll"] for r in warm]),
+        "smtplib_loaded": any(r["smtplib_loaded"] for r in runs),
+    }
+    result["warm_first_poll_ms"] = result["warm_first_poll"]["p50_ms"]
+    result["over_budget"] = [name for name, budget in STARTUP_BUDGET_MS.items() if result[name] > budget]
+    return result
+
+
+def bench_crash(polls=30):
+    """
+    进程退出检测（changepoint.PollWindow + CrashDetector，与 monitor.main 相同）在真实轮询节奏下的表现
+
+    每 CHECK_INTERVAL 秒取一个读数；crash 曲线应在 CRASH_HOLD_SECONDS + 2 个间隔内检出，
+    其他曲线不应检出。
+    """
+    from changepoint import CrashDetector, PollWindow
+    from fake_starlight import Curve
+
+    interval = config.CHECK_INTERVAL
+    at = 10 * interval
+    curves = {
+        "crash": {"type": "crash", "value": 20000, "at": at, "after": 0},
+        "decline": {"type": "steps", "points": [[0, 20000]] + [[at + i * interval, 20000 - i * 2500] for i in range(1, 9)]},
+        "dip": {"type": "steps", "points": [[0, 20000], [at, 0], [at + interval, 20000]]},
+        "low_phase": {"type": "steps", "points": [[0, 20000], [at, 800]]},
+    }
+    detector = CrashDetector()
+    detected = {}
+    costs = []
+    for name, spec in curves.items():
+        curve = Curve(spec)
+        window = PollWindow()
+        detected[name] = None
+        for index in range(polls):
+            ts = index * interval
+            window.add(ts, curve.value(ts))
+            start = time.perf_counter()
+            crashed, _, _ = detector.crashed(window.series())
+            costs.append(time.perf_counter() - start)
+            if crashed:
+                detected[name] = ts - at
+                break
+    budget = config.CRASH_HOLD_SECONDS + 2 * interval
+    over = [] if detected["crash"] is not None and detected["crash"] <= budget else ["crash"]
+    over += [name for name, delay in detected.items() if name != "crash" and delay is not None]
+    return {
+        "interval_s": interval,
+        "crash_detect_s": detected["crash"],
+        "detect_budget_s": budget,
+        "false_positives": [name for name in over if name != "crash"],
+        "evaluate": summarize(costs),
+        "over_budget": over,
+    }
+
+
+def replay_idle(value, drop, phase=0.0, policy=None, window_seconds=None, count_window=False,
+                sample_interval=30, horizon=None):
+    """
+    按监控的轮询节奏回放显存曲线，返回从 drop 到判定闲置（达到 MAX_IDLE_COUNT、发出预警）的秒数
+
+    平台每 sample_interval 秒一个数据点，每次轮询返回上次轮询之后的新数据点；
+    读数接近闲置或计数中时按 SCHEDULER_MIN_INTERVAL 轮询，否则按 CHECK_INTERVAL。
+
+    Args:
+        value: ts -> 显存（MB）
+        drop: 开始闲置的时间
+        phase: 第一次轮询的时间
+        policy / window_seconds: 窗口策略（IdleDetector 参数）；policy 为 None 时只看最新值
+        count_window: 窗口判定闲置后仍需连续 MAX_IDLE_COUNT 次（窗口检测最初的做法）
+        horizon: 回放的最长时间，默认 drop 之后 20 个 CHECK_INTERVAL
+
+    Returns:
+        float 或 None: 检测延迟（秒），未检出为 None；drop 为 None 时返回首次误判的时间
+    """
+    from idle_detect import IdleDetector
+
+    detector = IdleDetector(policy, window_seconds) if policy is not None else None
+    horizon = horizon or (drop or 0) + 20 * config.CHECK_INTERVAL
+    start = drop or 0
+    t, last, counter = phase, -1.0, 0
+    while t <= horizon:
+        points = [(ts, value(ts)) for ts in np.arange((last // sample_interval + 1) * sample_interval, t + 1e-9,
+                                                    sample_interval)]
+        last = t
+        if points:
+            usage = points[-1][1]
+            idle = windowed = None
+            if detector is not None:
+                detector.add("job", "gpu_memory", [("gpu", ts, v) for ts, v in points])
+                idle, _ = detector.evaluate("job")
+                windowed = idle is not None and not count_window
+            if idle is None:
+                idle = usage < config.IDLE_THRESHOLD_MB
+            if idle:
+                counter = max(counter + 1, config.MAX_IDLE_COUNT if windowed else 0)
+            else:
+                counter = 0
+            if counter >= config.MAX_IDLE_COUNT:
+                return t - start
+        near = usage < config.SCHEDULER_NEAR_MB or counter > 0
+        t += config.SCHEDULER_MIN_INTERVAL if near else config.CHECK_INTERVAL
+    return None
+
+
+def bench_idle(phases=24):
+    """
+    窗口闲置检测与只看最新值的检测延迟（第一次轮询相位在一个 CHECK_INTERVAL 内均匀分布）
+
+    before 为最初的窗口配置（300 秒窗口的 90 分位数，再叠加连续计数）；current 为当前 config；
+    current 的最坏延迟不应超过 last_point，单个 0 读数（noise）不应被判定为闲置。
+    """
+    interval = config.CHECK_INTERVAL
+    drop = 20 * interval
+
+    def value(ts):
+        return 0.0 if ts >= drop else 20000.0
+
+    def noise(ts):
+        return 0.0 if ts == drop else 20000.0
+
+    variants = {
+        "last_point": {},
+        "before": {"policy": [{"policy": "percentile", "metric": "gpu_memory",
+                                "threshold": config.IDLE_THRESHOLD_MB, "q": 90}],
+                   "window_seconds": 300, "count_window": True},
+        "current": {"policy": config.IDLE_POLICIES, "window_seconds": config.IDLE_WINDOW_SECONDS},
+    }
+    results = {}
+    for name, kwargs in variants.items():
+        delays = [replay_idle(value, drop, phase=interval * i / phases, **kwargs) for i in range(phases)]
+        false_alarm = [replay_idle(noise, None, phase=interval * i / phases, horizon=drop + 10 * interval,
+                                   **kwargs) for i in range(phases)]
+        results[name] = {
+            "mean_detect_s": round(float(np.mean(delays)), 1),
+            "max_detect_s": round(float(max(delays)), 1),
+            "noise_alarms": sum(delay is not None for delay in false_alarm),
+        }
+    over = []
+    if results["current"]["max_detect_s"] > results["last_point"]["max_detect_s"]:
+        over.append("max_detect_s")
+    if results["current"]["noise_alarms"]:
+        over.append("noise_alarms")
+    return dict(results, over_budget=over)
+
+
+BENCHMARKS = {
+    "poll": bench_poll,
+    "throughput": bench_throughput,
+    "parse": bench_parse,
+    "notify": bench_notify,
+    "rss": bench_rss,
+    "fleet": bench_fleet,
+    "startup": bench_startup,
+    "crash": bench_crash,
+    "idle": bench_idle,
+}
+
+
+def run(names=None, jobs=None, duration=None):
+    """
+    运行基准测试
+
+    Args:
+        names: 要运行的基准名称，默认全部
+        jobs: 覆盖 poll/throughput/rss/fleet 的任务数
+        duration: 覆盖 throughput/rss/fleet 的运行时长（秒）
+
+    Returns:
+        dict: {"meta": 运行环境, "results": {名称: 结果}}
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        kwargs = {}
+        if jobs and name in ("poll", "throughput", "rss", "fleet"):
+            kwargs["jobs"] = jobs
+        if duration and name in ("throughput", "rss", "fleet"):
+            kwargs["duration"] = duration
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = BENCHMARKS[name](**kwargs)
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "commit": _git_commit(),
+        },
+        "results": results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def compare(baseline, current, tolerance=0.2, min_delta=0.05):
+    """
+    比较两次运行的结果
+
+    名称中含 per_sec 的指标和 speedup 越大越好，其余（延迟、内存）越小越好；
+    任务数、样本数、分配数等参数不参与比较，绝对变化小于 min_delta 的视为噪声。
+
+    Returns:
+        list: 退化超过 tolerance 的指标 [(名称, 基准值, 当前值, 变化比例), ...]
+    """
+    base = dict(_flatten(baseline.get("results", baseline)))
+    regressions = []
+    for name, value in _flatten(current.get("results", current)):
+        old = base.get(name)
+        leaf = name.rsplit(".", 1)[-1]
+        if (old is None or not old or leaf in ("jobs", "channels", "count", "duration_s", "payload_kb")
+                or leaf.startswith("owned_")):
+            continue
+        if abs(value - old) < min_delta:
+            continue
+        change = (value - old) / abs(old)
+        worse = -change if "per_sec" in leaf or ".speedup." in name else change
+        if worse > tolerance:
+            regressions.append((name, old, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="监控程序性能基准测试")
+    parser.add_argument("names", nargs="*", help=f"要运行的基准（{', '.join(BENCHMARKS)}），默认全部")
+    parser.add_argument("--jobs", type=int, help="模拟任务数")
+    parser.add_argument("--duration", type=float, help="throughput/rss 的运行时长（秒）")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="比较两次运行的结果")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例（默认 0.2）")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.tolerance)
+        for name, old, new, change in regressions:
+            print(f"❌ {name}: {old:.4g} -> {new:.4g} ({change:+.1%})")
+        if not regressions:
+            print(f"✅ 没有超过 {args.tolerance:.0%} 的退化")
+        sys.exit(1 if regressions else 0)
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的基准: {', '.join(unknown)}")
+    report = run(args.names, args.jobs, args.duration)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+批量关闭任务 - 并发发送 DELETE，再轮询任务状态直到确认全部关闭
+
+维护窗口或错误的代码导致大量任务闲置时，逐个关闭（每个等待确认）太慢。
+这里分两步：
+1. 最多 STOP_CONCURRENCY 个请求并发发送 DELETE
+2. 每 STOP_POLL_INTERVAL 秒并发查询尚未确认的任务，任务已不存在才算关闭成功；
+   DELETE 发送失败的任务在下一轮重发，直到 timeout
+
+只根据查询结果判断，不会把 DELETE 返回 200 但仍在运行的任务当作已关闭。
+
+用法：
+    python bulk_stop.py JOB_ID [JOB_ID ...] [--concurrency 16] [--timeout 20]
+    python bulk_stop.py --config            # 关闭 config.JOB_LOGS 中的全部任务
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import monitor
+import telemetry
+import tracing
+
+# 结果
+STOPPED = "stopped"      # 已确认任务不存在
+RUNNING = "running"      # 超时时任务仍然存在
+UNKNOWN = "unknown"      # 超时时无法查询到任务状态
+FAILED = "failed"        # DELETE 一直发送失败，任务仍然存在或状态未知
+
+
+@tracing.traced("api.bulk_stop")
+def stop_jobs(jobs, concurrency=None, timeout=None):
+    """
+    并发关闭多个任务并确认
+
+    Args:
+        jobs: jobs.Job 列表
+        concurrency: 同时进行的请求数，默认 config.STOP_CONCURRENCY
+        timeout: 等待确认的最长时间（秒），默认 config.STOP_CONFIRM_TIMEOUT
+
+    Returns:
+        dict: {job_id: {"result": 结果, "delete": 最后一次 DELETE 的结果（"sent" / "gone" / None）,
+                        "attempts": DELETE 次数, "seconds": 确认关闭的耗时（未确认为 None）}}
+    """
+    jobs = list({job.job_id: job for job in jobs}.values())
+    concurrency = concurrency or config.STOP_CONCURRENCY
+    if timeout is None:
+        timeout = config.STOP_CONFIRM_TIMEOUT
+    start = time.monotonic()
+    deadline = start + timeout
+    report = {job.job_id: {"result": None, "delete": None, "attempts": 0, "seconds": None} for job in jobs}
+    pending = {job.job_id: job for job in jobs}
+    exists = {}
+
+    def send(job):
+        entry = report[job.job_id]
+        entry["attempts"] += 1
+        entry["delete"] = monitor.delete_job(job, deadline)
+
+    if not jobs:
+        return report
+    print(f"[{time.strftime('%H:%M:%S')}] Stopping {len(jobs)} job(s), concurrency {concurrency}")
+    with ThreadPoolExecutor(min(concurrency, len(jobs)), thread_name_prefix="stop") as pool:
+        list(pool.map(send, jobs))
+        while pending:
+            exists = dict(zip(pending, pool.map(lambda job: monitor.job_exists(job, deadline), pending.values())))
+            for job_id, state in exists.items():
+                if state is False:
+                    report[job_id]["result"] = STOPPED
+                    report[job_id]["seconds"] = round(time.monotonic() - start, 3)
+                    del pending[job_id]
+            if not pending or time.monotonic() + config.STOP_POLL_INTERVAL > deadline:
+                break
+            time.sleep(config.STOP_POLL_INTERVAL)
+            list(pool.map(send, [job for job_id, job in pending.items() if report[job_id]["delete"] is None]))
+
+    for job_id in pending:
+        entry = report[job_id]
+        if entry["delete"] is None:
+            entry["result"] = FAILED
+        else:
+            entry["result"] = RUNNING if exists.get(job_id) else UNKNOWN
+    for entry in report.values():
+        telemetry.SHUTDOWNS.inc("success" if entry["result"] == STOPPED else "failure")
+    return report
+
+
+def print_report(report):
+    """打印每个任务的关闭结果"""
+    for job_id, entry in sorted(report.items()):
+        seconds = f"{entry['seconds']:.1f}s" if entry["seconds"] is not None else "-"
+        print(f"{job_id:<40} {entry['result']:<8} delete={entry['delete'] or 'error'} "
+              f"attempts={entry['attempts']} confirmed={seconds}")
+    counts = {}
+    for entry in report.values():
+        counts[entry["result"]] = counts.get(entry["result"], 0) + 1
+    print(f"Summary: {counts}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from get_token import get_cached_token
+    from jobs import Job, load_jobs
+
+    parser = argparse.ArgumentParser(description="并发关闭多个任务，并确认平台上已不存在")
+    parser.add_argument("job_ids", nargs="*", help=f"任务ID（集群 {config.CLUSTER}）")
+    parser.add_argument("--config", action="store_true", help="关闭 config.JOB_LOGS 中的全部任务")
+    parser.add_argument("--concurrency", type=int, default=None, help="同时进行的请求数，默认 config.STOP_CONCURRENCY")
+    parser.add_argument("--timeout", type=float, default=None, help="等待确认的最长时间（秒），默认 config.STOP_CONFIRM_TIMEOUT")
+    args = parser.parse_args()
+
+    targets = [Job(job_id, None, None) for job_id in args.job_ids]
+    if args.config:
+        targets.extend(load_jobs())
+    if not targets:
+        parser.error("没有要关闭的任务")
+    token = get_cached_token()
+    if not token:
+        print("Can't get bihu-token")
+        sys.exit(1)
+    monitor.update_headers(token)
+    result = stop_jobs(targets, args.concurrency, args.timeout)
+    print_report(result)
+    sys.exit(0 if all(entry["result"] == STOPPED for entry in result.values()) else 1)
@@ -0,0 +1,151 @@
+"""
+进程退出检测 - 在显存序列中寻找“断崖下降后持续低位”的变点
+
+训练进程崩溃或被杀死时，显存会在一个采样间隔内从正常水平降到接近 0，之后保持不变；
+而数据加载、评估等阶段通常是缓慢变化或很快回升。对每个设备的窗口采样：
+
+1. 用两段均值模型找出误差平方和最小的变点 k（前段 [0, k) 至少 2 个采样，后段 [k, n)）
+2. 后段必须全部低于 CRASH_LOW_MB
+3. 置信度 = 下降幅度得分 × 陡峭度得分 × 持续时间得分，各项在 0~1 之间：
+   - 下降幅度：前段均值 - 后段均值，达到 CRASH_MIN_DROP_MB 为 1
+   - 陡峭度：变点前最后一个采样仍接近前段水平为 1（缓慢下降接近 0）
+   - 持续时间：后段持续 CRASH_HOLD_SECONDS 秒为 1
+
+多卡任务取各设备置信度的最小值（进程退出时所有卡同时释放）。
+调大 CRASH_HOLD_SECONDS / CRASH_CONFIDENCE 可以避免误判数据加载等短暂的低显存阶段。
+采样很少（每个设备只有几十个点），不依赖 NumPy。
+
+单任务监控每次轮询只得到一个读数，用 PollWindow 保存：CHECK_INTERVAL 较长时
+IDLE_WINDOW_SECONDS 内只有两三个读数，后段不足以覆盖 CRASH_HOLD_SECONDS，因此窗口
+总是保留 CRASH_HOLD_SECONDS 之前的最后 3 个读数（变点前 2 个 + 第一个低位读数）。
+"""
+from collections import deque
+
+import config
+
+
+def step_down(points, min_drop=None, low=None, hold=None):
+    """
+    检测一个设备的采样中是否有断崖下降并保持低位
+
+    Args:
+        points: [(timestamp, value), ...]，按时间排序
+        min_drop: 下降幅度（MB）达到该值得分为 1，默认 config.CRASH_MIN_DROP_MB
+        low: 下降后的采样都必须低于该值（MB），默认 config.CRASH_LOW_MB
+        hold: 下降后持续该时间（秒）得分为 1，默认 config.CRASH_HOLD_SECONDS
+
+    Returns:
+        dict: confidence / before / after / since（第一个低位采样的时间）/ held（已持续秒数）；
+              没有符合的变点时返回 None
+    """
+    min_drop = config.CRASH_MIN_DROP_MB if min_drop is None else min_drop
+    low = config.CRASH_LOW_MB if low is None else low
+    hold = config.CRASH_HOLD_SECONDS if hold is None else hold
+    n = len(points)
+    if n < 3:
+        return None
+    values = [float(v) for _, v in points]
+
+    # 前缀和：任意区间的均值和误差平方和都是 O(1)
+    total = total_sq = 0.0
+    prefix, prefix_sq = [0.0], [0.0]
+    for v in values:
+        total += v
+        total_sq += v * v
+        prefix.append(total)
+        prefix_sq.append(total_sq)
+
+    def sse(i, j):
+        s = prefix[j] - prefix[i]
+        return prefix_sq[j] - prefix_sq[i] - s * s / (j - i)
+
+    # 前段至少 2 个采样：只剩 1 个高位采样时（缓慢下降的早期采样已滑出窗口）无法判断陡峭度
+    k = min(range(2, n), key=lambda i: sse(0, i) + sse(i, n))
+    tail = values[k:]
+    if max(tail) >= low:
+        return None
+    before = prefix[k] / k
+    after = sum(tail) / len(tail)
+    drop = before - after
+    if drop <= 0:
+        return None
+    drop_score = min(1.0, drop / min_drop) if min_drop > 0 else 1.0
+    sharp_score = min(1.0, max(0.0, (values[k - 1] - after) / drop))
+    held = points[-1][0] - points[k][0]
+    hold_score = min(1.0, held / hold) if hold > 0 else 1.0
+    return {
+        "confidence": round(drop_score * sharp_score * hold_score, 3),
+        "before": before,
+        "after": after,
+        "since": points[k][0],
+        "held": held,
+    }
+
+
+class CrashDetector:
+    """按任务的各设备显存序列判断训练进程是否已退出"""
+
+    def __init__(self, min_drop=None, low=None, hold=None, threshold=None):
+        """
+        Args:
+            min_drop / low / hold: 见 step_down
+            threshold: 置信度达到该值判定为进程退出，默认 config.CRASH_CONFIDENCE
+        """
+        self.min_drop = min_drop
+        self.low = low
+        self.hold = hold
+        self.threshold = config.CRASH_CONFIDENCE if threshold is None else threshold
+
+    def evaluate(self, series):
+        """
+        Args:
+            series: {device: [(timestamp, value), ...]}
+
+        Returns:
+            tuple: (置信度 0~1, 置信度最低的设备的检测结果或 None)
+        """
+        if not series:
+            return 0.0, None
+        worst = None
+        for points in series.values():
+            result = step_down(points, self.min_drop, self.low, self.hold)
+            if result is None:
+                return 0.0, None
+            if worst is None or result["confidence"] < worst["confidence"]:
+                worst = result
+        return worst["confidence"], worst
+
+    def crashed(self, series):
+        """
+        Returns:
+            tuple: (是否判定为进程退出, 置信度, 检测结果)
+        """
+        confidence, result = self.evaluate(series)
+        return confidence >= self.threshold, confidence, result
+
+
+class PollWindow:
+    """每次轮询一个读数的检测窗口（单任务监控使用）"""
+
+    def __init__(self, window_seconds=None, hold=None):
+        """
+        Args:
+            window_seconds: 按时间保留的长度（秒），默认 config.IDLE_WINDOW_SECONDS
+            hold: 见 step_down，默认 config.CRASH_HOLD_SECONDS
+        """
+        self.window_seconds = window_seconds or config.IDLE_WINDOW_SECONDS
+        self.hold = config.CRASH_HOLD_SECONDS if hold is None else hold
+        self.samples = deque()
+
+    def add(self, timestamp, value):
+        self.samples.append((timestamp, value))
+        cutoff = timestamp - self.window_seconds
+        held_since = timestamp - self.hold
+        # 删除最旧的读数后，held_since 之前仍有 3 个读数才删除
+        while (len(self.samples) > 3 and self.samples[0][0] < cutoff
+               and self.samples[3][0] <= held_since):
+            self.samples.popleft()
+
+    def series(self):
+        """CrashDetector.evaluate 的参数"""
+        return {"gpu": list(self.samples)}
@@ -0,0 +1,107 @@
+"""
+监控状态检查点 - 每个任务的闲置计数、排队/运行状态和关闭倒计时保存到本地，重启后继续
+
+- 每个任务一个 JSON 文件（CHECKPOINT_DIR/<job_id>.json），状态变化后写临时文件再替换，
+  进程在任何时刻崩溃都不会留下写了一半的文件
+- 状态没有变化时不重复写，但每隔 CHECKPOINT_MAX_AGE / 2 秒刷新一次保存时间
+- 超过 CHECKPOINT_MAX_AGE 秒未更新的检查点视为过期（停机期间任务状态可能已变化），直接丢弃
+- 倒计时开始时间保存为 UNIX 时间，恢复时换算回 time.monotonic()
+"""
+import json
+import os
+import re
+import threading
+import time
+
+import config
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class CheckpointStore:
+    """按任务保存的检查点"""
+
+    def __init__(self, directory=None, max_age=None):
+        """
+        Args:
+            directory: 检查点目录，默认 config.CHECKPOINT_DIR
+            max_age: 检查点有效期（秒），默认 config.CHECKPOINT_MAX_AGE
+        """
+        self.directory = directory or config.CHECKPOINT_DIR
+        self.max_age = config.CHECKPOINT_MAX_AGE if max_age is None else max_age
+        self.writes = 0
+        self._saved = {}  # job_id -> (上次写入的状态, 写入时间)
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{_UNSAFE.sub('_', str(job_id))}.json")
+
+    def load(self, job_id):
+        """
+        读取任务的检查点
+
+        Returns:
+            dict: 保存的状态；不存在、损坏或过期返回 None
+        """
+        try:
+            with open(self._path(job_id), encoding="utf-8") as f:
+                record = json.load(f)
+            saved_at, state = record["saved_at"], record["state"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        age = time.time() - saved_at
+        if record.get("job_id") != str(job_id) or not 0 <= age <= self.max_age:
+            print(f"Discard stale checkpoint of job {job_id} ({age:.0f}s old)")
+            self.discard(job_id)
+            return None
+        with self._lock:
+            self._saved[str(job_id)] = (state, saved_at)
+        return state
+
+    def save(self, job_id, state):
+        """
+        保存任务状态；与上次保存的相同且未接近过期时跳过
+
+        Args:
+            job_id: 任务ID
+            state: 要保存的字段（需可 JSON 序列化）
+        """
+        job_id = str(job_id)
+        with self._lock:
+            now = time.time()
+            previous = self._saved.get(job_id)
+            if previous is not None and previous[0] == state and now - previous[1] < self.max_age / 2:
+                return
+            path = self._path(job_id)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"job_id": job_id, "saved_at": now, "state": state}, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            self._saved[job_id] = (dict(state), now)
+            self.writes += 1
+
+    def discard(self, job_id):
+        """删除任务的检查点（任务已关闭或已结束）"""
+        with self._lock:
+            self._saved.pop(str(job_id), None)
+            try:
+                os.remove(self._path(job_id))
+            except OSError:
+                pass
+
+
+def wall_time(monotonic_time):
+    """time.monotonic() 时间换算为 UNIX 时间（取整到秒，便于判断状态是否变化）"""
+    if monotonic_time is None:
+        return None
+    return round(time.time() - (time.monotonic() - monotonic_time))
+
+
+def monotonic_time(wall):
+    """保存的 UNIX 时间换算为当前进程的 time.monotonic() 时间"""
+    if wall is None:
+        return None
+    return time.monotonic() - (time.time() - wall)
@@ -1,7 +1,13 @@
+import os
 import re
 
 log = "0001-01-01 00:00:00 +0000 UTC	Normal	Scheduled	Successfully assigned 13957/dengkn-7kgf5 to an21"
 
+# 多任务监控（engine.py）：每个任务一行 "Successfully assigned ..." 日志
+JOB_LOGS = [
+    log,
+]
+
 # ==================== 配置区 ====================
 # 1. 基础信息
 CLUSTER = "k8s_xingyiAI"
@@ -20,15 +26,142 @@ else:
 
 # 2. 监控判定参数
 IDLE_THRESHOLD_MB = 3  # 显存占用低于 3MB 认为闲置
+IDLE_UTIL_PERCENT = 5  # GPU 利用率（%）低于该值认为没有计算（显存未释放的卡死任务），见 IDLE_POLICIES
+# 每次轮询并发获取的指标（同一个 METRIC_URL，每个指标一次请求），合并为一个快照交给闲置判断；
+# IDLE_POLICIES 用到的指标会自动加入。确认平台的指标名称后可以加入 GPU 利用率、CPU / 内存指标
+POLL_METRICS = ["gpu_memory"]
 MAX_IDLE_COUNT = 1      # 连续闲置次数达到该值则触发关闭
 CHECK_INTERVAL = 120      # 检查间隔（秒）
+# 窗口闲置检测（idle_detect.py）：用最近 IDLE_WINDOW_SECONDS 秒内的全部采样判断闲置，
+# 窗口判定闲置时不再叠加 MAX_IDLE_COUNT 的连续计数。默认窗口为一个检查间隔、取中位数：
+# 一半采样低于阈值即判定闲置，最坏检测延迟不超过只看最新值时的一个检查间隔（python benchmark.py idle）
+IDLE_WINDOW_SECONDS = CHECK_INTERVAL  # 窗口长度（秒）
+IDLE_MIN_SAMPLES = 3      # 每个设备至少需要的采样数，不足时按最新值判断
+# 闲置策略：max / mean / percentile(q) / fraction(fraction)；列表表示同时满足，{"any": [...]} 表示满足其一
+IDLE_POLICIES = [
+    {"policy": "percentile", "metric": "gpu_memory", "threshold": IDLE_THRESHOLD_MB, "q": 50},
+]
+# 显存未释放但 GPU 利用率在 90% 的时间内低于 IDLE_UTIL_PERCENT 也视为闲置（数据加载卡死、死锁），
+# 需要平台提供 gpu_util 指标：
+# IDLE_POLICIES = {"any": [
+#     {"policy": "percentile", "metric": "gpu_memory", "threshold": IDLE_THRESHOLD_MB, "q": 50},
+#     {"policy": "fraction", "metric": "gpu_util", "threshold": IDLE_UTIL_PERCENT, "fraction": 0.9},
+# ]}
+QUEUED_CHECK_INTERVAL = 120  # 排队状态检查间隔（秒）
+SHUTDOWN_GRACE = 120      # 发出即将关闭通知后等待多久再关闭（秒）
+# 进程退出检测（changepoint.py）：显存断崖下降后持续低位，视为训练进程已退出，跳过闲置计数提前关闭
+CRASH_DETECT = True       # False 时只使用闲置计数
+CRASH_MIN_DROP_MB = 1000  # 下降幅度（MB）达到该值视为断崖下降
+CRASH_LOW_MB = IDLE_THRESHOLD_MB  # 下降后的采样都必须低于该值（MB）
+CRASH_HOLD_SECONDS = 60   # 下降后保持低位多久（秒）才有完整置信度；数据加载阶段较长时调大
+CRASH_CONFIDENCE = 0.9    # 置信度（0~1）达到该值判定为进程退出
+CRASH_SHUTDOWN_GRACE = 60  # 判定为进程退出后发出通知到关闭的等待时间（秒），代替 SHUTDOWN_GRACE
+MAX_FAIL_COUNT = 2        # 连续永久性错误（任务不存在等 4xx / API 错误码）的最大次数，超过则停止监控
+RETRY_BASE_DELAY = 2      # 获取数据失败后的首次重试间隔（秒），之后指数增长并加随机抖动
+RETRY_INTERVAL = 120      # 获取数据失败后的最长重试间隔（秒）
+MAX_OUTAGE = 6 * 3600     # 网络错误、5xx、熔断等临时故障持续超过该时间（秒）才停止监控
+STOP_CONFIRM_TIMEOUT = 20  # 发送关闭请求后等待平台确认任务已不存在的最长时间（秒）；引擎等待一次关闭的超时为该值加上两次请求的最长耗时
+STOP_POLL_INTERVAL = 1    # 确认关闭时查询任务状态的间隔（秒）
+STOP_CONCURRENCY = 16     # 批量关闭（bulk_stop.py）同时发送的请求数
+
+# 自适应轮询（scheduler.py，多任务引擎使用）
+SCHEDULER_MIN_INTERVAL = 30   # 显存接近阈值或关闭倒计时中的检查间隔（秒）
+SCHEDULER_MAX_INTERVAL = 360  # 持续繁忙任务的最长检查间隔（秒）
+SCHEDULER_NEAR_MB = 1024      # 显存低于该值（MB）视为接近闲置，使用最短间隔
+SCHEDULER_BACKOFF = 1.5       # 排队/繁忙任务每次检查后间隔的增长倍数
+SCHEDULER_JITTER = 0.1        # 间隔随机抖动比例
+SCHEDULER_SLOT = 10           # 唤醒时间对齐的时间槽（秒），同一时间槽的查询合并为一次请求
+SCHEDULER_STARTUP_SPREAD = 10  # 启动时把各任务的首次检查随机分散到该时间内（秒）
+QUEUED_MAX_INTERVAL = 600     # 排队任务的最长检查间隔（秒）
+
+# 任务自动发现（python engine.py --discover）
+AUTO_DISCOVER = False     # 自动监控账号在 CLUSTER 上的所有运行中/排队任务
+DISCOVERY_INTERVAL = 120  # 列出任务的间隔（秒）
+
+# 分片监控（fleet.py / python engine.py --fleet）：多个进程或多台机器通过共享目录中的租约分配任务
+FLEET_DIR = "fleet"       # 租约目录，多台机器需使用同一个共享目录（NFS 等，需支持硬链接）
+FLEET_WORKER_ID = ""      # 本进程的名称，留空则使用 "主机名-进程号"
+FLEET_WORKERS = 4         # fleet.py 在本机启动的监控进程数
+FLEET_LEASE_TTL = 60      # 租约有效期（秒），监控进程退出后最多经过该时间由其他进程接管
+FLEET_SYNC_INTERVAL = 15  # 续约和重新分配任务的间隔（秒），应明显小于 FLEET_LEASE_TTL
+FLEET_RENEW_MARGIN = 5    # 租约离过期不足该时间（秒，含各机器的时钟误差）时按接管流程续约，否则原地替换
+
+# 多任务引擎参数
+ENGINE_MAX_WORKERS = 64   # 执行阻塞 API 调用的线程数上限
+API_CALL_TIMEOUT = 30     # 单次 API 调用（含通知）在引擎中的最长等待时间（秒）
+METRIC_BATCH_SIZE = 20    # 一次显存查询最多包含的 Pod 数（超过则分批请求）
+METRIC_BATCH_WINDOW = 1.0  # 合并各任务显存查询的时间窗口（秒）
+METRIC_WINDOW_MINUTES = 60  # 完整查询窗口（分钟）：刚启动或中断过久时使用
+METRIC_STREAMING = True   # 分块解析指标响应，每个设备只保留最新的数据点（False 时使用 response.json()）
+METRIC_STREAM_CHUNK = 64 * 1024  # 分块读取响应的块大小（字节）
+METRIC_CACHE_TTL = 10     # 节点级指标缓存（metric_cache.py）的时间桶长度（秒），同一节点的任务在桶内共用一次查询；0 表示不缓存
+METRIC_CACHE_SIZE = 4096  # 缓存条目（节点 x 指标）数上限
 
 # 3. API 地址
-METRIC_URL = "https://starlight.nscc-gz.cn/api/monitor/metric"
-JOB_STATUS_URL = f"https://starlight.nscc-gz.cn/api/job/running/{CLUSTER}/{JOB_ID}"
-DELETE_URL = f"https://starlight.nscc-gz.cn/api/job/running/{CLUSTER}/{JOB_ID}"
+# 可通过环境变量 STARLIGHT_API_BASE 指向本地模拟服务（fake_starlight.py）
+API_BASE = os.environ.get("STARLIGHT_API_BASE", "https://starlight.nscc-gz.cn/api")
+LOGIN_URL = f"{API_BASE}/keystone/short_term_token/name"
+METRIC_URL = f"{API_BASE}/monitor/metric"
+JOB_LIST_URL = f"{API_BASE}/job/running"  # 任务列表：{JOB_LIST_URL}/{CLUSTER}
+JOB_STATUS_URL = f"{API_BASE}/job/running/{CLUSTER}/{JOB_ID}"
+DELETE_URL = f"{API_BASE}/job/running/{CLUSTER}/{JOB_ID}"
+
+# HTTP 连接池（所有 Starlight API 调用共用）
+HTTP_POOL_SIZE = 32       # 每个主机保持的 keep-alive 连接数，多任务时建议不小于 ENGINE_MAX_WORKERS 的一半
+HTTP_CONNECT_TIMEOUT = 5  # 建立连接（含 TLS 握手）超时（秒）
+HTTP_READ_TIMEOUT = 15    # 等待响应超时（秒）
+HTTP_MAX_RETRIES = 3      # 幂等请求遇到网络错误（SSL EOF 等）或 5xx/429 时的快速重试次数
+HTTP_RETRY_BASE = 0.5     # 快速重试的初始退避时间（秒），每次翻倍并加随机抖动
+HTTP_RETRY_MAX_DELAY = 8  # 快速重试的最长退避时间（秒）
+BREAKER_THRESHOLD = 5     # 连续多少次网络错误/5xx 后熔断（暂停所有请求）
+BREAKER_COOLDOWN = 10     # 熔断后多久放行一个探测请求（秒），探测失败则翻倍
+BREAKER_MAX_COOLDOWN = 300  # 熔断等待时间上限（秒）
+
+# 监控程序自身的运行指标（telemetry.py），Prometheus 格式：http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_PORT = 0          # 0 表示不开启，例如 9108
+METRICS_HOST = "127.0.0.1"  # 需要被其他机器抓取时改为 "0.0.0.0"
+
+# 追踪与性能采样（tracing.py）
+TRACE_FILE = ""           # 各阶段耗时写入的 JSON lines 文件，例如 "trace.jsonl"；留空不追踪
+PROFILE_TRIGGER_FILE = "profile.trigger"  # 在工作目录创建该文件（或发送 SIGUSR1）开始采样，内容可写采样秒数
+PROFILE_SECONDS = 30      # 默认采样时长（秒）
+PROFILE_INTERVAL = 0.01   # 采样间隔（秒）
+PROFILE_DIR = "profiles"  # 采样结果目录
+
+# GPU 采样存储（sample_store.py），留空则不保存
+SAMPLE_STORE_DIR = "samples"  # 存储目录
+SAMPLE_RETENTION_DAYS = 7  # 采样保留天数
+SAMPLE_COMPACT_INTERVAL = 3600  # 清理过期采样的间隔（秒）
+
+# Token 缓存
+TOKEN_CACHE_FILE = ".bihu_token.json"  # 本地缓存文件（权限 0600）
+TOKEN_TTL = 6 * 3600      # 无法从 Token 解析过期时间时假定的有效期（秒）
+TOKEN_REFRESH_MARGIN = 600  # 距离过期不足该时间（秒）时提前刷新
+TOKEN_REFRESH_RETRY = 60  # 多任务引擎主动刷新失败（仍使用旧 Token）后的重试间隔（秒）
+
+# 监控状态检查点（checkpoint.py），重启后恢复闲置计数、排队状态和关闭倒计时；留空则不保存
+CHECKPOINT_DIR = "state"  # 检查点目录
+CHECKPOINT_MAX_AGE = 1800  # 超过该时间（秒）未更新的检查点视为过期
 
 # 4. 通知配置（可选 - 留空则不发送通知）
+NOTIFY_ASYNC = True       # 后台线程发送通知，不阻塞监控循环
+NOTIFY_WORKERS = 2        # 通知发送线程数
+NOTIFY_QUEUE_SIZE = 100   # 通知队列长度上限
+NOTIFY_TIMEOUT = 15       # 通知队列已满时最多等待的时间（秒），之后在当前线程直接发送
+NOTIFY_COALESCE_WINDOW = 10  # 合并窗口（秒）：窗口内的通知合并为一条摘要，0 表示不合并
+NOTIFY_RATE_LIMITS = {    # 各通知方式每分钟最多发送的消息数
+    "钉钉": 20,
+    "Server酱": 5,
+    "邮件": 10,
+}
+NOTIFY_DIGEST_MAX_CHARS = {  # 各通知方式一条摘要的最大字符数，超过时拆成多条发送
+    "钉钉": 4000,
+    "Server酱": 4000,
+    "邮件": 20000,
+}
+NOTIFY_DIGEST_MAX_ENTRIES = 20  # 一条摘要最多合并的通知数
+NOTIFY_MAX_ATTEMPTS = 3   # 每条通知最多尝试发送的次数，发送失败时放回队列稍后重试
+
 # ============== 邮件通知配置 ==============
 ENABLE_EMAIL = False
 SMTP_SERVER = "smtp.qq.com"  # SMTP服务器
@@ -36,6 +169,7 @@ SMTP_PORT = 465  # SMTP端口
 SENDER_EMAIL = ""  # 发件人邮箱
 SENDER_PASSWORD = ""  # 邮箱密码或授权码
 RECEIVER_EMAIL = ""  # 收件人邮箱
+SMTP_IDLE_TIMEOUT = 60  # SMTP 连接空闲多少秒后关闭（期间的邮件复用同一连接）
 
 # ============== Server酱(微信)通知配置 ==============
 ENABLE_SERVERCHAN = False
@@ -0,0 +1,138 @@
+"""
+任务自动发现 - 定期列出当前账号在 CLUSTER 上的运行中/排队任务
+
+一次列表请求同时给出所有任务的状态，与已知任务集合比较，
+得到新增的任务和已经结束（不在列表中）的任务。
+"""
+import requests
+
+import config
+import monitor
+from http_client import get_client
+from jobs import Job
+
+# 列表条目中可能的字段名
+JOB_ID_KEYS = ("job_name", "job_id", "name", "id")
+POD_KEYS = ("pod_name", "pod", "podName")
+NODE_KEYS = ("node_name", "node", "nodeName", "host", "host_name")
+STATUS_KEYS = ("status", "state")
+
+
+def _first(entry, keys):
+    for key in keys:
+        value = entry.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _entries(spec):
+    """从 spec 中取出任务列表（兼容直接返回列表或 {"items": [...]} 等结构）"""
+    if isinstance(spec, list):
+        return spec
+    if isinstance(spec, dict):
+        for key in ("items", "list", "jobs", "data", "records"):
+            if isinstance(spec.get(key), list):
+                return spec[key]
+    return []
+
+
+def parse_job(entry, cluster):
+    """
+    把列表条目转换为任务
+
+    Returns:
+        tuple: (Job 或 None, 状态)；缺少 Pod/节点信息时 Job 为 None
+    """
+    job_id = _first(entry, JOB_ID_KEYS)
+    pod = _first(entry, POD_KEYS)
+    node = _first(entry, NODE_KEYS)
+    pods = entry.get("pods")
+    if isinstance(pods, list) and pods and isinstance(pods[0], dict):
+        pod = pod or _first(pods[0], POD_KEYS + ("name",))
+        node = node or _first(pods[0], NODE_KEYS)
+    status = _first(entry, STATUS_KEYS)
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        pass
+    if not job_id:
+        return None, status
+    if not pod or not node:
+        return Job(str(job_id), None, None, cluster), status
+    return Job(str(job_id), str(pod), str(node), cluster), status
+
+
+def list_jobs(cluster=None):
+    """
+    获取当前账号的运行中/排队任务
+
+    Returns:
+        dict: {job_id: (Job, 状态)}；请求失败返回 None
+    """
+    cluster = cluster or config.CLUSTER
+    url = f"{config.JOB_LIST_URL}/{cluster}"
+    try:
+        response = get_client().get(url, headers=monitor.HEADERS, verify=False)
+        res_json = response.json()
+        if "code" in res_json and res_json.get("code") != 200:
+            get_client().note_api_error(url, res_json.get("code"))
+            print(f"Job list API error: {res_json.get('info')}")
+            return None
+        jobs = {}
+        for entry in _entries(res_json.get("spec")):
+            if isinstance(entry, dict):
+                job, status = parse_job(entry, cluster)
+                if job is not None:
+                    jobs[job.job_id] = (job, status)
+        return jobs
+
+    except requests.exceptions.SSLError as e:
+        print(f"❌ SSL连接错误: {e}")
+        return None
+
+    except Exception as e:
+        print(f"Request job list exception: {e}")
+        return None
+
+
+class JobDiscovery:
+    """增量任务发现：与上一次列表比较，得到新增和结束的任务"""
+
+    def __init__(self, cluster=None):
+        """
+        Args:
+            cluster: 集群名称，默认 config.CLUSTER
+        """
+        self.cluster = cluster or config.CLUSTER
+        self.known = {}
+        self.statuses = {}
+        self._skipped = set()
+
+    def poll(self):
+        """
+        列出任务并与已知集合比较
+
+        Returns:
+            tuple: (新增的 Job 列表, 已结束的 job_id 列表)；请求失败返回 None
+        """
+        listed = list_jobs(self.cluster)
+        if listed is None:
+            return None
+        self.statuses = {job_id: status for job_id, (_, status) in listed.items()}
+        added = []
+        for job_id, (job, _) in listed.items():
+            if job_id in self.known:
+                continue
+            if job.pod_name is None:
+                if job_id not in self._skipped:
+                    print(f"⚠️ 任务 {job_id} 缺少 Pod/节点信息，暂不监控")
+                    self._skipped.add(job_id)
+                continue
+            self.known[job_id] = job
+            added.append(job)
+        removed = [job_id for job_id in self.known if job_id not in listed]
+        for job_id in removed:
+            del self.known[job_id]
+        self._skipped &= set(listed)
+        return added, removed
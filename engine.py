@@ -0,0 +1,709 @@
+"""
+多任务监控引擎 - 在一个事件循环中同时监控多个任务
+
+每个任务有独立的闲置计数、排队/运行状态机和关闭流程；
+阻塞的 API 调用放到线程池执行并设置超时，单个任务卡住不会拖慢其他任务。
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import config
+import monitor
+import resilience
+import telemetry
+import tracing
+from changepoint import CrashDetector
+from checkpoint import CheckpointStore, monotonic_time, wall_time
+from discovery import JobDiscovery
+from fleet import Fleet
+from get_token import get_cached_token, token_refresh_at
+from http_client import get_client
+from jobs import load_jobs
+from idle_detect import IdleDetector
+from metric_cache import MetricCache
+from metrics import fetch_metric_batch, watermarks
+from sample_store import SampleStore
+from scheduler import AdaptiveScheduler
+
+# 任务状态（spec.status）
+STATUS_QUEUED = 0
+STATUS_RUNNING = 2
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class JobWatcher:
+    """单个任务的监控状态机"""
+
+    def __init__(self, engine, job):
+        """
+        初始化任务监控
+
+        Args:
+            engine: 所属的 MonitorEngine
+            job: 要监控的 jobs.Job
+        """
+        self.engine = engine
+        self.job = job
+        self.idle_counter = 0
+        self.last_status = None
+        self.stopped = False
+        self.usage = None
+        self.warned_at = None
+        self.grace = config.SHUTDOWN_GRACE
+        self.crash_confidence = 0.0
+        self.crash = None
+        self.resumed = False
+        self.retry = resilience.RetryState()
+
+    def log(self, text):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] [{self.job.job_id}] {text}")
+
+    def restore(self):
+        """从检查点恢复闲置计数、排队状态和关闭倒计时"""
+        if self.engine.checkpoints is None:
+            return
+        state = self.engine.checkpoints.load(self.job.job_id)
+        if not state:
+            return
+        self.idle_counter = state.get("idle_counter", 0)
+        self.last_status = state.get("last_status")
+        self.warned_at = monotonic_time(state.get("warned_at"))
+        self.grace = state.get("grace", config.SHUTDOWN_GRACE)
+        self.resumed = self.last_status == STATUS_RUNNING
+        self.log(f"Resumed from checkpoint: status {self.last_status} | "
+                 f"Counter: {self.idle_counter}/{config.MAX_IDLE_COUNT}")
+
+    async def checkpoint(self):
+        """保存当前状态（在线程池中写文件，不阻塞事件循环）"""
+        if self.engine.checkpoints is None:
+            return
+        await self.engine.call(self.engine.checkpoints.save, self.job.job_id, {
+            "idle_counter": self.idle_counter,
+            "last_status": self.last_status,
+            "warned_at": wall_time(self.warned_at),
+            "grace": self.grace,
+        })
+
+    async def run(self):
+        """等待任务开始运行，然后进行闲置检测"""
+        self.restore()
+        if self.resumed:
+            # 重启前已在运行：跳过排队检查和启动通知，直接继续闲置检测
+            await self.watch_usage()
+            return
+        await asyncio.sleep(self.engine.scheduler.initial_delay())
+        if not await self.wait_until_running():
+            return
+        await self.notify(
+            "🚀 GPU自动关闭监控已启动",
+            f"任务ID: {self.job.job_id}\n"
+            f"节点: {self.job.node_name}\n"
+            f"Pod: {self.job.pod_name}\n"
+            f"闲置阈值: GPU显存 < {config.IDLE_THRESHOLD_MB}MB\n"
+            f"触发条件: 连续闲置{config.MAX_IDLE_COUNT}次（约{config.MAX_IDLE_COUNT * config.CHECK_INTERVAL // 60}分钟）\n"
+            f"检查间隔: {config.CHECK_INTERVAL}秒\n"
+            f"启动时间: {_now()}"
+        )
+        await self.watch_usage()
+
+    async def wait_until_running(self):
+        """
+        排队状态机：排队中定期检查，直到任务进入运行状态
+
+        Returns:
+            bool: 任务进入运行状态返回 True，无法获取状态则返回 False
+        """
+        while True:
+            status = await self.engine.job_status(self.job)
+            if status is None:
+                if not await self.engine.recover(self, self.job.status_url):
+                    return False
+                continue
+            self.retry.success()
+
+            if self.last_status == STATUS_QUEUED and status == STATUS_RUNNING:  # 任务开始运行
+                await self.notify(
+                    "✅ 作业排队完成，",
+                    f"任务ID: {self.job.job_id}\n"
+                    f"节点: {self.job.node_name}\n"
+                    f"Pod: {self.job.pod_name}\n"
+                    f"时间: {_now()}"
+                )
+                self.last_status = status
+                await self.checkpoint()
+                return True
+            elif self.last_status is None and status == STATUS_RUNNING:  # 一开始就是运行中
+                self.last_status = status
+                await self.checkpoint()
+                return True
+            elif self.last_status is None and status == STATUS_QUEUED:
+                await self.notify(
+                    "✅ 作业正在排队",
+                    f"任务ID: {self.job.job_id}\n"
+                    f"节点: {self.job.node_name}\n"
+                    f"Pod: {self.job.pod_name}\n"
+                    f"时间: {_now()}"
+                )
+            self.last_status = status
+            await self.checkpoint()
+            await asyncio.sleep(self.engine.scheduler.queued_delay(self.job.job_id))
+
+    async def watch_usage(self):
+        """闲置检测：连续闲置达到阈值后发出预警，倒计时结束仍闲置则关闭任务"""
+        if self.engine.metric_cache is not None:
+            # 同一节点上其他任务的查询会一并获取本任务的数据
+            self.engine.metric_cache.register([self.job])
+        while not self.stopped:
+            with tracing.span("engine.poll", job=self.job.job_id):
+                snapshot = await self.engine.batcher.get(self.job)
+                if snapshot.get("gpu_memory") is not None:
+                    await self.on_snapshot(snapshot)
+            if snapshot.get("gpu_memory") is None:
+                self.usage = None
+                if not await self.engine.recover(self, config.METRIC_URL, "gpu_memory"):
+                    return
+                continue  # 已按退避时间等待过
+            self.retry.success()
+            if self.stopped:
+                return
+            await asyncio.sleep(self.engine.scheduler.running_delay(
+                self.job.job_id, self.usage, urgent=self.idle_counter > 0
+            ))
+
+    async def on_snapshot(self, snapshot):
+        """
+        用本次获取的所有采样更新窗口并判断是否闲置
+
+        Args:
+            snapshot: {metric: {"latest": 最新值, "points": 新采样}}
+        """
+        detector = self.engine.detector
+        for metric, reading in snapshot.items():
+            if reading is not None:
+                detector.add(self.job.job_id, metric, reading["points"])
+        usage = snapshot["gpu_memory"]["latest"]
+        idle, _ = detector.evaluate(self.job.job_id)
+        windowed = idle is not None
+        if idle is None:
+            # 所有策略都没有足够的采样时才按最新值判断
+            idle = usage < config.IDLE_THRESHOLD_MB
+        if self.engine.crash_detector is not None:
+            crashed, confidence, result = self.engine.crash_detector.crashed(detector.series(self.job.job_id))
+            if crashed:
+                self.crash = result
+            elif usage >= config.CRASH_LOW_MB:
+                # 判定为进程退出后保持该判定，直到显存重新升高（变点滑出窗口后不会再检出）
+                self.crash = None
+            if self.crash is not None:
+                idle = True
+            elif confidence > 0 and confidence != self.crash_confidence:
+                self.log(f"Possible process exit: GPU memory {result['before']:.0f} -> {result['after']:.0f} MB "
+                         f"for {result['held']:.0f}s (confidence {confidence:.2f})")
+            self.crash_confidence = confidence
+        util = snapshot.get("gpu_util")
+        if idle and self.crash is None and usage >= config.IDLE_THRESHOLD_MB and util is not None:
+            self.log(f"GPU memory held ({usage} MB) but GPU utilization is idle ({util['latest']:.0f}%)")
+        await self.on_usage(usage, idle, self.crash, windowed)
+
+    async def on_usage(self, usage, idle=None, crash=None, windowed=False):
+        """
+        根据一次显存读数（及窗口判断结果）更新闲置计数
+
+        连续闲置达到 MAX_IDLE_COUNT 时发出预警并开始 SHUTDOWN_GRACE 倒计时；
+        倒计时期间继续检查（间隔更短），恢复使用则取消，倒计时结束仍闲置则关闭任务。
+        窗口策略判定闲置（windowed）时窗口本身已覆盖连续的采样，不再叠加连续计数；
+        判定为进程退出（crash 为 changepoint.step_down 的结果）时同样跳过剩余计数，
+        倒计时缩短为 CRASH_SHUTDOWN_GRACE。
+        """
+        self.usage = usage
+        if idle is None:
+            idle = usage < config.IDLE_THRESHOLD_MB
+        if idle:
+            if (crash is not None or windowed) and self.idle_counter < config.MAX_IDLE_COUNT - 1:
+                self.idle_counter = config.MAX_IDLE_COUNT - 1
+            self.idle_counter += 1
+            self.log(f"Status: Idle ({usage} MB) | Counter: {self.idle_counter}/{config.MAX_IDLE_COUNT}")
+        else:
+            if self.idle_counter > 0:
+                self.log(f"Status: Active ({usage} MB) | Counter reset to 0")
+            self.idle_counter = 0
+            self.warned_at = None
+            self.grace = config.SHUTDOWN_GRACE
+        telemetry.GPU_MEMORY.set(self.job.job_id, value=usage)
+        telemetry.IDLE_COUNTER.set(self.job.job_id, value=self.idle_counter)
+
+        if self.idle_counter == config.MAX_IDLE_COUNT:
+            if crash is not None:
+                self.grace = config.CRASH_SHUTDOWN_GRACE
+                reason = (f"显存从 {crash['before']:.0f} MB 骤降至 {crash['after']:.0f} MB 并保持 "
+                          f"{crash['held']:.0f}s，训练进程可能已退出（置信度 {crash['confidence']:.2f}）")
+            else:
+                self.grace = config.SHUTDOWN_GRACE
+                reason = f"GPU连续闲置{config.MAX_IDLE_COUNT}次"
+            await self.notify(
+                "⚠️ GPU任务即将自动关闭",
+                f"任务ID: {self.job.job_id}\n"
+                f"节点: {self.job.node_name}\n"
+                f"原因: {reason}\n"
+                f"当前显存: {usage} MB\n"
+                f"触发时间: {_now()}\n"
+                f"{self.grace // 60}min后将会自动关闭任务，请及时检查bug"
+            )
+            self.warned_at = time.monotonic()
+        elif self.idle_counter > config.MAX_IDLE_COUNT:
+            if crash is not None and self.grace > config.CRASH_SHUTDOWN_GRACE:
+                self.log(f"Process exit detected (confidence {crash['confidence']:.2f}), shorten countdown")
+                self.grace = config.CRASH_SHUTDOWN_GRACE
+            remaining = self.grace - (time.monotonic() - (self.warned_at or 0))
+            if remaining <= 0:
+                await self.shutdown()
+                return
+            self.log(f"Shutdown in {remaining:.0f}s unless GPU becomes active")
+        await self.checkpoint()
+
+    async def shutdown(self):
+        """关闭任务并发送结果通知"""
+        fleet = self.engine.fleet
+        if fleet is not None and not await self.engine.call(fleet.renew, self.job.job_id):
+            # 租约已被其他进程接管，由新的监控者决定是否关闭
+            self.log("Lease lost, skip shutdown")
+            await self.engine.stop_watcher(self.job.job_id, finished=False)
+            return
+        job_id = self.job.job_id
+        if job_id in self.engine._stopping:
+            self.log("Shutdown already in progress")
+            return
+        self.engine._stopping.add(job_id)
+        stopped = await self.engine.call(self.engine.stop_job, self.job, timeout=self.engine.stop_timeout)
+        if stopped is None and job_id in self.engine._stopping:
+            # 等待超时但关闭仍在进行：结果未知，不发送失败通知，下一次轮询时再决定
+            self.log("Shutdown still in progress")
+            return
+        if stopped:
+            self.stopped = True
+            if fleet is not None:
+                await self.engine.call(fleet.finish, self.job.job_id)
+            watermarks.forget(self.job.pod_name)
+            self.engine.detector.forget(self.job.job_id)
+            self.engine.scheduler.forget(self.job.job_id)
+            telemetry.forget_job(self.job.job_id)
+            if self.engine.store is not None:
+                self.engine.store.forget(self.job.job_id)
+            if self.engine.checkpoints is not None:
+                await self.engine.call(self.engine.checkpoints.discard, self.job.job_id)
+            await self.notify(
+                "✅ GPU任务已成功关闭",
+                f"任务ID: {self.job.job_id}\n"
+                f"节点: {self.job.node_name}\n"
+                f"Pod: {self.job.pod_name}\n"
+                f"关闭时间: {_now()}\n"
+                f"计费已停止",
+                urgent=True
+            )
+        else:
+            await self.notify(
+                "❌ GPU任务关闭失败",
+                f"任务ID: {self.job.job_id}\n"
+                f"失败时间: {_now()}\n"
+                f"请手动检查并关闭任务",
+                urgent=True
+            )
+
+    async def notify(self, title, message, urgent=False):
+        if self.engine.notif_mgr.notifiers:
+            await self.engine.call(self.engine.notif_mgr.send_all, title, message, False, urgent)
+
+
+class MetricBatcher:
+    """
+    合并指标查询：收集一个窗口内所有任务的查询，每个指标用一次批量请求获取
+
+    各指标的请求同时发出，一轮查询的耗时约等于最慢的一个指标。
+    """
+
+    def __init__(self, engine, window=None):
+        """
+        Args:
+            engine: 所属的 MonitorEngine
+            window: 收集查询的时间窗口（秒），默认 config.METRIC_BATCH_WINDOW
+        """
+        self.engine = engine
+        self.window = config.METRIC_BATCH_WINDOW if window is None else window
+        self._pending = {}
+        self._flush_task = None
+
+    async def get(self, job):
+        """
+        获取任务的指标
+
+        Returns:
+            dict: {metric: {"latest": 最新值, "points": 新采样}}，获取失败的指标为 None
+        """
+        if job.job_id not in self._pending:
+            self._pending[job.job_id] = (job, asyncio.get_running_loop().create_future())
+        future = self._pending[job.job_id][1]
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+        return await future
+
+    async def _flush(self):
+        await asyncio.sleep(self.window)
+        pending, self._pending, self._flush_task = self._pending, {}, None
+        jobs = [job for job, _ in pending.values()]
+
+        async def fetch(metric):
+            with tracing.span("engine.fetch", metric=metric, jobs=len(jobs)):
+                return metric, await self.engine.call(
+                    fetch_metric_batch, jobs, metric, None, None, self.engine.store, self.engine.metric_cache
+                ) or {}
+
+        readings = dict(await asyncio.gather(*(fetch(metric) for metric in sorted(self.engine.metrics))))
+        for job, future in pending.values():
+            if not future.done():
+                future.set_result({metric: result.get(job.job_id) for metric, result in readings.items()})
+
+
+class MonitorEngine:
+    """多任务监控引擎"""
+
+    def __init__(self, jobs, notif_mgr, max_workers=None, call_timeout=None, discovery=None, fleet=None):
+        """
+        初始化监控引擎
+
+        Args:
+            jobs: 要监控的 jobs.Job 列表
+            notif_mgr: 通知管理器（所有任务共用）
+            max_workers: 执行阻塞调用的线程数，默认 config.ENGINE_MAX_WORKERS
+            call_timeout: 单次阻塞调用的超时（秒），默认 config.API_CALL_TIMEOUT
+            discovery: discovery.JobDiscovery；设置后自动监控新任务、停止监控已结束的任务
+            fleet: fleet.Fleet；设置后只监控分配给本进程并取得租约的任务
+        """
+        self.jobs = list(jobs)
+        self.discovery = discovery
+        self.fleet = fleet
+        self.notif_mgr = notif_mgr
+        self.max_workers = max_workers or config.ENGINE_MAX_WORKERS
+        self.call_timeout = call_timeout or config.API_CALL_TIMEOUT
+        # 关闭要等待平台确认，单独使用更长的超时
+        self.stop_timeout = max(self.call_timeout, monitor.stop_call_timeout())
+        self.watchers = {}
+        self.batcher = None
+        self.store = None
+        self.checkpoints = None
+        self.metric_cache = None
+        self.detector = IdleDetector()
+        self.crash_detector = CrashDetector() if config.CRASH_DETECT else None
+        self.scheduler = AdaptiveScheduler()
+        self._executor = None
+        self._tasks = {}
+        self._refresh_task = None
+        self._compact_task = None
+        self._stopping = set()  # 关闭仍在线程中进行的任务（超时返回后线程也可能仍在运行）
+
+    def stop_job(self, job):
+        """在线程中关闭任务；结束（而不是等待超时）后才允许再次关闭同一个任务"""
+        try:
+            return monitor.stop_job(job)
+        finally:
+            self._stopping.discard(job.job_id)
+
+    async def call(self, func, *args, timeout=None):
+        """
+        在线程池中执行阻塞调用，超时视为失败
+
+        Args:
+            timeout: 超时（秒），默认 call_timeout
+
+        Returns:
+            调用结果；超时或异常时返回 None
+        """
+        timeout = timeout or self.call_timeout
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, func, *args), timeout
+            )
+        except asyncio.TimeoutError:
+            print(f"⚠️ {func.__name__}{args} 超过 {timeout}s 未返回")
+        except Exception as e:
+            print(f"❌ {func.__name__}{args} 异常: {e}")
+        return None
+
+    async def refresh_token(self, expired=True):
+        """
+        刷新 Token；多个任务同时失败时由 Token 缓存合并为一次登录
+
+        Args:
+            expired: 当前 Token 已失效；为 False 时优先使用本地缓存
+        """
+        stale_token = monitor.HEADERS.get("bihu-token") if expired else None
+        with tracing.span("token.refresh", expired=expired):
+            token = await self.call(get_cached_token, False, stale_token)
+        if not token:
+            return False
+        monitor.update_headers(token)
+        return True
+
+    async def refresh_token_forever(self):
+        """在 Token 过期前 TOKEN_REFRESH_MARGIN 秒主动刷新，轮询不必等到认证失败才换 Token"""
+        while True:
+            refresh_at = token_refresh_at()
+            if refresh_at is not None and refresh_at > time.time():
+                # 期间因认证失败刷新过时，醒来后按新的过期时间重新等待
+                await asyncio.sleep(refresh_at - time.time())
+            elif not await self.refresh_token(expired=False) or (token_refresh_at() or 0) <= time.time():
+                # 登录失败（没有 Token 或仍在使用快过期的旧 Token）
+                print(f"⚠️ Token 主动刷新失败，{config.TOKEN_REFRESH_RETRY}s 后重试")
+                await asyncio.sleep(config.TOKEN_REFRESH_RETRY)
+
+    async def recover(self, watcher, url, key=None):
+        """
+        获取数据失败后的处理（对应 monitor.connection_retry）：认证错误时刷新 Token，
+        其他错误按带抖动的指数退避等待（熔断中等到下一次探测）
+
+        Args:
+            watcher: 失败的任务
+            url: 失败的请求地址（用于取得错误类别）
+            key: 失败请求的 error_key（指标查询为指标名称）
+
+        Returns:
+            bool: 可以重试返回 True；连续永久性错误超过 MAX_FAIL_COUNT 次或故障持续超过
+                  MAX_OUTAGE 秒返回 False（停止监控该任务）
+        """
+        client = get_client()
+        kind = client.last_error(url, key) or resilience.TRANSIENT
+        retry = watcher.retry
+        delay = retry.failure(kind)
+        watcher.log(f"Can't get data ({kind}). Failure count: {retry.failures}")
+        if retry.exhausted():
+            if retry.permanent > config.MAX_FAIL_COUNT:
+                reason = f"连续 {retry.permanent} 次请求错误（{kind}），任务可能已不存在"
+            else:
+                reason = f"平台持续 {retry.outage / 60:.0f} 分钟无法访问"
+            watcher.log("Too many consecutive failures. Stop watching.")
+            await watcher.notify(
+                "❌ GPU监控异常退出",
+                f"任务ID: {watcher.job.job_id}\n"
+                f"原因: {reason}\n"
+                f"停止时间: {_now()}\n"
+                f"请检查网络或Token有效性"
+            )
+            return False
+
+        if kind == resilience.AUTH:
+            if await self.refresh_token():
+                watcher.log("Token refreshed successfully.")
+                return True
+            await watcher.notify(
+                "❌ get_bihu_token失败",
+                f"任务ID: {watcher.job.job_id}\n"
+                f"监控程序仍在运行，将重试..."
+            )
+        await asyncio.sleep(max(delay, client.breaker.retry_in()))
+        return True
+
+    async def job_status(self, job):
+        """
+        任务状态：启用自动发现时使用最近一次列表中的状态，不再单独请求；
+        列表中没有状态或状态不是整数时（平台返回的原始值）单独查询
+        """
+        if self.discovery is not None:
+            status = self.discovery.statuses.get(job.job_id)
+            if isinstance(status, int):
+                return status
+        return await self.call(monitor.get_job_status, job)
+
+    def start_watcher(self, job):
+        """开始监控一个任务"""
+        watcher = JobWatcher(self, job)
+        self.watchers[job.job_id] = watcher
+        task = asyncio.create_task(watcher.run(), name=job.job_id)
+        self._tasks[job.job_id] = task
+        task.add_done_callback(lambda t, job_id=job.job_id: self._watcher_done(job_id, t))
+
+    def _watcher_done(self, job_id, task):
+        if self._tasks.get(job_id) is task:
+            del self._tasks[job_id]
+            watcher = self.watchers.get(job_id)
+            if watcher is not None and self.metric_cache is not None:
+                self.metric_cache.forget(watcher.job)
+        # 单个任务异常不影响其他任务
+        if not task.cancelled() and task.exception() is not None:
+            print(f"❌ 任务 {job_id} 监控异常退出: {task.exception()!r}")
+
+    async def stop_watcher(self, job_id, finished=True):
+        """
+        停止监控一个任务
+
+        Args:
+            finished: 任务已结束；为 False 时（移交给其他进程）保留检查点供新的监控者恢复
+        """
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        watcher = self.watchers.pop(job_id, None)
+        if watcher is not None:
+            watermarks.forget(watcher.job.pod_name)
+            if self.metric_cache is not None:
+                self.metric_cache.forget(watcher.job)
+        self.detector.forget(job_id)
+        self.scheduler.forget(job_id)
+        telemetry.forget_job(job_id)
+        if self.store is not None:
+            self.store.forget(job_id)
+        if finished and self.checkpoints is not None:
+            await self.call(self.checkpoints.discard, job_id)
+
+    async def discover_forever(self):
+        """定期列出账号下的任务：新任务开始监控，已结束的任务停止监控"""
+        self.discovery.known.update({job.job_id: job for job in self.jobs})
+        while True:
+            result = await self.call(self.discovery.poll)
+            if result is not None:
+                added, removed = result
+                for job in added:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Discovered job {job.job_id} on {job.node_name}")
+                    if self.fleet is None:  # 分片模式下由 sync_fleet 决定是否监控
+                        self.start_watcher(job)
+                if self.fleet is not None and added:
+                    await self.resume_leases(added)
+                for job_id in removed:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Job {job_id} finished, stop watching")
+                    await self.stop_watcher(job_id)
+                    if self.fleet is not None:
+                        await self.call(self.fleet.release, job_id, True)
+            await asyncio.sleep(config.DISCOVERY_INTERVAL)
+
+    async def resume_leases(self, jobs):
+        """分片模式：立即恢复监控本进程重启前持有、尚未被其他进程接管的任务"""
+        jobs = {job.job_id: job for job in jobs if job.job_id not in self.watchers}
+        mine = await self.call(self.fleet.resumable, list(jobs)) or set()
+        for job_id in sorted(mine):
+            if await self.call(self.fleet.acquire, job_id):
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Resume job {job_id} (lease held before restart)")
+                self.start_watcher(jobs[job_id])
+
+    async def sync_fleet(self):
+        """分片模式：定期心跳、续约，接管新分配给本进程的任务，移交不再分配给本进程的任务"""
+        await self.call(self.fleet.heartbeat)
+        # 重启前持有的租约立即恢复监控；其他任务先等其他进程看到本进程的心跳，
+        # 避免刚启动时接管全部任务又立即移交
+        await self.resume_leases(self.jobs)
+        await asyncio.sleep(config.FLEET_SYNC_INTERVAL)
+        while True:
+            await self.call(self.fleet.heartbeat)
+            candidates = dict(self.discovery.known) if self.discovery is not None else {
+                job.job_id: job for job in self.jobs
+            }
+            assigned = await self.call(self.fleet.assigned, list(candidates))
+            if assigned is not None:
+                for job_id, watcher in list(self.watchers.items()):
+                    if watcher.stopped:  # 已关闭的任务保留已结束标记，直到从列表中消失
+                        continue
+                    if job_id in assigned and await self.call(self.fleet.renew, job_id):
+                        continue
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Hand over job {job_id}")
+                    await self.stop_watcher(job_id, finished=False)
+                    await self.call(self.fleet.release, job_id)
+                for job_id in sorted(assigned - set(self.watchers)):
+                    if await self.call(self.fleet.acquire, job_id):
+                        self.start_watcher(candidates[job_id])
+            await asyncio.sleep(config.FLEET_SYNC_INTERVAL)
+
+    @property
+    def metrics(self):
+        """每次轮询需要获取的指标"""
+        return {"gpu_memory"} | set(config.POLL_METRICS) | self.detector.metrics
+
+    async def compact_samples(self):
+        """定期删除超过保留期的采样"""
+        while True:
+            removed = await self.call(self.store.compact)
+            if removed:
+                print(f"Sample store: removed {removed} expired record(s)")
+            await asyncio.sleep(config.SAMPLE_COMPACT_INTERVAL)
+
+    async def run(self):
+        """并发监控所有任务，直到全部结束（启用自动发现时一直运行）"""
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="monitor")
+        telemetry.start_server()
+        tracing.install_profiler()
+        self.batcher = MetricBatcher(self)
+        if config.SAMPLE_STORE_DIR:
+            # 分片模式下每个进程使用单独的子目录，避免多个进程写同一个文件
+            self.store = SampleStore(
+                os.path.join(config.SAMPLE_STORE_DIR, self.fleet.worker_id) if self.fleet is not None else None
+            )
+        if config.CHECKPOINT_DIR:
+            self.checkpoints = CheckpointStore()
+        if config.METRIC_CACHE_TTL:
+            self.metric_cache = MetricCache()
+        if self.fleet is not None:
+            print(f"Fleet worker {self.fleet.worker_id}, lease directory: {os.path.abspath(self.fleet.directory)}")
+        print(f"Starting monitoring {len(self.jobs)} job(s): {', '.join(j.job_id for j in self.jobs)}")
+        print(f"Criteria: GPU memory < {config.IDLE_THRESHOLD_MB}MB for {config.MAX_IDLE_COUNT} consecutive checks")
+        try:
+            if not monitor.HEADERS:
+                print("Initializing token...")
+                await self.refresh_token(expired=False)
+            self._refresh_task = asyncio.create_task(self.refresh_token_forever())
+
+            if self.store is not None:
+                self._compact_task = asyncio.create_task(self.compact_samples())
+            loops = []
+            if self.fleet is not None:
+                loops.append(self.sync_fleet())
+            else:
+                for job in self.jobs:
+                    self.start_watcher(job)
+            if self.discovery is not None:
+                loops.append(self.discover_forever())
+
+            if loops:
+                await asyncio.gather(*loops)
+            while self._tasks:
+                await asyncio.wait(list(self._tasks.values()))
+        finally:
+            for task in list(self._tasks.values()):
+                task.cancel()
+            background = [task for task in (self._refresh_task, self._compact_task) if task is not None]
+            for task in background:
+                task.cancel()
+            # 等待取消完成；线程中仍在进行的压缩由 SampleStore.close() 等待
+            await asyncio.gather(*background, return_exceptions=True)
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            if self.fleet is not None:
+                self.fleet.leave()
+            if self.store is not None:
+                self.store.close()
+            print(f"HTTP connections: {get_client().stats()}")
+            if self.metric_cache is not None:
+                print(f"Metric cache: {self.metric_cache.stats()}")
+
+
+def main(discover=False, fleet=False):
+    jobs = load_jobs()
+    if not jobs and not discover:
+        print("No job to monitor, please check config.JOB_LOGS")
+        return
+    notif_mgr = monitor.setup_notifications()
+    engine = MonitorEngine(
+        jobs, notif_mgr, discovery=JobDiscovery() if discover else None, fleet=Fleet() if fleet else None
+    )
+    try:
+        asyncio.run(engine.run())
+    finally:
+        # 确保“任务已成功关闭”等最后的通知发送完成
+        notif_mgr.stop()
+
+
+if __name__ == "__main__":
+    import sys
+
+    main(discover=config.AUTO_DISCOVER or "--discover" in sys.argv[1:], fleet="--fleet" in sys.argv[1:])
@@ -0,0 +1,532 @@
+"""
+Starlight API 本地模拟服务 - 不需要真实账号和运行中的任务即可压测、离线测试监控程序
+
+实现 monitor.py / get_token.py / discovery.py 用到的接口：
+- POST   /api/keystone/short_term_token/name      登录，返回带 exp 的 Token
+- GET    /api/monitor/metric                      按 pod_list/start/end/limit 返回指标
+- GET    /api/job/running/{cluster}               任务列表
+- GET    /api/job/running/{cluster}/{job_id}      任务状态
+- DELETE /api/job/running/{cluster}/{job_id}      停止任务
+- POST   /robot/send                              钉钉机器人 Webhook（用于测试通知发送）
+
+场景可以用 JSON 文件描述（见 Scenario.from_dict）：任务数量、显存曲线、排队时长、
+响应延迟、慢请求比例、断开连接（模拟 SSL EOF）比例、Token 有效期。
+也可以用 recorder.py 录制的 JSONL 回放真实响应。
+
+用法：
+    python fake_starlight.py --jobs 1000 --port 8765
+    set STARLIGHT_API_BASE=http://127.0.0.1:8765/api   (Linux: export ...)
+    python engine.py --discover
+"""
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import random
+import ssl
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import config
+
+STATUS_QUEUED = 0
+STATUS_RUNNING = 2
+
+
+def _parse_time(value, default):
+    """把查询参数中的 ISO 时间（带 Z）转换为 UTC 秒"""
+    if not value:
+        return default
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def make_token(ttl, serial=0):
+    """生成带 exp 字段的 JWT 格式 Token（签名部分无意义）"""
+    def encode(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+    payload = {"exp": int(time.time() + ttl), "jti": serial}
+    return f"{encode({'alg': 'none'})}.{encode(payload)}.fake"
+
+
+def _noise(*key):
+    """对同一个 (pod, 设备, 时间戳) 总是返回相同的 [-1, 1) 随机数，重复查询结果一致"""
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") / 2 ** 63 - 1
+
+
+class Curve:
+    """
+    显存曲线：任务开始后经过 elapsed 秒时的显存占用（MB）
+
+    spec 示例：
+        {"type": "constant", "value": 20000}
+        {"type": "idle", "value": 0}
+        {"type": "crash", "value": 20000, "at": 600, "after": 0}
+        {"type": "steps", "points": [[0, 20000], [600, 500], [900, 0]]}
+        {"type": "noise", "base": 20000, "amplitude": 2000}
+    """
+
+    def __init__(self, spec=None):
+        self.spec = dict(spec or {"type": "constant", "value": 20000})
+        self.type = self.spec.get("type", "constant")
+        if self.type not in ("constant", "idle", "crash", "steps", "noise"):
+            raise ValueError(f"未知的曲线类型: {self.type}")
+
+    def value(self, elapsed, key=()):
+        spec = self.spec
+        if self.type == "constant":
+            return spec.get("value", 20000)
+        if self.type == "idle":
+            return spec.get("value", 0)
+        if self.type == "crash":
+            return spec.get("value", 20000) if elapsed < spec.get("at", 600) else spec.get("after", 0)
+        if self.type == "steps":
+            current = 0
+            for at, value in spec.get("points", []):
+                if elapsed >= at:
+                    current = value
+            return current
+        base = spec.get("base", 20000)
+        return max(base + spec.get("amplitude", 2000) * _noise(*key), 0)
+
+
+class FakeJob:
+    """模拟的任务"""
+
+    def __init__(self, job_id, pod_name, node_name, curve=None, devices=1, queued_for=0, started=None,
+                 metrics=None):
+        """
+        Args:
+            job_id / pod_name / node_name: 任务标识
+            curve: 显存曲线配置（见 Curve）
+            metrics: 其他指标的曲线 {metric: Curve 配置}，例如 {"gpu_util": {"type": "idle"}}；
+                     未指定的指标使用显存曲线（利用率指标最大 100）
+            devices: GPU 数量
+            queued_for: 排队时长（秒），之后转为运行中
+            started: 任务提交时间（UNIX 秒），默认当前时间
+        """
+        self.job_id = job_id
+        self.pod_name = pod_name
+        self.node_name = node_name
+        self.curve = curve if isinstance(curve, Curve) else Curve(curve)
+        self.metrics = {metric: spec if isinstance(spec, Curve) else Curve(spec)
+                        for metric, spec in (metrics or {}).items()}
+        self.devices = devices
+        self.queued_for = queued_for
+        self.submitted = time.time() if started is None else started
+        self.deleted_at = None
+
+    @property
+    def running_since(self):
+        return self.submitted + self.queued_for
+
+    def gone(self, now):
+        """DELETE 后经过 stop_delay 才真正从列表中消失"""
+        return self.deleted_at is not None and now >= self.deleted_at
+
+    def status(self, now):
+        return STATUS_RUNNING if now >= self.running_since else STATUS_QUEUED
+
+    def log_line(self):
+        """与 config.JOB_LOGS 相同格式的调度日志"""
+        return f"Successfully assigned 0/{self.pod_name} to {self.node_name}"
+
+    def points(self, start, end, interval, limit, metric="gpu_memory"):
+        """
+        [start, end] 内各设备 metric 指标的数据点（每 interval 秒一个，最多最近 limit 个）
+
+        Returns:
+            list: spec.device 条目
+        """
+        first = max(start, self.running_since)
+        if first > end:
+            return []
+        first_tick = -(-first // interval) * interval
+        ticks = []
+        ts = end // interval * interval
+        while ts >= first_tick and len(ticks) < limit:
+            ticks.append(ts)
+            ts -= interval
+        ticks.reverse()
+        curve = self.metrics.get(metric, self.curve)
+        # 未指定曲线的利用率（%）指标跟随显存曲线，最大 100
+        cap = 100 if metric not in self.metrics and metric.endswith("util") else float("inf")
+        result = []
+        for index in range(self.devices):
+            device = f"gpu{index}"
+            data = [
+                [int(ts), f"{min(curve.value(ts - self.running_since, (self.pod_name, device, ts)), cap):.1f}"]
+                for ts in ticks
+            ]
+            result.append({"pod": self.pod_name, "device": device, "node": self.node_name, "data": data})
+        return result
+
+
+class Scenario:
+    """模拟场景：任务集合和故障注入参数"""
+
+    def __init__(self, jobs=(), cluster=None, latency=0.0, slow_rate=0.0, slow_latency=5.0,
+                 drop_rate=0.0, error_rate=0.0, stop_delay=0.0, token_ttl=6 * 3600, sample_interval=30,
+                 seed=None):
+        """
+        Args:
+            jobs: FakeJob 列表
+            cluster: 集群名称，默认 config.CLUSTER
+            latency: 每个请求的基础延迟（秒）
+            slow_rate: 慢请求比例（0~1）
+            slow_latency: 慢请求的额外延迟（秒）
+            drop_rate: 不返回响应直接断开连接的比例（客户端表现为 SSL EOF / 连接被关闭）
+            error_rate: 返回 HTTP 503 的比例
+            stop_delay: DELETE 返回成功后任务仍在运行（可查询到）的时间（秒）
+            token_ttl: Token 有效期（秒），过期后接口返回 code 401
+            sample_interval: 指标数据点间隔（秒）
+            seed: 故障注入使用的随机种子
+        """
+        self.cluster = cluster or config.CLUSTER
+        self.jobs = {job.job_id: job for job in jobs}
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.drop_rate = drop_rate
+        self.error_rate = error_rate
+        self.stop_delay = stop_delay
+        self.token_ttl = token_ttl
+        self.sample_interval = sample_interval
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def generate(cls, count, curves=None, devices=1, queued_fraction=0.0, queued_for=120,
+                 history=600, nodes=64, seed=None, **kwargs):
+        """
+        生成 count 个任务
+
+        Args:
+            curves: [(权重, 曲线配置), ...]，默认全部为带噪声的繁忙曲线
+            devices: 每个任务的 GPU 数量
+            queued_fraction: 排队中任务的比例
+            queued_for: 排队任务的排队时长（秒）
+            history: 运行中任务在启动前已运行的时长（秒），启动后即有历史数据点
+            nodes: 节点数量
+        """
+        rng = random.Random(seed)
+        curves = curves or [(1, {"type": "noise", "base": 20000, "amplitude": 2000})]
+        weights = [w for w, _ in curves]
+        specs = [Curve(spec) for _, spec in curves]
+        now = time.time()
+        jobs = []
+        for i in range(count):
+            job_id = f"fakejob-{i:05d}"
+            queued = rng.random() < queued_fraction
+            jobs.append(FakeJob(
+                job_id, f"{job_id}-{i % 100000:05x}", f"an{i % nodes + 1}",
+                curve=rng.choices(specs, weights)[0], devices=devices,
+                queued_for=queued_for if queued else 0, started=now if queued else now - history,
+            ))
+        return cls(jobs, seed=seed, **kwargs)
+
+    @classmethod
+    def from_dict(cls, spec):
+        """
+        从配置构建场景
+
+        spec 示例：
+            {"generate": {"count": 1000, "curves": [[0.8, {"type": "noise"}], [0.2, {"type": "idle"}]],
+                          "queued_fraction": 0.1},
+             "jobs": [{"job_id": "a", "pod_name": "a-x", "node_name": "an1", "curve": {"type": "idle"}}],
+             "latency": 0.05, "slow_rate": 0.01, "drop_rate": 0.01, "error_rate": 0.01, "stop_delay": 5,
+             "token_ttl": 600}
+        """
+        spec = dict(spec)
+        generate = spec.pop("generate", None)
+        explicit = [FakeJob(**job) for job in spec.pop("jobs", [])]
+        if generate:
+            scenario = cls.generate(**generate, **spec)
+            for job in explicit:
+                scenario.jobs[job.job_id] = job
+            return scenario
+        return cls(explicit, **spec)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def job_logs(self):
+        """所有任务的调度日志，可直接作为 jobs.load_jobs 的参数"""
+        return [job.log_line() for job in self.jobs.values()]
+
+    def fault(self):
+        """
+        本次请求的故障注入
+
+        Returns:
+            tuple: (延迟秒数, 是否断开连接, 是否返回 503)
+        """
+        with self.lock:
+            delay = self.latency
+            if self.slow_rate and self.random.random() < self.slow_rate:
+                delay += self.slow_latency
+            drop = bool(self.drop_rate) and self.random.random() < self.drop_rate
+            error = bool(self.error_rate) and self.random.random() < self.error_rate
+        return delay, drop, error
+
+
+class Replay:
+    """
+    回放 recorder.py 录制的响应
+
+    按 (方法, 路径) 分组，依次返回录制的响应，用完后循环。
+    """
+
+    def __init__(self, path):
+        self.responses = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                key = (record["method"], record["path"])
+                self.responses.setdefault(key, []).append((record["status"], record["body"]))
+        self._cycles = {key: itertools.cycle(items) for key, items in self.responses.items()}
+        self._lock = threading.Lock()
+
+    def response(self, method, path):
+        with self._lock:
+            cycle = self._cycles.get((method, path))
+            return next(cycle) if cycle else None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive，与真实服务一致地复用连接
+    disable_nagle_algorithm = True  # 响应头和正文分两次写出，不关闭 Nagle 每个请求会多等 40ms
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method):
+        server = self.server
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        delay, drop, error = server.scenario.fault()
+        server.count(method, url.path)
+        if delay:
+            time.sleep(delay)
+        if drop:
+            server.count("DROP", url.path)
+            self.close_connection = True
+            return
+        if error or time.time() < server.outage_until:
+            server.count("503", url.path)
+            return self._send(503, {"code": 503, "info": "service unavailable"})
+        if server.replay is not None:
+            recorded = server.replay.response(method, url.path)
+            if recorded is None:
+                return self._send(404, {"code": 404, "info": "not recorded"})
+            return self._send(*recorded)
+        try:
+            status, payload = server.route(method, url.path, parse_qs(url.query), body, self.headers)
+        except Exception as e:
+            status, payload = 500, {"code": 500, "info": str(e)}
+        self._send(status, payload)
+
+    def _send(self, status, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        data = data.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeStarlight(ThreadingHTTPServer):
+    """模拟服务，在后台线程中运行"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, scenario=None, host="127.0.0.1", port=0, replay=None, certfile=None, keyfile=None):
+        """
+        Args:
+            scenario: Scenario，默认 10 个繁忙任务
+            host / port: 监听地址，port 为 0 时自动选择
+            replay: recorder.py 录制的 JSONL 路径，指定后只回放录制的响应
+            certfile / keyfile: 指定后使用 HTTPS
+        """
+        super().__init__((host, port), Handler)
+        self.scenario = scenario or Scenario.generate(10)
+        self.replay = Replay(replay) if replay else None
+        self.scheme = "http"
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+            self.scheme = "https"
+        self.tokens = {}  # token -> 过期时间
+        self.requests = {}  # (方法, 接口) -> 次数
+        self._serial = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.outage_until = 0.0
+
+    @property
+    def api_base(self):
+        host, port = self.server_address[:2]
+        return f"{self.scheme}://{host}:{port}/api"
+
+    @property
+    def webhook_url(self):
+        """模拟的钉钉机器人 Webhook 地址"""
+        host, port = self.server_address[:2]
+        return f"{self.scheme}://{host}:{port}/robot/send?access_token=fake"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-starlight", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, method, path):
+        if path.startswith("/api/job/running/"):
+            path = "/api/job/running/{cluster}" + ("/{job_id}" if path.count("/") > 4 else "")
+        with self._lock:
+            key = (method, path)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def stats(self):
+        """各接口的请求次数 {"方法 接口": 次数}"""
+        with self._lock:
+            return {f"{method} {path}": n for (method, path), n in sorted(self.requests.items())}
+
+    def outage(self, seconds):
+        """模拟平台故障：之后 seconds 秒内所有请求返回 503"""
+        self.outage_until = time.time() + seconds
+
+    def expire_tokens(self):
+        """让已发出的 Token 全部失效（模拟服务端提前吊销）"""
+        with self._lock:
+            self.tokens.clear()
+
+    def _authorized(self, headers):
+        token = headers.get("bihu-token")
+        with self._lock:
+            expires = self.tokens.get(token)
+        return expires is not None and expires > time.time()
+
+    def route(self, method, path, query, body, headers):
+        """
+        Returns:
+            tuple: (HTTP 状态码, JSON 响应)
+        """
+        scenario = self.scenario
+        if method == "POST" and path == "/api/keystone/short_term_token/name":
+            token = make_token(scenario.token_ttl, next(self._serial))
+            with self._lock:
+                self.tokens[token] = time.time() + scenario.token_ttl
+            return 200, {"code": 200, "spec": token}
+        if method == "POST" and path == "/robot/send":
+            return 200, {"errcode": 0, "errmsg": "ok"}
+        if not self._authorized(headers):
+            return 401, {"code": 401, "info": "token expired"}
+
+        now = time.time()
+        if method == "GET" and path == "/api/monitor/metric":
+            pods = set(query.get("pod_list", [""])[0].split(","))
+            start = _parse_time(query.get("start", [None])[0], now - 3600)
+            end = min(_parse_time(query.get("end", [None])[0], now), now)
+            limit = int(query.get("limit", ["10"])[0])
+            metric = query.get("metric", ["gpu_memory"])[0]
+            devices = []
+            for job in list(scenario.jobs.values()):
+                if job.pod_name in pods and not job.gone(now):
+                    devices.extend(job.points(start, end, scenario.sample_interval, limit, metric))
+            return 200, {"code": 200, "spec": {"device": devices}}
+
+        parts = path.strip("/").split("/")
+        if parts[:3] == ["api", "job", "running"] and len(parts) == 4 and method == "GET":
+            items = [
+                {"job_name": job.job_id, "pod_name": job.pod_name, "node_name": job.node_name,
+                 "status": job.status(now)}
+                for job in list(scenario.jobs.values()) if not job.gone(now)
+            ]
+            return 200, {"code": 200, "spec": {"items": items}}
+        if parts[:3] == ["api", "job", "running"] and len(parts) == 5:
+            job = scenario.jobs.get(parts[4])
+            if job is None or job.gone(now):
+                return 404, {"code": 404, "info": "job not found"}
+            if method == "DELETE":
+                if job.deleted_at is None:
+                    job.deleted_at = now + scenario.stop_delay
+                return 200, {"code": 200, "info": "deleted"}
+            return 200, {"code": 200, "spec": {"status": job.status(now), "job_name": job.job_id}}
+        return 404, {"code": 404, "info": "not found"}
+
+
+def use_server(api_base):
+    """把 config 中的接口地址指向 api_base（已导入 config 后切换到模拟服务时使用）"""
+    config.API_BASE = api_base
+    config.LOGIN_URL = f"{api_base}/keystone/short_term_token/name"
+    config.METRIC_URL = f"{api_base}/monitor/metric"
+    config.JOB_LIST_URL = f"{api_base}/job/running"
+    config.JOB_STATUS_URL = f"{api_base}/job/running/{config.CLUSTER}/{config.JOB_ID}"
+    config.DELETE_URL = f"{api_base}/job/running/{config.CLUSTER}/{config.JOB_ID}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Starlight API 本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--jobs", type=int, default=10, help="生成的任务数（未指定 --scenario 时）")
+    parser.add_argument("--scenario", help="场景 JSON 文件")
+    parser.add_argument("--replay", help="回放 recorder.py 录制的 JSONL")
+    parser.add_argument("--certfile", help="HTTPS 证书")
+    parser.add_argument("--keyfile", help="HTTPS 私钥")
+    parser.add_argument("--logs", help="把任务调度日志写入该文件（每行一个，可填入 JOB_LOGS）")
+    args = parser.parse_args()
+
+    scenario = Scenario.load(args.scenario) if args.scenario else Scenario.generate(args.jobs)
+    server = FakeStarlight(scenario, args.host, args.port, args.replay, args.certfile, args.keyfile)
+    if args.logs:
+        with open(args.logs, "w", encoding="utf-8") as f:
+            f.write("\n".join(scenario.job_logs()) + "\n")
+    print(f"Fake Starlight API: {server.api_base} ({len(scenario.jobs)} jobs)")
+    print(f"STARLIGHT_API_BASE={server.api_base}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+分片监控 - 多个监控进程（同一台机器或共享目录的多台机器）分担任务，每个任务只有一个监控者
+
+共享目录 FLEET_DIR 中：
+- workers/<worker>.json：每个监控进程定期写入的心跳（含过期时间）
+- leases/<job_id>.lease：任务的租约，记录当前监控者和过期时间
+
+每个进程按心跳列出存活的进程，用最高随机权重哈希（rendezvous hashing）计算每个任务
+应由谁监控：进程数变化时只有少量任务需要移交，任务大致平均分配。
+计算结果只决定“尝试接管哪些任务”，真正的归属以租约为准：
+- 新建租约先写临时文件再硬链接到租约路径，已存在则失败，同一时刻只会有一个进程成功
+- 持有者每 FLEET_SYNC_INTERVAL 秒续约：确认租约仍属于本进程且离过期还有 FLEET_RENEW_MARGIN 秒以上
+  （其他进程不会接管未过期的租约）后，写临时文件再原地替换，租约文件始终存在；
+  快过期或已过期时按接管流程续约，不会覆盖刚接管的进程；进程退出或卡住后租约过期，由新的分配结果接管
+- 关闭任务前再次确认租约，租约已被接管时不发送 DELETE；关闭后租约标记为已结束，不会再被接管
+
+用法：
+    python fleet.py [--workers N] [--discover]   # 在本机启动 N 个监控进程，异常退出的进程立即重启
+    python engine.py --fleet [--discover]        # 以单个监控进程加入（其他机器上运行）
+"""
+import hashlib
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import socket
+import time
+
+import config
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def default_worker_id():
+    return config.FLEET_WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def rendezvous_owner(job_id, workers):
+    """最高随机权重哈希：返回 workers 中负责 job_id 的进程"""
+    def weight(worker):
+        return hashlib.blake2b(f"{worker}/{job_id}".encode(), digest_size=8).digest()
+    return max(workers, key=weight) if workers else None
+
+
+class Fleet:
+    """本进程在分片监控中的成员身份和持有的租约"""
+
+    def __init__(self, directory=None, worker_id=None, ttl=None):
+        """
+        Args:
+            directory: 共享目录，默认 config.FLEET_DIR
+            worker_id: 本进程名称，默认 default_worker_id()
+            ttl: 心跳和租约的有效期（秒），默认 config.FLEET_LEASE_TTL
+        """
+        self.directory = directory or config.FLEET_DIR
+        self.worker_id = _UNSAFE.sub("_", worker_id or default_worker_id())
+        self.ttl = ttl or config.FLEET_LEASE_TTL
+        self.workers_dir = os.path.join(self.directory, "workers")
+        self.leases_dir = os.path.join(self.directory, "leases")
+        self.held = set()
+        os.makedirs(self.workers_dir, exist_ok=True)
+        os.makedirs(self.leases_dir, exist_ok=True)
+
+    def _lease_path(self, job_id):
+        return os.path.join(self.leases_dir, f"{_UNSAFE.sub('_', str(job_id))}.lease")
+
+    def _record(self):
+        return {"owner": self.worker_id, "host": socket.gethostname(), "pid": os.getpid(),
+                "expires": time.time() + self.ttl}
+
+    def _read(self, path):
+        """读取心跳或租约；文件损坏时按修改时间推算过期时间"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError:
+            try:
+                return {"owner": None, "expires": os.path.getmtime(path) + self.ttl}
+            except OSError:
+                return None
+        except OSError:
+            return None
+
+    def _write(self, path, record):
+        """覆盖写入（只用于本进程自己的心跳和已持有的租约）"""
+        tmp_path = f"{path}.{self.worker_id}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def _create(self, path, record):
+        """
+        新建文件，已存在时失败
+
+        Returns:
+            bool: 是否由本进程创建
+        """
+        tmp_path = f"{path}.{self.worker_id}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        try:
+            os.link(tmp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def heartbeat(self):
+        """写入本进程的心跳"""
+        self._write(os.path.join(self.workers_dir, f"{self.worker_id}.json"), self._record())
+
+    def live_workers(self):
+        """
+        心跳未过期的进程（包括本进程）；过期很久的心跳文件会被删除
+
+        Returns:
+            list: 进程名称
+        """
+        now = time.time()
+        workers = {self.worker_id}
+        for name in os.listdir(self.workers_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.workers_dir, name)
+            record = self._read(path)
+            if record is None:
+                continue
+            if record["expires"] > now:
+                workers.add(name[:-len(".json")])
+            elif record["expires"] < now - 10 * self.ttl:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return sorted(workers)
+
+    def assigned(self, job_ids):
+        """
+        按当前存活的进程计算应由本进程监控的任务
+
+        Returns:
+            set: job_id 集合
+        """
+        workers = self.live_workers()
+        return {job_id for job_id in job_ids if rendezvous_owner(job_id, workers) == self.worker_id}
+
+    def acquire(self, job_id):
+        """
+        获取任务的租约；租约被其他进程持有且未过期时失败
+
+        Returns:
+            bool: 本进程是否持有租约
+        """
+        path = self._lease_path(job_id)
+        if self._create(path, self._record()):
+            self.held.add(job_id)
+            return True
+        current = self._read(path)
+        if current is None:
+            return False
+        if current.get("finished"):
+            return False
+        if current["owner"] == self.worker_id:
+            return self.renew(job_id)
+        if current["expires"] > time.time():
+            return False
+        return self._take_over(job_id, path, current)
+
+    def _take_over(self, job_id, path, current):
+        """
+        接管已过期的租约：改名后删除（同一个文件只有一个进程能改名成功），再重新创建
+
+        Args:
+            current: 改名前读到的租约，改名后内容不同说明已被其他进程接管
+
+        Returns:
+            bool: 本进程是否持有租约
+        """
+        stale_path = f"{path}.{self.worker_id}.stale"
+        try:
+            os.replace(path, stale_path)
+        except OSError:
+            self.held.discard(job_id)
+            return False
+        stolen = self._read(stale_path)
+        os.remove(stale_path)
+        if stolen != current:
+            # 读取和改名之间已被其他进程接管：放回它的租约
+            if stolen is not None:
+                self._create(path, stolen)
+            self.held.discard(job_id)
+            return False
+        if current["owner"] != self.worker_id:
+            print(f"[fleet] {self.worker_id} takes over job {job_id} from {current['owner']}")
+        # 改名后到重新创建前，其他进程可能已新建租约：此时放弃
+        if self._create(path, self._record()):
+            self.held.add(job_id)
+            return True
+        self.held.discard(job_id)
+        return False
+
+    def resumable(self, job_ids):
+        """
+        上一次运行（同一进程名，例如被重启的 fleet.py 子进程）留下、尚未被其他进程接管的租约
+
+        Returns:
+            set: job_id 集合
+        """
+        mine = set()
+        for job_id in job_ids:
+            record = self._read(self._lease_path(job_id))
+            if record is not None and record.get("owner") == self.worker_id and not record.get("finished"):
+                mine.add(job_id)
+        return mine
+
+    def renew(self, job_id):
+        """
+        续约；租约已被其他进程接管时返回 False
+
+        其他进程只接管已过期的租约：离过期还有 FLEET_RENEW_MARGIN 秒以上时，确认持有者后
+        直接原地替换（租约文件始终存在，其他进程的 acquire 不会在续约期间新建租约）；
+        否则按接管流程改名后重新创建。
+
+        Returns:
+            bool: 本进程是否仍持有租约
+        """
+        path = self._lease_path(job_id)
+        current = self._read(path)
+        if current is None or current["owner"] != self.worker_id or current.get("finished"):
+            self.held.discard(job_id)
+            return False
+        if current["expires"] - time.time() <= config.FLEET_RENEW_MARGIN:
+            return self._take_over(job_id, path, current)
+        self._write(path, self._record())
+        self.held.add(job_id)
+        return True
+
+    def finish(self, job_id):
+        """任务已被本进程关闭：保留租约并标记为已结束，其他进程不再接管"""
+        self.held.discard(job_id)
+        self._write(self._lease_path(job_id), {**self._record(), "finished": True})
+
+    def release(self, job_id, finished=False):
+        """
+        释放本进程持有的租约
+
+        Args:
+            finished: 任务已不在列表中；同时删除其他进程留下的已结束标记
+        """
+        self.held.discard(job_id)
+        path = self._lease_path(job_id)
+        current = self._read(path)
+        if current is None:
+            return
+        # 已结束标记只在任务不在列表中之后删除
+        if finished if current.get("finished") else current["owner"] == self.worker_id:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def leave(self):
+        """退出：释放所有租约并删除心跳，其他进程在下一次同步时即可接管"""
+        for job_id in list(self.held):
+            self.release(job_id)
+        try:
+            os.remove(os.path.join(self.workers_dir, f"{self.worker_id}.json"))
+        except OSError:
+            pass
+
+
+def _worker(index, discover):
+    """监控子进程：使用固定的进程名，指标端口按序号错开"""
+    import engine
+
+    config.FLEET_WORKER_ID = f"{socket.gethostname()}-w{index}"
+    if config.METRICS_PORT:
+        config.METRICS_PORT += index
+    engine.main(discover=discover, fleet=True)
+
+
+def supervise(workers=None, discover=False, restart_delay=5):
+    """
+    在本机启动 workers 个监控进程，异常退出的进程立即重启
+
+    子进程的进程名固定，重启后直接沿用自己留下的租约和检查点继续监控。
+
+    Args:
+        workers: 进程数，默认 config.FLEET_WORKERS
+        discover: 是否自动发现任务
+        restart_delay: 进程启动后不到该时间（秒）就再次退出时，等待该时间再重启，避免反复崩溃
+    """
+    workers = workers or config.FLEET_WORKERS
+    processes = {}
+    started = {}
+
+    def start(index):
+        process = multiprocessing.Process(target=_worker, args=(index, discover), name=f"monitor-w{index}")
+        process.start()
+        processes[index] = process
+        started[index] = time.monotonic()
+
+    print(f"Starting {workers} monitor worker(s), lease directory: {os.path.abspath(config.FLEET_DIR)}")
+    for index in range(workers):
+        start(index)
+    try:
+        while processes:
+            multiprocessing.connection.wait([p.sentinel for p in processes.values()])
+            for index, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                if process.exitcode == 0:
+                    print(f"[fleet] worker {index} finished")
+                    del processes[index]
+                    continue
+                print(f"[fleet] worker {index} exited with {process.exitcode}, restarting")
+                if time.monotonic() - started[index] < restart_delay:
+                    time.sleep(restart_delay)
+                start(index)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="在本机启动多个分片监控进程")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认 config.FLEET_WORKERS")
+    parser.add_argument("--discover", action="store_true", help="自动发现账号下的任务")
+    args = parser.parse_args()
+    supervise(args.workers, args.discover or config.AUTO_DISCOVER)
@@ -1,9 +1,15 @@
-import requests
 import base64
 import json
-import private_config
+import config
+import tracing
+from http_client import get_client
+from token_cache import TokenCache
+@tracing.traced("token.login")
 def get_bihu_token():
-    url = "https://starlight.nscc-gz.cn/api/keystone/short_term_token/name"
+    # 账号信息在第一次登录时才读取，导入本模块不需要 private_config
+    import private_config
+
+    url = config.LOGIN_URL
     
     # 你的原始信息
     username = private_config.username
@@ -30,7 +36,7 @@ def get_bihu_token():
     }
 
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = get_client().post(url, json=payload, headers=headers)
         
         # 调试信息
         # print(f"Status Code: {response.status_code}")
@@ -58,9 +64,41 @@ def get_bihu_token():
         print(f"请求发生异常: {e}")
         return None
 
-# 执行并打印结果
-token = get_bihu_token()
-if token:
-    print(f"成功获取 BIHU_TOKEN: {token}")
-else:
-    print("未能获取 Token，请检查用户名密码或 Response 结构")
\ No newline at end of file
+_token_cache = None
+
+
+def get_cached_token(force_refresh=False, stale_token=None):
+    """
+    获取 bihu-token：优先使用本地缓存，过期前自动刷新，并发刷新只登录一次
+
+    Args:
+        force_refresh: 强制重新登录
+        stale_token: 已失效的 Token（接口认证失败时传入当前 Token）
+    """
+    global _token_cache
+    if _token_cache is None:
+        import private_config
+
+        _token_cache = TokenCache(get_bihu_token, owner=private_config.username)
+    return _token_cache.get(force_refresh=force_refresh, stale_token=stale_token)
+
+
+def token_refresh_at():
+    """
+    当前 Token 需要提前刷新的时间（过期时间 - TOKEN_REFRESH_MARGIN）
+
+    Returns:
+        float: UNIX 秒；还没有 Token 时返回 None
+    """
+    if _token_cache is None or _token_cache.token is None:
+        return None
+    return _token_cache.expires_at - _token_cache.refresh_margin
+
+
+if __name__ == "__main__":
+    # 执行并打印结果
+    token = get_cached_token()
+    if token:
+        print(f"成功获取 BIHU_TOKEN: {token}")
+    else:
+        print("未能获取 Token，请检查用户名密码或 Response 结构")
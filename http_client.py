@@ -0,0 +1,249 @@
+"""
+Starlight API 客户端 - 所有 API 调用共用一个带连接池的 keep-alive 会话
+
+请求经过 resilience.py 的重试策略：幂等请求遇到网络错误或 5xx 时按带抖动的指数退避快速重试，
+认证失败时刷新 Token 后重试一次，平台持续故障时熔断。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import config
+import resilience
+import telemetry
+import tracing
+
+# 可以安全重发的请求方法
+IDEMPOTENT_METHODS = ("GET", "HEAD", "DELETE")
+# 最多记录多少个 (地址, error_key) 的最近错误类别，超过时丢弃最旧的
+MAX_TRACKED_ERRORS = 1024
+
+
+class _TracedHTTPConnection(HTTPConnection):
+    def connect(self):
+        # 新建连接的 DNS + TCP 耗时
+        with tracing.span("http.connect", host=self.host):
+            super().connect()
+
+
+class _TracedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # 新建连接的 DNS + TCP + TLS 握手耗时
+        with tracing.span("http.connect", host=self.host, tls=True):
+            super().connect()
+
+
+class _TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TracedHTTPConnection
+
+
+class _TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TracedHTTPSConnection
+
+
+class StarlightClient:
+    """带连接池的 HTTP 客户端"""
+
+    def __init__(self, pool_size=None, connect_timeout=None, read_timeout=None):
+        """
+        初始化客户端
+
+        Args:
+            pool_size: 每个主机保持的连接数，默认 config.HTTP_POOL_SIZE
+            connect_timeout: 建立连接（含 TLS 握手）超时（秒），默认 config.HTTP_CONNECT_TIMEOUT
+            read_timeout: 等待响应超时（秒），默认 config.HTTP_READ_TIMEOUT
+        """
+        self.pool_size = pool_size or config.HTTP_POOL_SIZE
+        self.timeout = (
+            connect_timeout or config.HTTP_CONNECT_TIMEOUT,
+            read_timeout or config.HTTP_READ_TIMEOUT,
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        adapter.poolmanager.pool_classes_by_scheme = {
+            "http": _TracedHTTPConnectionPool,
+            "https": _TracedHTTPSConnectionPool,
+        }
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self.retried = 0
+        self.breaker = resilience.CircuitBreaker()
+        self.max_retries = config.HTTP_MAX_RETRIES
+        # 认证失败时调用 auth_handler(失效的 Token)，返回新 Token（由 monitor 注册）
+        self.auth_handler = None
+        self._errors = OrderedDict()  # (url, error_key) -> 最近一次失败的错误类别
+
+    def last_error(self, url, key=None):
+        """
+        该地址最近一次请求的错误类别（成功后清除），见 resilience.py
+
+        Args:
+            key: 发送请求时的 error_key；同一地址的不同请求（例如同时查询的多个指标）分别记录
+        """
+        with self._lock:
+            return self._errors.get((url, key))
+
+    def _set_error(self, url, key, kind):
+        with self._lock:
+            if kind is None:
+                self._errors.pop((url, key), None)
+                return
+            self._errors[(url, key)] = kind
+            self._errors.move_to_end((url, key))
+            while len(self._errors) > MAX_TRACKED_ERRORS:
+                self._errors.popitem(last=False)
+
+    def note_api_error(self, url, code, key=None):
+        """记录 API 返回的错误码（HTTP 200 但 code 不是 200）"""
+        telemetry.API_ERRORS.inc(telemetry.endpoint_label(url), "api_code")
+        self._set_error(url, key, resilience.classify_api_code(code))
+
+    def request(self, method, url, error_key=None, retry=None, **kwargs):
+        """
+        发送请求
+
+        - 熔断中直接抛出 resilience.CircuitOpenError，不访问平台
+        - 幂等请求遇到 SSL EOF 等网络错误或 5xx/429 时，按带抖动的指数退避重试最多 max_retries 次
+          （出错的连接已被丢弃，重试会新建连接）
+        - 401/403 且请求带有 bihu-token 时，通过 auth_handler 刷新 Token 后重试一次
+
+        Args:
+            method: 请求方法
+            url: 请求地址
+            error_key: 区分同一地址的不同请求，失败时按 (url, error_key) 记录错误类别
+            retry: 是否在请求层快速重试，默认按请求方法判断（幂等请求重试）；
+                   由调用方自行重发的请求传 False，避免两层重试叠加
+            **kwargs: 传给 requests 的参数，未指定 timeout 时使用 (连接超时, 读取超时)
+
+        Returns:
+            requests.Response（重试后仍失败时返回最后一次的响应或抛出最后一次的异常）
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method.upper() in IDEMPOTENT_METHODS if retry is None else retry
+        attempt = 0
+        refreshed = False
+        while True:
+            if not self.breaker.allow():
+                self._set_error(url, error_key, resilience.CIRCUIT_OPEN)
+                telemetry.API_ERRORS.inc(telemetry.endpoint_label(url), resilience.CIRCUIT_OPEN)
+                raise resilience.CircuitOpenError(
+                    f"Starlight API 熔断中，{self.breaker.retry_in():.0f}s 后重试"
+                )
+            try:
+                response = self._timed(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.breaker.record_failure()
+                self._set_error(url, error_key, resilience.classify_exception(e))
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                reason = e
+            else:
+                kind = resilience.classify_status(response.status_code)
+                if kind == resilience.SERVER:
+                    self.breaker.record_failure()
+                else:
+                    # 4xx 也说明平台可以访问
+                    self.breaker.record_success()
+                self._set_error(url, error_key, kind)
+                if kind is None:
+                    return response
+                headers = kwargs.get("headers") or {}
+                if (kind == resilience.AUTH and not refreshed and self.auth_handler is not None
+                        and headers.get("bihu-token")):
+                    refreshed = True
+                    token = self.auth_handler(headers["bihu-token"])
+                    if token:
+                        response.close()
+                        kwargs["headers"] = {**headers, "bihu-token": token}
+                        continue
+                if kind != resilience.SERVER or not idempotent or attempt >= self.max_retries:
+                    return response
+                response.close()
+                reason = f"HTTP {response.status_code}"
+            delay = resilience.backoff_delay(attempt, config.HTTP_RETRY_BASE, config.HTTP_RETRY_MAX_DELAY)
+            attempt += 1
+            with self._lock:
+                self.retried += 1
+            telemetry.API_RETRIES.inc(telemetry.endpoint_label(url))
+            print(f"⚠️ 请求失败（{reason}），{delay:.1f}s 后第 {attempt} 次重试")
+            time.sleep(delay)
+
+    def _timed(self, method, url, **kwargs):
+        """发送一次请求并记录耗时和错误类型（stream=True 时耗时只到收到响应头）"""
+        endpoint = telemetry.endpoint_label(url)
+        start = time.perf_counter()
+        try:
+            with tracing.span("http", method=method.upper(), endpoint=endpoint) as span:
+                response = self.session.request(method, url, **kwargs)
+                span.set(status=response.status_code)
+        except requests.exceptions.SSLError:
+            telemetry.API_ERRORS.inc(endpoint, "ssl")
+            raise
+        except requests.exceptions.Timeout:
+            telemetry.API_ERRORS.inc(endpoint, "timeout")
+            raise
+        except requests.exceptions.ConnectionError:
+            telemetry.API_ERRORS.inc(endpoint, "connection")
+            raise
+        finally:
+            telemetry.API_LATENCY.observe(endpoint, method.upper(), value=time.perf_counter() - start)
+        if response.status_code >= 400:
+            telemetry.API_ERRORS.inc(endpoint, "http")
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def stats(self):
+        """
+        连接复用统计
+
+        Returns:
+            dict: requests 请求总数, connections 新建连接（握手）数,
+                  reused 复用连接的请求数, retried 因网络错误或 5xx 重试的次数,
+                  circuit_opened 熔断次数
+        """
+        requests_count = connections = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    requests_count += pool.num_requests
+                    connections += pool.num_connections
+        return {
+            "requests": requests_count,
+            "connections": connections,
+            "reused": requests_count - connections,
+            "retried": self.retried,
+            "circuit_opened": self.breaker.opened,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """所有 API 调用共用的客户端"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = StarlightClient()
+    return _client
@@ -0,0 +1,275 @@
+"""
+闲置检测 - 用最近一个时间窗口内的全部采样（而不只是最后一个点）判断任务是否闲置
+
+每个任务、指标、设备保存一个时间窗口的采样，用 NumPy 计算窗口统计量
+（最大值、分位数、平均值、低于阈值的时间占比），再交给可组合的闲置策略判断。
+多卡任务只有所有设备都闲置才算闲置。
+"""
+from collections import deque
+
+import numpy as np
+
+import config
+
+
+def window_stats(values, threshold):
+    """
+    计算一个窗口的统计量
+
+    Args:
+        values: 采样值数组
+        threshold: 闲置阈值
+
+    Returns:
+        dict: max / mean / p50 / p90 / fraction_below / count
+    """
+    values = np.asarray(values, dtype=np.float64)
+    p50, p90 = np.percentile(values, [50, 90])
+    return {
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "fraction_below": float(np.count_nonzero(values < threshold)) / values.size,
+        "count": int(values.size),
+    }
+
+
+class IdlePolicy:
+    """闲置策略基类：根据某个指标每个设备的窗口采样判断是否闲置"""
+
+    name = "base"
+
+    def __init__(self, metric="gpu_memory", threshold=None):
+        """
+        Args:
+            metric: 指标名称
+            threshold: 闲置阈值，默认 config.IDLE_THRESHOLD_MB
+        """
+        self.metric = metric
+        self.threshold = config.IDLE_THRESHOLD_MB if threshold is None else threshold
+
+    @property
+    def metrics(self):
+        return {self.metric}
+
+    def device_idle(self, values):
+        raise NotImplementedError
+
+    def is_idle(self, windows):
+        """
+        Args:
+            windows: {metric: {device: np.ndarray}}
+
+        Returns:
+            bool: 所有设备都闲置返回 True；没有该指标的数据返回 None（无法判断）
+        """
+        devices = windows.get(self.metric)
+        if not devices:
+            return None
+        return all(self.device_idle(values) for values in devices.values())
+
+
+class MaxBelowPolicy(IdlePolicy):
+    """窗口内最大值低于阈值"""
+
+    name = "max"
+
+    def device_idle(self, values):
+        return values.max() < self.threshold
+
+
+class MeanBelowPolicy(IdlePolicy):
+    """窗口内平均值低于阈值"""
+
+    name = "mean"
+
+    def device_idle(self, values):
+        return values.mean() < self.threshold
+
+
+class PercentileBelowPolicy(IdlePolicy):
+    """窗口内 q 分位数低于阈值（忽略少量尖峰）"""
+
+    name = "percentile"
+
+    def __init__(self, metric="gpu_memory", threshold=None, q=90):
+        super().__init__(metric, threshold)
+        self.q = q
+
+    def device_idle(self, values):
+        return np.percentile(values, self.q) < self.threshold
+
+
+class FractionBelowPolicy(IdlePolicy):
+    """窗口内低于阈值的采样占比不小于 fraction"""
+
+    name = "fraction"
+
+    def __init__(self, metric="gpu_memory", threshold=None, fraction=0.9):
+        super().__init__(metric, threshold)
+        self.fraction = fraction
+
+    def device_idle(self, values):
+        return np.count_nonzero(values < self.threshold) >= self.fraction * values.size
+
+
+class AllOf(IdlePolicy):
+    """所有子策略都判定闲置才算闲置（例如显存和利用率都很低）"""
+
+    name = "all"
+
+    def __init__(self, policies):
+        self.policies = list(policies)
+
+    @property
+    def metrics(self):
+        return set().union(*(p.metrics for p in self.policies))
+
+    def is_idle(self, windows):
+        results = [p.is_idle(windows) for p in self.policies]
+        if any(r is False for r in results):
+            return False
+        if any(r is None for r in results):
+            return None
+        return True
+
+
+class AnyOf(AllOf):
+    """
+    任一子策略判定闲置即算闲置（例如显存没释放但利用率长期为 0）
+
+    无法判断的子策略（指标没有数据或采样不足）不参与判断；全部无法判断时返回 None。
+    """
+
+    name = "any"
+
+    def is_idle(self, windows):
+        results = [r for r in (p.is_idle(windows) for p in self.policies) if r is not None]
+        if not results:
+            return None
+        return any(results)
+
+
+POLICIES = {cls.name: cls for cls in (MaxBelowPolicy, MeanBelowPolicy, PercentileBelowPolicy, FractionBelowPolicy)}
+
+
+def register_policy(cls):
+    """注册自定义策略（cls.name 作为配置中的 policy 名称）"""
+    POLICIES[cls.name] = cls
+    return cls
+
+
+def build_policy(spec):
+    """
+    从配置构建策略
+
+    Args:
+        spec: dict，例如 {"policy": "fraction", "metric": "gpu_util", "threshold": 5, "fraction": 0.9}；
+              列表表示 AllOf；{"any": [...]} 表示 AnyOf
+
+    Returns:
+        IdlePolicy
+    """
+    if isinstance(spec, IdlePolicy):
+        return spec
+    if isinstance(spec, (list, tuple)):
+        policies = [build_policy(s) for s in spec]
+        return policies[0] if len(policies) == 1 else AllOf(policies)
+    if "any" in spec:
+        return AnyOf([build_policy(s) for s in spec["any"]])
+    params = dict(spec)
+    return POLICIES[params.pop("policy")](**params)
+
+
+class IdleDetector:
+    """保存每个任务的采样窗口，并按策略判断是否闲置"""
+
+    def __init__(self, policy=None, window_seconds=None, min_samples=None):
+        """
+        Args:
+            policy: 闲置策略或其配置，默认 config.IDLE_POLICIES
+            window_seconds: 窗口长度（秒），默认 config.IDLE_WINDOW_SECONDS
+            min_samples: 每个设备至少需要的采样数，不足时无法判断，默认 config.IDLE_MIN_SAMPLES
+        """
+        self.policy = build_policy(config.IDLE_POLICIES if policy is None else policy)
+        self.window_seconds = window_seconds or config.IDLE_WINDOW_SECONDS
+        self.min_samples = min_samples or config.IDLE_MIN_SAMPLES
+        self._windows = {}  # job_id -> {metric: {device: deque[(timestamp, value)]}}
+
+    @property
+    def metrics(self):
+        """策略需要的指标"""
+        return self.policy.metrics
+
+    def add(self, job_id, metric, points):
+        """
+        加入新采样
+
+        Args:
+            points: [(device, timestamp, value), ...]
+        """
+        devices = self._windows.setdefault(job_id, {}).setdefault(metric, {})
+        for device, ts, value in points:
+            devices.setdefault(device, deque()).append((ts, value))
+
+    def windows(self, job_id):
+        """
+        裁剪过期采样后返回窗口数组
+
+        Returns:
+            dict: {metric: {device: np.ndarray}}，采样不足 min_samples 的设备不包含在内
+        """
+        result = {}
+        for metric, devices in self._windows.get(job_id, {}).items():
+            newest = max((d[-1][0] for d in devices.values() if d), default=None)
+            if newest is None:
+                continue
+            cutoff = newest - self.window_seconds
+            arrays = {}
+            for device, window in devices.items():
+                while window and window[0][0] < cutoff:
+                    window.popleft()
+                if len(window) >= self.min_samples:
+                    arrays[device] = np.fromiter((v for _, v in window), dtype=np.float64, count=len(window))
+            if arrays:
+                result[metric] = arrays
+        return result
+
+    def series(self, job_id, metric="gpu_memory"):
+        """
+        某个指标各设备窗口内的采样（时间顺序）
+
+        Returns:
+            dict: {device: [(timestamp, value), ...]}
+        """
+        return {device: list(window) for device, window in self._windows.get(job_id, {}).get(metric, {}).items()
+                if window}
+
+    def evaluate(self, job_id):
+        """
+        判断任务是否闲置
+
+        Returns:
+            tuple: (闲置 True/False，无法判断时为 None, {metric: 各设备窗口统计})
+        """
+        windows = self.windows(job_id)
+        stats = {
+            metric: {device: window_stats(values, self.policy_threshold(metric)) for device, values in devices.items()}
+            for metric, devices in windows.items()
+        }
+        return self.policy.is_idle(windows), stats
+
+    def policy_threshold(self, metric):
+        """统计 fraction_below 时使用的阈值（取策略中该指标的阈值）"""
+        stack = [self.policy]
+        while stack:
+            policy = stack.pop()
+            if isinstance(policy, AllOf):
+                stack.extend(policy.policies)
+            elif policy.metric == metric:
+                return policy.threshold
+        return config.IDLE_THRESHOLD_MB
+
+    def forget(self, job_id):
+        self._windows.pop(job_id, None)
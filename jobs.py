@@ -0,0 +1,77 @@
+"""
+任务描述 - 多任务监控时每个任务的标识与 API 地址
+"""
+import re
+import config
+
+ASSIGN_PATTERN = re.compile(r"Successfully assigned .*/(\S+) to (\S+)")
+
+
+class Job:
+    """单个 Starlight 任务（Pod + 节点 + 任务ID）"""
+
+    def __init__(self, job_id, pod_name, node_name, cluster=None):
+        """
+        初始化任务
+
+        Args:
+            job_id: 任务ID（Pod 名去掉最后一段后缀）
+            pod_name: Pod 名称
+            node_name: 节点名称 (例如: an21)
+            cluster: 集群名称，默认使用 config.CLUSTER
+        """
+        self.job_id = job_id
+        self.pod_name = pod_name
+        self.node_name = node_name
+        self.cluster = cluster or config.CLUSTER
+
+    @classmethod
+    def from_log(cls, log, cluster=None):
+        """
+        从 "Successfully assigned <ns>/<pod> to <node>" 日志解析任务
+
+        Returns:
+            Job: 解析成功返回任务，否则返回 None
+        """
+        match = ASSIGN_PATTERN.search(log)
+        if not match:
+            return None
+        pod_name = match.group(1)
+        return cls(pod_name.rpartition('-')[0], pod_name, match.group(2), cluster)
+
+    @property
+    def status_url(self):
+        return f"{config.JOB_LIST_URL}/{self.cluster}/{self.job_id}"
+
+    @property
+    def delete_url(self):
+        return f"{config.JOB_LIST_URL}/{self.cluster}/{self.job_id}"
+
+    def __repr__(self):
+        return f"Job({self.job_id!r}, pod={self.pod_name!r}, node={self.node_name!r})"
+
+
+def default_job():
+    """config.py 中单任务配置对应的任务（兼容 monitor.main）"""
+    return Job(config.JOB_ID, config.POD_NAME, config.NODE_NAME, config.CLUSTER)
+
+
+def load_jobs(logs=None):
+    """
+    从日志列表解析所有任务，忽略无法解析的行和重复任务
+
+    Args:
+        logs: 日志列表，默认使用 config.JOB_LOGS
+    """
+    jobs = []
+    seen = set()
+    for line in (config.JOB_LOGS if logs is None else logs):
+        job = Job.from_log(line)
+        if job is None:
+            print(f"⚠️ 无法解析任务日志: {line}")
+            continue
+        if job.job_id in seen:
+            continue
+        seen.add(job.job_id)
+        jobs.append(job)
+    return jobs
@@ -0,0 +1,182 @@
+"""
+节点级指标缓存 - 同一节点上的多个任务共用一次指标查询
+
+缓存键为 (集群, 节点, 指标, 时间桶)，时间桶长度为 METRIC_CACHE_TTL 秒：同一时间桶内
+同一节点只请求一次，查询包含该节点上所有已登记的 Pod（register() 登记、forget() 取消，
+引擎在任务的监控结束时取消登记），之后其他任务的查询直接按 Pod 取出各自的设备条目。
+
+- 命中：条目未过期且包含所需的全部 Pod
+- 合并：同一节点的查询正在进行中（其他线程发出），等待其结果而不是重复请求
+- 未命中：与其他未命中的节点合并为一次批量请求，结果按节点写入缓存
+
+条目在时间桶结束时过期（按时间桶顺序记录在队列中，写入时只检查队首）；超过 METRIC_CACHE_SIZE 个条目时淘汰最久未使用的条目。
+命中/未命中/合并/淘汰次数通过 stats() 和 /metrics（monitor_metric_cache_total）查看，
+命中率过低说明 TTL 相对 CHECK_INTERVAL 太短，过高则说明同一份数据被重复判断。
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+import config
+import telemetry
+
+# 计数器属性 -> /metrics 中的 result 标签
+_RESULTS = {"hits": "hit", "misses": "miss", "coalesced": "coalesced", "evictions": "eviction"}
+
+
+class _Flight:
+    """进行中的一次节点查询"""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.pods = {job.pod_name for job in jobs}
+        self.result = None
+        self.done = threading.Event()
+
+
+class MetricCache:
+    """按节点缓存 spec.device 条目（线程安全，引擎的多个线程共用）"""
+
+    def __init__(self, ttl=None, max_entries=None, wait_timeout=None):
+        """
+        Args:
+            ttl: 时间桶长度（秒），默认 config.METRIC_CACHE_TTL；0 表示不缓存
+            max_entries: 条目数上限，默认 config.METRIC_CACHE_SIZE
+            wait_timeout: 等待其他线程查询结果的最长时间（秒），默认 config.API_CALL_TIMEOUT
+        """
+        self.ttl = config.METRIC_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or config.METRIC_CACHE_SIZE
+        self.wait_timeout = wait_timeout or config.API_CALL_TIMEOUT
+        self._entries = OrderedDict()  # key -> (过期时间, {pod_name: [device, ...]})
+        self._expiry = deque()  # (过期时间, key)，按写入顺序即时间桶顺序
+        self._flights = {}  # key -> _Flight
+        self._nodes = {}  # (cluster, node) -> {pod_name: job}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _key(self, job, metric, now):
+        return job.cluster, job.node_name, metric, int(now // self.ttl)
+
+    def register(self, jobs):
+        """登记任务：之后对其所在节点的查询会一并获取它的数据"""
+        with self._lock:
+            for job in jobs:
+                self._nodes.setdefault((job.cluster, job.node_name), {})[job.pod_name] = job
+
+    def forget(self, job):
+        """任务结束后取消登记"""
+        with self._lock:
+            pods = self._nodes.get((job.cluster, job.node_name), {})
+            pods.pop(job.pod_name, None)
+            if not pods:
+                self._nodes.pop((job.cluster, job.node_name), None)
+
+    def _count(self, metric, result, n=1):
+        setattr(self, result, getattr(self, result) + n)
+        telemetry.METRIC_CACHE.inc(metric, _RESULTS[result], amount=n)
+
+    def _put(self, key, devices, now):
+        """写入条目（与同一时间桶中已缓存的其他 Pod 合并），并淘汰过期和超出上限的条目（调用方持有锁）"""
+        entry = self._entries.get(key)
+        expires = (key[3] + 1) * self.ttl
+        if entry is not None:
+            devices = {**entry[1], **devices}
+        else:
+            self._expiry.append((expires, key))
+        self._entries[key] = (expires, devices)
+        self._entries.move_to_end(key)
+        # 时间桶只增不减，过期的条目都在队首（已被按上限淘汰的条目在这里跳过）
+        while self._expiry and self._expiry[0][0] <= now:
+            self._entries.pop(self._expiry.popleft()[1], None)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._count(key[2], "evictions")
+
+    def get_many(self, jobs, metric, fetch):
+        """
+        获取多个任务的设备条目，同一节点只查询一次
+
+        Args:
+            jobs: jobs.Job 列表
+            metric: 指标名称
+            fetch: fetch(jobs) -> {pod_name: [device, ...] 或 None}，一次批量查询未命中的任务
+
+        Returns:
+            dict: {job_id: [device, ...]}，查询失败的任务为 None
+        """
+        if self.ttl <= 0:
+            by_pod = fetch(jobs)
+            return {job.job_id: by_pod.get(job.pod_name) for job in jobs}
+
+        now = time.time()
+        groups = {}
+        for job in jobs:
+            groups.setdefault(self._key(job, metric, now), []).append(job)
+
+        result = {}
+        waiting = []
+        flights = {}
+        with self._lock:
+            for key, group in groups.items():
+                # 只读取已登记的 Pod，不把本次查询的任务登记进去：任务结束后不再出现在查询中
+                peers = {**self._nodes.get(key[:2], {}), **{job.pod_name: job for job in group}}
+                pods = {job.pod_name for job in group}
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now and pods <= entry[1].keys():
+                    self._entries.move_to_end(key)
+                    self._count(metric, "hits", len(group))
+                    result.update({job.job_id: entry[1][job.pod_name] for job in group})
+                    continue
+                flight = self._flights.get(key)
+                if flight is not None and pods <= flight.pods:
+                    self._count(metric, "coalesced", len(group))
+                    waiting.append((flight, group))
+                    continue
+                self._count(metric, "misses", len(group))
+                flights[key] = self._flights[key] = _Flight(list(peers.values()))
+
+        if flights:
+            missed = [job for flight in flights.values() for job in flight.jobs]
+            by_pod = {}
+            try:
+                by_pod = fetch(missed)
+            finally:
+                now = time.time()
+                with self._lock:
+                    for key, flight in flights.items():
+                        devices = {pod: by_pod.get(pod) for pod in flight.pods}
+                        if all(value is not None for value in devices.values()):
+                            flight.result = devices
+                            self._put(key, devices, now)
+                        if self._flights.get(key) is flight:
+                            del self._flights[key]
+                        flight.done.set()
+            for key in flights:
+                result.update({job.job_id: by_pod.get(job.pod_name) for job in groups[key]})
+
+        for flight, group in waiting:
+            flight.done.wait(self.wait_timeout)
+            devices = flight.result or {}
+            result.update({job.job_id: devices.get(job.pod_name) for job in group})
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._expiry.clear()
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
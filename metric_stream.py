@@ -0,0 +1,212 @@
+"""
+指标响应流式解析 - 分块读取 METRIC_URL 的响应，每个设备只保留最后 keep 个数据点
+
+完整 response.json() 会为窗口内的每个数据点创建 Python 对象，而轮询只需要
+每个设备最新的几个点。这里逐块解析：data 以外的字段（code、info、设备的 pod/device 等）
+正常解析；data 数组只用正则查找数组结尾，丢弃已读过的旧数据点，最后只解析末尾 keep 个点。
+内存占用与窗口长度无关（不超过一个分块加 keep 个数据点）。
+
+返回值与 response.json() 结构相同，只是 data 被截短，调用方无需修改。
+"""
+import codecs
+import json
+import re
+
+import config
+
+# JSON 词法单元：标点 / 字符串 / 数字 / 字面量
+TOKEN = re.compile(
+    r'[ \t\n\r]*(?:([{}\[\],:])|"((?:[^"\\]|\\.)*)"|(-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?)|(true|false|null))'
+)
+SPACE = re.compile(r'[ \t\n\r]*')
+# data 数组的结尾：最后一个数据点的 "]" 加上数组的 "]"（数据点内不含方括号）
+DATA_END = re.compile(r'\][ \t\n\r]*\]')
+LITERALS = {"true": True, "false": False, "null": None}
+NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+class MetricStreamParser:
+    """增量解析指标响应"""
+
+    def __init__(self, keep=1, data_key="data", parent_key="device"):
+        """
+        Args:
+            keep: 每个设备保留的最后数据点个数，None 表示全部保留
+            data_key: 数据点数组的字段名
+            parent_key: 设备列表的字段名（只截短该列表中设备的 data）
+        """
+        self.keep = keep
+        self.data_key = data_key
+        self.parent_key = parent_key
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._frames = []  # [容器, 等待值的键, 容器在父级中的键]
+        self._in_data = False
+        self._done = False
+        self.result = None
+
+    def feed(self, chunk):
+        """加入一块响应数据（bytes 或 str）"""
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        self._parse(final=False)
+
+    def close(self):
+        """
+        结束输入
+
+        Returns:
+            解析结果（与 json.loads 结构相同）
+
+        Raises:
+            ValueError: 响应不是完整的 JSON
+        """
+        self._buf = self._buf[self._pos:] + self._decoder.decode(b"", final=True)
+        self._pos = 0
+        self._parse(final=True)
+        if not self._done or self._buf[SPACE.match(self._buf, self._pos).end():]:
+            raise ValueError("Incomplete or invalid JSON in metric response")
+        return self.result
+
+    def _add(self, value):
+        if not self._frames:
+            self.result = value
+            self._done = True
+            return
+        frame = self._frames[-1]
+        container = frame[0]
+        if isinstance(container, list):
+            container.append(value)
+        else:
+            container[frame[1]] = value
+            frame[1] = None
+
+    def _is_data_array(self):
+        """当前位置是否为设备列表中某个设备的 data 数组"""
+        if len(self._frames) < 2:
+            return False
+        frame, parent = self._frames[-1], self._frames[-2]
+        return (isinstance(frame[0], dict) and frame[1] == self.data_key
+                and isinstance(parent[0], list) and parent[2] == self.parent_key)
+
+    def _tail_start(self, start, end):
+        """[start, end) 中倒数第 keep 个数据点的起始位置（不足 keep 个时返回 start）"""
+        index = end
+        for _ in range(self.keep):
+            found = self._buf.rfind("[", start, index)
+            if found < 0:
+                return start
+            index = found
+        return index
+
+    def _parse_data(self, final):
+        """
+        data 数组（已读过 "["）：查找数组结尾，只解析最后 keep 个数据点
+
+        Returns:
+            bool: 数组已结束返回 True，需要更多数据返回 False
+        """
+        buf = self._buf
+        pos = SPACE.match(buf, self._pos).end()
+        if pos >= len(buf):
+            return False
+        if buf[pos] == "]":
+            self._pos = pos + 1
+            self._add([])
+            return True
+        match = DATA_END.search(buf, pos)
+        if match is None:
+            if self.keep is not None:
+                # 丢弃更早的数据点，保留最后 keep 个完整点和未读完的点
+                end = buf.rfind("[", pos)
+                self._pos = self._tail_start(pos, end) if end > pos else pos
+            if final:
+                raise ValueError("Unterminated data array in metric response")
+            return False
+        end = match.start() + 1
+        start = pos if self.keep is None else self._tail_start(pos, end)
+        self._add(json.loads(f"[{buf[start:end]}]"))
+        self._pos = match.end()
+        return True
+
+    def _parse(self, final):
+        buf = self._buf
+        while not self._done:
+            if self._in_data:
+                if not self._parse_data(final):
+                    return
+                self._in_data = False
+                continue
+            match = TOKEN.match(buf, self._pos)
+            if match is None or (not final and match.group(3) is not None
+                                 and (match.end() == len(buf) or buf[match.end()] in NUMBER_CHARS)):
+                # 词法单元不完整（数字可能被截断，例如 "25." 或 "1e"），等待下一块
+                if final and buf[SPACE.match(buf, self._pos).end():]:
+                    raise ValueError(f"Invalid JSON at offset {self._pos} in metric response")
+                return
+            self._pos = match.end()
+            punct, string, number, literal = match.groups()
+            if punct in ("{", "["):
+                if punct == "[" and self._is_data_array():
+                    self._in_data = True
+                    continue
+                name = None
+                if self._frames:
+                    frame = self._frames[-1]
+                    name = frame[1] if isinstance(frame[0], dict) else None
+                self._frames.append([{} if punct == "{" else [], None, name])
+            elif punct in ("}", "]"):
+                container = self._frames.pop()[0]
+                self._add(container)
+            elif punct is not None:
+                continue  # "," 和 ":"
+            elif string is not None:
+                value = json.loads(f'"{string}"') if "\\" in string else string
+                frame = self._frames[-1] if self._frames else None
+                if frame is not None and isinstance(frame[0], dict) and frame[1] is None:
+                    frame[1] = value
+                else:
+                    self._add(value)
+            elif number is not None:
+                self._add(float(number) if any(c in number for c in ".eE") else int(number))
+            else:
+                self._add(LITERALS[literal])
+
+
+def parse_metric_stream(chunks, keep=1):
+    """
+    解析分块的指标响应
+
+    Args:
+        chunks: bytes/str 分块的可迭代对象
+        keep: 每个设备保留的最后数据点个数，None 表示全部保留
+
+    Returns:
+        dict: 与 json.loads 结构相同，每个设备的 data 只有最后 keep 个点
+    """
+    parser = MetricStreamParser(keep)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def read_metric_response(response, keep=1):
+    """
+    读取并解析 stream=True 发出的请求的响应；未启用 METRIC_STREAMING 时使用 response.json()
+
+    Args:
+        response: requests.Response
+        keep: 每个设备保留的最后数据点个数
+
+    Returns:
+        dict: 解析后的响应
+    """
+    if not config.METRIC_STREAMING:
+        return response.json()
+    try:
+        return parse_metric_stream(response.iter_content(config.METRIC_STREAM_CHUNK), keep)
+    finally:
+        response.close()
@@ -0,0 +1,300 @@
+"""
+显存指标获取 - 一次 METRIC_URL 请求查询多个 Pod/节点
+
+每个设备记录已见过的最新时间戳（高水位），下次只请求更新的数据点。
+"""
+import requests
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+
+import config
+import monitor
+import tracing
+from http_client import get_client
+from metric_stream import read_metric_response
+
+# 设备条目中可能标识 Pod 的字段
+POD_KEYS = ("pod", "pod_name", "podName", "pod_id")
+# 设备条目中可能标识设备的字段
+DEVICE_KEYS = ("device", "gpu", "uuid", "name", "index")
+
+
+def chunked(items, size):
+    """按 size 切分列表"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def device_pod(dev, pod_names):
+    """
+    找出设备条目属于哪个 Pod
+
+    Args:
+        dev: spec.device 中的一个条目
+        pod_names: 本次请求的 Pod 名称集合
+
+    Returns:
+        str: Pod 名称，无法判断时返回 None
+    """
+    for key in POD_KEYS:
+        if dev.get(key) in pod_names:
+            return dev[key]
+    values = [value for value in dev.values() if isinstance(value, str)]
+    # 字段名未知时，先找与 Pod 名完全相同的字符串字段
+    for value in values:
+        if value in pod_names:
+            return value
+    # 再在字符串字段（例如 instance）中查找包含的 Pod 名；按长度从长到短、再按名称排序，
+    # 结果不依赖集合的遍历顺序，且 "train-1" 与 "train-10" 同时出现时取更长的 "train-10"
+    for pod in sorted(pod_names, key=lambda name: (-len(name), name)):
+        if any(pod in value for value in values):
+            return pod
+    return None
+
+
+def parse_timestamp(value):
+    """把数据点时间戳（秒/毫秒数值或 ISO 字符串）转换为 UTC 秒"""
+    try:
+        ts = float(value)
+        return ts / 1000 if ts > 1e11 else ts
+    except (TypeError, ValueError):
+        pass
+    dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def device_key(dev, index):
+    """设备在所属 Pod 内的标识"""
+    for key in DEVICE_KEYS:
+        if dev.get(key) is not None:
+            return str(dev[key])
+    return str(index)
+
+
+class Watermarks:
+    """
+    记录每个设备已见过的最新数据点（高水位）
+
+    查询起点取本批任务中最旧的高水位；没有记录（刚启动）或间隔超过
+    查询窗口时退回完整窗口。
+    """
+
+    def __init__(self, window_minutes=None):
+        """
+        Args:
+            window_minutes: 完整查询窗口（分钟），默认 config.METRIC_WINDOW_MINUTES
+        """
+        self.window = timedelta(minutes=window_minutes or config.METRIC_WINDOW_MINUTES)
+        self._marks = {}  # (pod, metric) -> {device: (timestamp, value)}
+
+    def window_start(self, jobs, now, metric="gpu_memory"):
+        """
+        计算本次查询的起始时间
+
+        Args:
+            jobs: 本次查询的任务
+            now: 当前时间（带时区的 datetime）
+            metric: 指标名称
+        """
+        earliest = now - self.window
+        marks = []
+        for job in jobs:
+            devices = self._marks.get((job.pod_name, metric))
+            if not devices:
+                return earliest
+            marks.append(min(ts for ts, _ in devices.values()))
+        start = datetime.fromtimestamp(min(marks), timezone.utc)
+        return max(start, earliest)
+
+    def update(self, pod_name, devices, now, metric="gpu_memory"):
+        """
+        合并新数据点，丢弃不比高水位新的点
+
+        Returns:
+            list: 新数据点 [(device, timestamp, value), ...]
+        """
+        known = self._marks.setdefault((pod_name, metric), {})
+        new_points = []
+        for index, dev in enumerate(devices):
+            key = device_key(dev, index)
+            mark = known.get(key)
+            for point in dev.get("data", []):
+                ts = parse_timestamp(point[0])
+                if mark is None or ts > mark[0]:
+                    mark = (ts, float(point[1]))
+                    new_points.append((key, ts, mark[1]))
+            if mark is not None:
+                known[key] = mark
+        # 超过查询窗口仍没有新数据的设备视为已消失
+        cutoff = (now - self.window).timestamp()
+        for key in [k for k, (ts, _) in known.items() if ts < cutoff]:
+            del known[key]
+        return new_points
+
+    def latest(self, pod_name, metric="gpu_memory"):
+        """各设备最新值的最大值，没有记录返回 None"""
+        devices = self._marks.get((pod_name, metric))
+        if not devices:
+            return None
+        return max(value for _, value in devices.values())
+
+    def forget(self, pod_name):
+        """任务结束后清除记录"""
+        for key in [key for key in self._marks if key[0] == pod_name]:
+            del self._marks[key]
+
+
+# 引擎与批量查询共用的高水位记录
+watermarks = Watermarks()
+
+
+@tracing.traced("api.metric_batch")
+def query_metric(jobs, metric="gpu_memory", start=None, now=None):
+    """
+    一次请求查询多个任务的指标
+
+    Args:
+        jobs: jobs.Job 列表
+        metric: 指标名称
+        start: 查询起始时间（带时区的 datetime），默认 now 之前一个完整窗口
+        now: 查询结束时间（带时区的 datetime），默认当前时间
+
+    Returns:
+        list: spec.device 列表；请求失败返回 None
+    """
+    now = now or datetime.now(timezone.utc)
+    start = start or now - timedelta(minutes=config.METRIC_WINDOW_MINUTES)
+    params = {
+        "node_list": ",".join(sorted({job.node_name for job in jobs})),
+        "pod_list": ",".join(job.pod_name for job in jobs),
+        "metric": metric,
+        "start": monitor.utc_iso(start),
+        "end": monitor.utc_iso(now),
+        "limit": "10",
+        "cluster_name": jobs[0].cluster,
+        "job_name": ",".join(job.job_id for job in jobs),
+        "job_id": ",".join(job.job_id for job in jobs),
+    }
+    try:
+        response = get_client().get(
+            config.METRIC_URL, params=params, headers=monitor.HEADERS, verify=False, stream=True, error_key=metric
+        )
+        with tracing.span("parse", endpoint="metric", jobs=len(jobs)):
+            res_json = read_metric_response(response, keep=int(params["limit"]))
+        if res_json.get("code") != 200:
+            get_client().note_api_error(config.METRIC_URL, res_json.get("code"), metric)
+            print(f"API error: {res_json.get('info')}")
+            return None
+        return res_json.get("spec", {}).get("device", [])
+
+    except requests.exceptions.SSLError as e:
+        print(f"❌ SSL连接错误: {e}")
+        return None
+
+    except Exception as e:
+        print(f"Request data exception: {e}")
+        return None
+
+
+def split_devices(jobs, devices):
+    """
+    把 spec.device 条目分配回各任务
+
+    Returns:
+        tuple: ({job_id: [device, ...]}, 无法确定所属 Pod 的设备数)
+    """
+    by_pod = {job.pod_name: job.job_id for job in jobs}
+    result = {job.job_id: [] for job in jobs}
+    unassigned = 0
+    for dev in devices:
+        if len(jobs) == 1:
+            pod = jobs[0].pod_name
+        else:
+            pod = device_pod(dev, by_pod)
+        if pod is None:
+            print(f"⚠️ 无法确定设备所属的 Pod: {dev.get('name', dev.get('device'))}")
+            unassigned += 1
+            continue
+        result[by_pod[pod]].append(dev)
+    return result, unassigned
+
+
+def fetch_devices(jobs, metric="gpu_memory", batch_size=None, marks=None):
+    """
+    批量查询多个任务的设备条目，每批最多 batch_size 个同一集群的 Pod 共用一次请求
+    （请求只能指定一个 cluster_name）；只请求各设备高水位之后的数据点
+
+    Returns:
+        dict: {pod_name: [device, ...]}，请求失败的 Pod 为 None
+    """
+    batch_size = batch_size or config.METRIC_BATCH_SIZE
+    marks = watermarks if marks is None else marks
+    # 同一节点的 Pod 尽量放在同一批，节点级缓存才能整体写入
+    jobs = sorted(jobs, key=lambda job: (job.cluster, job.node_name))
+    chunks = [chunk for _, group in groupby(jobs, key=lambda job: job.cluster)
+              for chunk in chunked(list(group), batch_size)]
+    by_pod = {}
+    for chunk in chunks:
+        now = datetime.now(timezone.utc)
+        devices = query_metric(chunk, metric, start=marks.window_start(chunk, now, metric), now=now)
+        if devices is None:
+            by_pod.update({job.pod_name: None for job in chunk})
+            continue
+        by_job, unassigned = split_devices(chunk, devices)
+        by_pod.update({job.pod_name: by_job[job.job_id] for job in chunk})
+        if unassigned:
+            # 有设备无法分配时，没有分到设备的任务改为单独查询（只有一个 Pod，无需分配），
+            # 避免这些任务一直读不到数据而无法监控
+            for job in chunk:
+                if not by_job[job.job_id]:
+                    by_pod[job.pod_name] = query_metric(
+                        [job], metric, start=marks.window_start([job], now, metric), now=now
+                    )
+    return by_pod
+
+
+def fetch_metric_batch(jobs, metric="gpu_memory", batch_size=None, marks=None, store=None, cache=None):
+    """
+    批量获取多个任务的指标
+
+    Args:
+        jobs: jobs.Job 列表
+        metric: 指标名称
+        batch_size: 每次请求的 Pod 数上限，默认 config.METRIC_BATCH_SIZE
+        marks: 高水位记录，默认使用模块级 watermarks
+        store: 保存新采样的 sample_store.SampleStore（可选）
+        cache: metric_cache.MetricCache（可选）；设置后同一节点在一个时间桶内只查询一次
+
+    Returns:
+        dict: {job_id: {"latest": 各设备最新值的最大值, "points": [(device, timestamp, value), ...]}}，
+              请求失败或没有数据的任务为 None
+    """
+    marks = watermarks if marks is None else marks
+    jobs = list(jobs)
+    if cache is not None:
+        by_job = cache.get_many(jobs, metric, lambda missed: fetch_devices(missed, metric, batch_size, marks))
+    else:
+        by_pod = fetch_devices(jobs, metric, batch_size, marks)
+        by_job = {job.job_id: by_pod.get(job.pod_name) for job in jobs}
+    now = datetime.now(timezone.utc)
+    readings = {}
+    samples = []
+    for job in jobs:
+        devices = by_job.get(job.job_id)
+        if devices is None:
+            readings[job.job_id] = None
+            continue
+        points = marks.update(job.pod_name, devices, now, metric)
+        samples.extend((job.job_id, device, metric, ts, value) for device, ts, value in points)
+        latest = marks.latest(job.pod_name, metric)
+        if latest is None:
+            print(f"Can't find {metric} data for job {job.job_id}.")
+            readings[job.job_id] = None
+        else:
+            readings[job.job_id] = {"latest": latest, "points": points}
+    if store is not None and samples:
+        store.append_many(samples)
+    return readings
+
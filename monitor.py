@@ -1,46 +1,75 @@
 import time
 import requests
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from notifier import NotificationManager
-from get_token import get_bihu_token
+from get_token import get_cached_token
+from jobs import default_job
+from http_client import get_client
+from metric_stream import read_metric_response
+from checkpoint import CheckpointStore
+from changepoint import CrashDetector, PollWindow
 import config
+import resilience
+import telemetry
+import tracing
 
 # 全局 HEADERS，将在 main 中初始化和更新
 HEADERS = {}
 
 def update_headers(token):
-    """更新全局 HEADERS"""
+    """更新全局 HEADERS，并在请求认证失败时自动刷新 Token"""
     global HEADERS
+    get_client().auth_handler = refresh_on_auth_error
     HEADERS = {
         "bihu-token": token,
         "user-agent": config.USER_AGENT,
         "accept": "application/json, text/plain, */*"
     }
 
-def get_current_gpu_memory():
-    """从 API 获取最新的显存占用值"""
+def refresh_on_auth_error(stale_token):
+    """请求返回 401/403 时由 http_client 调用：刷新 Token（多个请求同时失败只登录一次）"""
+    with tracing.span("token.refresh", reason="auth"):
+        token = get_cached_token(stale_token=stale_token)
+    if token:
+        update_headers(token)
+    return token
+
+def utc_iso(dt):
+    """UTC 时间转换为接口使用的 ISO 格式（以 Z 结尾）"""
+    return dt.astimezone(timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+@tracing.traced("api.metric")
+def get_current_metric(metric="gpu_memory", job=None):
+    """从 API 获取某个指标的最新值，多卡时取各设备的最大值（job 为空时使用 config 中的任务）"""
+    job = job or default_job()
     # 动态生成最近一小时的时间范围（API要求）
-    now = datetime.utcnow()
-    start_time = (now - timedelta(minutes=60)).isoformat() + "Z"
-    end_time = now.isoformat() + "Z"
+    now = datetime.now(timezone.utc)
+    start_time = utc_iso(now - timedelta(minutes=60))
+    end_time = utc_iso(now)
 
     params = {
-        "node_list": config.NODE_NAME,
-        "pod_list": config.POD_NAME,
-        "metric": "gpu_memory",
+        "node_list": job.node_name,
+        "pod_list": job.pod_name,
+        "metric": metric,
         "start": start_time,
         "end": end_time,
         "limit": "10", # 我们只需要最新的几个点
-        "cluster_name": config.CLUSTER,
-        "job_name": config.JOB_ID,
-        "job_id": config.JOB_ID
+        "cluster_name": job.cluster,
+        "job_name": job.job_id,
+        "job_id": job.job_id
     }
 
     try:
-        response = requests.get(config.METRIC_URL, params=params, headers=HEADERS, timeout=15, verify=False)
-        res_json = response.json()
+        response = get_client().get(
+            config.METRIC_URL, params=params, headers=HEADERS, verify=False, stream=True, error_key=metric
+        )
+        # 只需要每个设备最后一个数据点，不解析整个窗口
+        with tracing.span("parse", endpoint="metric"):
+            res_json = read_metric_response(response, keep=1)
         
         if res_json.get("code") != 200:
+            get_client().note_api_error(config.METRIC_URL, res_json.get("code"), metric)
             print(f"API error: {res_json.get('info')}")
             return None
 
@@ -48,7 +77,7 @@ def get_current_gpu_memory():
         devices = res_json.get("spec", {}).get("device", [])
         if not devices:
             print(res_json)
-            print("Can't find device data in response.")
+            print(f"Can't find {metric} device data in response.")
             return None
 
         max_usage = 0
@@ -70,13 +99,42 @@ def get_current_gpu_memory():
         print(f"Request data exception: {e}")
         return None
 
-def get_job_status():
+def get_current_gpu_memory(job=None):
+    """从 API 获取最新的显存占用值（job 为空时使用 config 中的任务）"""
+    return get_current_metric("gpu_memory", job)
+
+def get_current_metrics(metrics=None, job=None):
+    """
+    并发获取多个指标，合并为一个快照
+
+    每个指标一次请求，同时发出，一轮轮询的耗时约等于最慢的一个指标。
+    与引擎相同，只请求各设备高水位之后的数据点（metrics.watermarks），
+    刚启动或间隔过长时退回完整窗口。
+
+    Args:
+        metrics: 指标名称列表，默认 config.POLL_METRICS（总是包含 gpu_memory）
+
+    Returns:
+        dict: {metric: {"latest": 各设备最新值的最大值, "points": 新采样}}，获取失败的指标为 None
+    """
+    # metrics 模块依赖本模块的 HEADERS，在这里导入避免循环导入
+    from metrics import fetch_metric_batch
+    job = job or default_job()
+    metrics = list(dict.fromkeys(["gpu_memory", *(metrics or config.POLL_METRICS)]))
+    with ThreadPoolExecutor(len(metrics), thread_name_prefix="metric") as pool:
+        readings = pool.map(lambda metric: fetch_metric_batch([job], metric)[job.job_id], metrics)
+        return dict(zip(metrics, readings))
+
+@tracing.traced("api.job_status")
+def get_job_status(job=None):
     """从 API 获取任务状态（spec.status）"""
+    job = job or default_job()
     try:
-        response = requests.get(config.JOB_STATUS_URL, headers=HEADERS, timeout=15, verify=False)
+        response = get_client().get(job.status_url, headers=HEADERS, verify=False)
         res_json = response.json()
 
         if "code" in res_json and res_json.get("code") != 200:
+            get_client().note_api_error(job.status_url, res_json.get("code"))
             print(f"Job status API error: {res_json.get('info')}")
             return None
 
@@ -100,20 +158,113 @@ def get_job_status():
         return None
     
 
-def stop_job():
-    """Send DELETE request to stop the job"""
-    print(f"\n[{datetime.now()}] !!! Triggering auto shutdown command !!!")
+def _deadline_kwargs(deadline):
+    """确认关闭期间的请求参数：读取超时不超过截止前的剩余时间（至少 STOP_POLL_INTERVAL 秒）"""
+    if deadline is None:
+        return {}
+    remaining = max(deadline - time.monotonic(), config.STOP_POLL_INTERVAL)
+    return {"timeout": (config.HTTP_CONNECT_TIMEOUT, min(config.HTTP_READ_TIMEOUT, remaining))}
+
+def delete_job(job=None, deadline=None):
+    """
+    发送一次 DELETE 请求
+
+    关闭请求的重发由调用方（stop_job / bulk_stop.stop_jobs）负责，这里传 retry=False
+    关闭 http_client 的请求层重试；重复发送是安全的（任务已不存在时返回 404）。
+
+    Args:
+        deadline: 确认关闭的截止时间（time.monotonic()），请求不会明显超过它
+
+    Returns:
+        str: "sent" 平台已受理，"gone" 任务已不存在；发送失败返回 None
+    """
+    job = job or default_job()
     try:
-        res = requests.delete(config.DELETE_URL, headers=HEADERS, timeout=15)
+        res = get_client().delete(job.delete_url, headers=HEADERS, verify=False, retry=False,
+                                  **_deadline_kwargs(deadline))
         if res.status_code == 200:
-            print(">>> Platform confirmed job shutdown, billing stopped.")
-            return True
-        else:
-            print(f">>> Shutdown failed: {res.status_code} {res.text}")
+            return "sent"
+        if res.status_code == 404:
+            return "gone"
+        print(f">>> Shutdown failed: {res.status_code} {res.text}")
     except Exception as e:
         print(f">>> Command send exception: {e}")
+    return None
+
+def job_exists(job=None, deadline=None):
+    """
+    查询任务是否仍在运行中/排队（用于确认关闭）
+
+    Args:
+        deadline: 确认关闭的截止时间（time.monotonic()）；指定时不在请求层重试（由确认循环
+                  重新查询），读取超时不超过剩余时间，一次查询不会拖过截止时间
+
+    Returns:
+        bool: True 仍存在，False 已不存在；无法确定（请求失败等）返回 None
+    """
+    job = job or default_job()
+    kwargs = {} if deadline is None else {"retry": False, **_deadline_kwargs(deadline)}
+    try:
+        response = get_client().get(job.status_url, headers=HEADERS, verify=False, **kwargs)
+        if response.status_code == 404:
+            return False
+        res_json = response.json()
+        code = res_json.get("code")
+        if code == 404:
+            return False
+        if code is not None and code != 200:
+            get_client().note_api_error(job.status_url, code)
+            print(f"Job status API error: {res_json.get('info')}")
+            return None
+        return True
+    except Exception as e:
+        print(f"Request job status exception: {e}")
+        return None
+
+@tracing.traced("api.stop_job")
+def stop_job(job=None, timeout=None):
+    """
+    Send DELETE request to stop the job, then poll its status until it is gone
+
+    只有查询确认任务已不存在才返回 True；DELETE 失败时在确认期间重发。
+    请求都不在请求层重试且不超过截止时间，最长耗时见 stop_call_timeout()。
+
+    Args:
+        job: 要关闭的任务，默认 config 中的任务
+        timeout: 等待确认的最长时间（秒），默认 config.STOP_CONFIRM_TIMEOUT
+    """
+    job = job or default_job()
+    if timeout is None:
+        timeout = config.STOP_CONFIRM_TIMEOUT
+    deadline = time.monotonic() + timeout
+    print(f"\n[{datetime.now()}] !!! Triggering auto shutdown command: {job.job_id} !!!")
+    sent = delete_job(job, deadline)
+    while True:
+        if job_exists(job, deadline) is False:
+            print(">>> Platform confirmed job shutdown, billing stopped.")
+            telemetry.SHUTDOWNS.inc("success")
+            return True
+        if time.monotonic() + config.STOP_POLL_INTERVAL > deadline:
+            break
+        time.sleep(config.STOP_POLL_INTERVAL)
+        if sent is None:
+            sent = delete_job(job, deadline)
+    if sent is None:
+        print(">>> Shutdown request was not accepted.")
+    else:
+        print(f">>> Job shutdown not confirmed within {timeout}s, job is still listed.")
+    telemetry.SHUTDOWNS.inc("failure")
     return False
 
+def stop_call_timeout(timeout=None):
+    """
+    stop_job() 的最长耗时（秒）：确认时间，加上截止前最后一次 DELETE 和状态查询各自的
+    最长耗时（连接超时 + 读取超时）；在线程池中等待关闭时用作超时
+    """
+    if timeout is None:
+        timeout = config.STOP_CONFIRM_TIMEOUT
+    return timeout + 2 * (config.HTTP_CONNECT_TIMEOUT + config.HTTP_READ_TIMEOUT)
+
 def setup_notifications():
     """配置通知管理器"""
     notif_mgr = NotificationManager()
@@ -123,7 +274,7 @@ def setup_notifications():
         notif_mgr.add_email_notifier(
             config.SMTP_SERVER, config.SMTP_PORT, 
             config.SENDER_EMAIL, config.SENDER_PASSWORD, 
-            config.RECEIVER_EMAIL
+            config.RECEIVER_EMAIL, config.SMTP_IDLE_TIMEOUT
         )
     
     # 添加Server酱通知
@@ -134,34 +285,73 @@ def setup_notifications():
     if config.ENABLE_DINGTALK and config.DINGTALK_WEBHOOK:
         notif_mgr.add_dingtalk_notifier(config.DINGTALK_WEBHOOK, config.DINGTALK_SECRET or None)
     
+    # 合并窗口内的通知并按通知方式限流（钉钉机器人每分钟约 20 条）
+    if config.NOTIFY_COALESCE_WINDOW and notif_mgr.notifiers:
+        notif_mgr.enable_coalescing(
+            config.NOTIFY_COALESCE_WINDOW, config.NOTIFY_RATE_LIMITS,
+            char_limits=config.NOTIFY_DIGEST_MAX_CHARS,
+            max_entries=config.NOTIFY_DIGEST_MAX_ENTRIES,
+            max_attempts=config.NOTIFY_MAX_ATTEMPTS,
+        )
+    
+    # 后台发送，避免慢的 SMTP/钉钉请求拖慢检测和关闭
+    if config.NOTIFY_ASYNC and notif_mgr.notifiers:
+        notif_mgr.start_dispatcher(config.NOTIFY_WORKERS, config.NOTIFY_QUEUE_SIZE, config.NOTIFY_TIMEOUT)
+    
     return notif_mgr
 
-def send_notification(notif_mgr, title, message):
-    """发送通知（如果配置了通知方式）"""
+@tracing.traced("notify.send_all")
+def send_notification(notif_mgr, title, message, wait=False, urgent=False):
+    """发送通知（如果配置了通知方式）；urgent 的消息不等待合并窗口，优先发送"""
     if notif_mgr.notifiers:
-        notif_mgr.send_all(title, message)
+        notif_mgr.send_all(title, message, wait=wait, urgent=urgent)
 
-def connection_retry(notif_mgr):
-    fail_counter = 1
-    MAX_FAIL_COUNT = 2
-    while True:
-        print(f"Can't get data. Failure count: {fail_counter}/{MAX_FAIL_COUNT}")
-        if fail_counter > MAX_FAIL_COUNT:
-            print("Too many consecutive failures. Exiting.")
-            send_notification(
-                notif_mgr,
-                "❌ GPU监控异常退出",
-                f"任务ID: {config.JOB_ID}\n"
-                f"原因: 连续获取数据失败超过 {MAX_FAIL_COUNT} 次\n"
-                f"停止时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"请检查网络或Token有效性"
-            )
-            return -1
+def connection_retry(notif_mgr, retry_state, url, key=None):
+    """
+    获取数据失败后的处理：按错误类别决定是否刷新 Token，按退避时间等待后重试
+
+    网络错误和 5xx 已由 http_client 快速重试过，这里按带抖动的指数退避继续等待（熔断中
+    等到下一次探测）；只有连续的永久性错误（任务不存在等）超过 MAX_FAIL_COUNT 次，或故障
+    持续超过 MAX_OUTAGE 秒才退出。
+
+    Args:
+        notif_mgr: 通知管理器
+        retry_state: resilience.RetryState
+        url: 失败的请求地址（用于取得错误类别）
+        key: 失败请求的 error_key（指标查询为指标名称）
+
+    Returns:
+        int: 0 继续监控，-1 退出
+    """
+    client = get_client()
+    kind = client.last_error(url, key) or resilience.TRANSIENT
+    delay = retry_state.failure(kind)
+    print(f"Can't get data ({kind}). Failure count: {retry_state.failures}")
+    if retry_state.exhausted():
+        print("Too many consecutive failures. Exiting.")
+        if retry_state.permanent > config.MAX_FAIL_COUNT:
+            reason = f"连续 {retry_state.permanent} 次请求错误（{kind}），任务可能已不存在"
+        else:
+            reason = f"平台持续 {retry_state.outage / 60:.0f} 分钟无法访问"
+        send_notification(
+            notif_mgr,
+            "❌ GPU监控异常退出",
+            f"任务ID: {config.JOB_ID}\n"
+            f"原因: {reason}\n"
+            f"停止时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"请检查网络或Token有效性",
+            wait=True
+        )
+        return -1
 
+    if kind == resilience.AUTH:
+        # http_client 刷新 Token 后仍认证失败（或刷新失败），重新登录
         print("Attempting to refresh token...")
-        # 自动重新获取 Token 并重试
         try:
-            token = get_bihu_token()
+            with tracing.span("token.refresh"):
+                token = get_cached_token(stale_token=HEADERS.get("bihu-token"))
+            if not token:
+                raise RuntimeError("login failed")
             update_headers(token)
             print("Token refreshed successfully.")
             return 0
@@ -175,28 +365,73 @@ def connection_retry(notif_mgr):
                 f"错误: {str(e)}\n"
                 f"监控程序仍在运行，将重试..."
             )
-            fail_counter += 1
-        # 继续循环，会先 sleep 再重试
-        time.sleep(120)
+
+    delay = max(delay, client.breaker.retry_in())
+    print(f"Retry in {delay:.1f}s")
+    time.sleep(delay)
+    return 0
+
+def save_checkpoint(checkpoints, idle_counter, last_status, warned_at=None, grace=None):
+    """保存单任务监控的状态（未启用检查点时不做任何事）"""
+    if checkpoints is not None:
+        try:
+            checkpoints.save(config.JOB_ID, {
+                "idle_counter": idle_counter, "last_status": last_status, "warned_at": warned_at,
+                "grace": grace,
+            })
+        except OSError as e:
+            print(f"Failed to save checkpoint: {e}")
 
 def main():
+    # NumPy 只在单任务监控真正启动时导入，不影响 import monitor 的耗时
+    from idle_detect import IdleDetector
+    from scheduler import AdaptiveScheduler
     idle_counter = 0
     
     last_status = None
+    warned_at = None
+    grace = config.SHUTDOWN_GRACE
+    retry_state = resilience.RetryState()
+    # 进程退出检测：每次轮询的 (时间, 显存) 读数
+    crash_detector = CrashDetector() if config.CRASH_DETECT else None
+    crash_window = PollWindow()
+    crash = None
+    # 与引擎相同的窗口闲置检测（IDLE_POLICIES）
+    detector = IdleDetector()
+    poll_metrics = sorted({"gpu_memory", *config.POLL_METRICS} | detector.metrics)
+    # 排队/繁忙时逐渐拉长检查间隔，接近闲置或倒计时中缩短
+    scheduler = AdaptiveScheduler()
     print(f"Starting monitoring job: {config.JOB_ID}")
     print(f"Criteria: GPU memory < {config.IDLE_THRESHOLD_MB}MB for {config.MAX_IDLE_COUNT} consecutive checks")
+    if "gpu_util" in detector.metrics:
+        print(f"          or GPU utilization < {config.IDLE_UTIL_PERCENT}% for most of the window")
     
+    telemetry.start_server()
+    tracing.install_profiler()
+
+    # 从检查点恢复重启前的状态
+    checkpoints = CheckpointStore() if config.CHECKPOINT_DIR else None
+    state = checkpoints.load(config.JOB_ID) if checkpoints is not None else None
+    if state:
+        idle_counter = state.get("idle_counter", 0)
+        last_status = state.get("last_status")
+        warned_at = state.get("warned_at")
+        grace = state.get("grace") or config.SHUTDOWN_GRACE
+        print(f"Resumed from checkpoint: status {last_status} | Counter: {idle_counter}/{config.MAX_IDLE_COUNT}")
+    resumed = last_status == 2
+
     # 初始化 Token 和 Headers
     print("Initializing token...")
-    token = get_bihu_token()
+    token = get_cached_token()
     update_headers(token)
 
     # 初始化通知管理器
     notif_mgr = setup_notifications()
     
-    while True:
+    while not resumed:
         status = get_job_status()
         if status is not None:
+            retry_state.success()
             if last_status == 0 and status == 2:  # 任务开始运行
                 send_notification(
                     notif_mgr,
@@ -206,8 +441,11 @@ def main():
                     f"Pod: {config.POD_NAME}\n"
                     f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
                 )
+                save_checkpoint(checkpoints, idle_counter, status)
                 return
             elif last_status == None and status == 2: # 一开始就是运行中
+                last_status = status
+                save_checkpoint(checkpoints, idle_counter, last_status)
                 break
             elif last_status == None and status == 0:
                 send_notification(
@@ -219,54 +457,102 @@ def main():
                     f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
                 )
             last_status = status
-            time.sleep(120)
+            save_checkpoint(checkpoints, idle_counter, last_status)
+            time.sleep(scheduler.queued_delay(config.JOB_ID))
         else:
-            return_code = connection_retry(notif_mgr)
+            return_code = connection_retry(notif_mgr, retry_state, default_job().status_url)
             if return_code == -1:
-                break
+                return
 
 
-    # 发送监控启动通知
-    send_notification(
-        notif_mgr,
-        "🚀 GPU自动关闭监控已启动",
-        f"任务ID: {config.JOB_ID}\n"
-        f"节点: {config.NODE_NAME}\n"
-        f"Pod: {config.POD_NAME}\n"
-        f"闲置阈值: GPU显存 < {config.IDLE_THRESHOLD_MB}MB\n"
-        f"触发条件: 连续闲置{config.MAX_IDLE_COUNT}次（约{config.MAX_IDLE_COUNT * config.CHECK_INTERVAL // 60}分钟）\n"
-        f"检查间隔: {config.CHECK_INTERVAL}秒\n"
-        f"启动时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-    )
+    # 发送监控启动通知（从检查点恢复时已经发送过）
+    if not resumed:
+        send_notification(
+            notif_mgr,
+            "🚀 GPU自动关闭监控已启动",
+            f"任务ID: {config.JOB_ID}\n"
+            f"节点: {config.NODE_NAME}\n"
+            f"Pod: {config.POD_NAME}\n"
+            f"闲置阈值: GPU显存 < {config.IDLE_THRESHOLD_MB}MB\n"
+            f"触发条件: 连续闲置{config.MAX_IDLE_COUNT}次（约{config.MAX_IDLE_COUNT * config.CHECK_INTERVAL // 60}分钟）\n"
+            f"检查间隔: {config.CHECK_INTERVAL}秒\n"
+            f"启动时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+
+    # 重启前已在关闭倒计时中：继续剩余的倒计时
+    if idle_counter >= config.MAX_IDLE_COUNT and warned_at:
+        print(f"Shutdown countdown resumed: {max(grace - (time.time() - warned_at), 0):.0f}s left")
 
     while True:
-        usage = get_current_gpu_memory()
+        snapshot = get_current_metrics(poll_metrics)
+        usage = snapshot["gpu_memory"] and snapshot["gpu_memory"]["latest"]
         if usage is not None:
-            fail_counter = 0
-            if usage < config.IDLE_THRESHOLD_MB:
+            retry_state.success()
+            if crash_detector is not None:
+                crash_window.add(time.time(), usage)
+                crashed, confidence, result = crash_detector.crashed(crash_window.series())
+                if crashed:
+                    crash = result
+                elif usage >= config.CRASH_LOW_MB:
+                    # 判定为进程退出后保持该判定，直到显存重新升高（变点滑出窗口后不会再检出）
+                    crash = None
+            # 用窗口内的全部采样判断（单个噪声点不会重置计数或触发关闭）
+            for metric, result in snapshot.items():
+                if result is not None:
+                    detector.add(config.JOB_ID, metric, result["points"])
+            idle, _ = detector.evaluate(config.JOB_ID)
+            windowed = idle is not None
+            if idle is None:
+                # 所有策略都没有足够的采样时才按最新值判断
+                idle = usage < config.IDLE_THRESHOLD_MB
+            util = snapshot.get("gpu_util") and snapshot["gpu_util"]["latest"]
+            reading = f"{usage} MB" if util is None else f"{usage} MB, util {util:.0f}%"
+            if idle or crash is not None:
+                if (crash is not None or windowed) and idle_counter < config.MAX_IDLE_COUNT - 1:
+                    # 窗口已覆盖连续的采样，或显存断崖下降并保持低位（训练进程已退出），不必等满闲置计数
+                    idle_counter = config.MAX_IDLE_COUNT - 1
                 idle_counter += 1
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] Status: Idle ({usage} MB) | Counter: {idle_counter}/{config.MAX_IDLE_COUNT}")
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Status: Idle ({reading}) | Counter: {idle_counter}/{config.MAX_IDLE_COUNT}")
             else:
                 if idle_counter > 0:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Status: Active ({usage} MB) | Counter reset to 0")
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Status: Active ({reading}) | Counter reset to 0")
                 idle_counter = 0
+                warned_at = None
+            telemetry.GPU_MEMORY.set(config.JOB_ID, value=usage)
+            telemetry.IDLE_COUNTER.set(config.JOB_ID, value=idle_counter)
+            if idle_counter == config.MAX_IDLE_COUNT:
+                warned_at = round(time.time())
+                grace = config.CRASH_SHUTDOWN_GRACE if crash is not None else config.SHUTDOWN_GRACE
+            save_checkpoint(checkpoints, idle_counter, last_status, warned_at, grace)
             
             if idle_counter == config.MAX_IDLE_COUNT:
+                if crash is not None:
+                    reason = (f"显存从 {crash['before']:.0f} MB 骤降至 {crash['after']:.0f} MB 并保持 "
+                              f"{crash['held']:.0f}s，训练进程可能已退出（置信度 {crash['confidence']:.2f}）")
+                else:
+                    reason = f"GPU连续闲置{config.MAX_IDLE_COUNT}次"
                 # 发送任务即将关闭通知
                 send_notification(
                     notif_mgr,
                     "⚠️ GPU任务即将自动关闭",
                     f"任务ID: {config.JOB_ID}\n"
                     f"节点: {config.NODE_NAME}\n"
-                    f"原因: GPU连续闲置{config.MAX_IDLE_COUNT}次\n"
+                    f"原因: {reason}\n"
                     f"当前显存: {usage} MB\n"
                     f"触发时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                    f"2min后将会自动关闭任务，请及时检查bug"
+                    f"{grace // 60}min后将会自动关闭任务，请及时检查bug"
                 )
-                time.sleep(120)
-                
+
             elif idle_counter > config.MAX_IDLE_COUNT:
-                if stop_job():
+                # 倒计时期间继续检查（间隔更短），恢复使用则取消
+                if crash is not None and grace > config.CRASH_SHUTDOWN_GRACE:
+                    print(f"Process exit detected (confidence {crash['confidence']:.2f}), shorten countdown")
+                    grace = config.CRASH_SHUTDOWN_GRACE
+                    save_checkpoint(checkpoints, idle_counter, last_status, warned_at, grace)
+                remaining = grace - (time.time() - (warned_at or 0))
+                if remaining > 0:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] Shutdown in {remaining:.0f}s unless GPU becomes active")
+                elif stop_job():
                     # 发送任务已关闭通知
                     send_notification(
                         notif_mgr,
@@ -275,8 +561,12 @@ def main():
                         f"节点: {config.NODE_NAME}\n"
                         f"Pod: {config.POD_NAME}\n"
                         f"关闭时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                        f"计费已停止"
+                        f"计费已停止",
+                        wait=True,
+                        urgent=True
                     )
+                    if checkpoints is not None:
+                        checkpoints.discard(config.JOB_ID)
                     break
                 else:
                     # 发送关闭失败通知
@@ -285,16 +575,16 @@ def main():
                         "❌ GPU任务关闭失败",
                         f"任务ID: {config.JOB_ID}\n"
                         f"失败时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                        f"请手动检查并关闭任务"
+                        f"请手动检查并关闭任务",
+                        urgent=True
                     )
         else:
-            return_code = connection_retry(notif_mgr)
+            return_code = connection_retry(notif_mgr, retry_state, config.METRIC_URL, "gpu_memory")
             if return_code == -1:
                 break
+            continue  # 已按退避时间等待过
 
-            
-
-        time.sleep(config.CHECK_INTERVAL)
+        time.sleep(scheduler.running_delay(config.JOB_ID, usage, urgent=idle_counter > 0))
 
 if __name__ == "__main__":
     main()
@@ -1,17 +1,25 @@
 """
 通知模块 - 支持邮件和手机提醒
+
+smtplib / email 只在使用邮件通知时才导入，只开启钉钉等通知时不增加启动时间。
 """
-import smtplib
+import atexit
+import itertools
+import queue
+import re
+import threading
+import time
 import requests
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 
+import telemetry
+import tracing
+
 
 class EmailNotifier:
-    """邮件通知器"""
+    """邮件通知器 - 保持已登录的 SMTP 连接，多封邮件复用同一连接"""
     
-    def __init__(self, smtp_server, smtp_port, sender_email, sender_password, receiver_email):
+    def __init__(self, smtp_server, smtp_port, sender_email, sender_password, receiver_email, idle_timeout=60):
         """
         初始化邮件通知器
         
@@ -21,12 +29,78 @@ class EmailNotifier:
             sender_email: 发件人邮箱
             sender_password: 发件人密码或授权码
             receiver_email: 收件人邮箱
+            idle_timeout: 连接空闲多少秒后关闭
         """
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
         self.sender_email = sender_email
         self.sender_password = sender_password
         self.receiver_email = receiver_email
+        self.idle_timeout = idle_timeout
+        self.logins = 0
+        self._server = None
+        self._idle_timer = None
+        self._lock = threading.Lock()
+    
+    def _build_message(self, subject, message):
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
+
+        # 创建邮件对象
+        msg = MIMEMultipart()
+        msg['From'] = self.sender_email
+        msg['To'] = self.receiver_email
+        msg['Subject'] = subject
+        
+        # 添加邮件正文
+        msg.attach(MIMEText(message, 'plain', 'utf-8'))
+        return msg
+    
+    def _connect(self):
+        """返回可用的 SMTP 连接：已有连接用 NOOP 检查，失效则重新连接并登录"""
+        import smtplib
+
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._close()
+        server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port, timeout=30)
+        try:
+            server.login(self.sender_email, self.sender_password)
+        except Exception:
+            server.close()
+            raise
+        self.logins += 1
+        self._server = server
+        return server
+    
+    def _close(self):
+        import smtplib
+
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                # 连接已断开时 quit() 不会关闭套接字
+                self._server.close()
+            self._server = None
+    
+    def _schedule_idle_close(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+        self._idle_timer = threading.Timer(self.idle_timeout, self.close)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+    
+    def close(self):
+        """关闭 SMTP 连接"""
+        with self._lock:
+            self._close()
     
     def send(self, subject, message):
         """
@@ -39,27 +113,48 @@ class EmailNotifier:
         Returns:
             bool: 是否发送成功
         """
-        try:
-            # 创建邮件对象
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email
-            msg['To'] = self.receiver_email
-            msg['Subject'] = subject
-            
-            # 添加邮件正文
-            msg.attach(MIMEText(message, 'plain', 'utf-8'))
-            
-            # 连接SMTP服务器并发送
-            with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port) as server:
-                server.login(self.sender_email, self.sender_password)
-                server.send_message(msg)
-            
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ 邮件发送成功: {self.receiver_email}")
-            return True
-            
-        except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ 邮件发送失败: {e}")
-            return False
+        return self.send_many([(subject, message)]) == 1
+    
+    def send_many(self, messages):
+        """
+        通过同一个 SMTP 连接发送多封邮件；连接断开时关闭旧连接，重连并重试当前邮件
+        
+        登录失败（SMTPAuthenticationError）和收件人被拒绝（SMTPRecipientsRefused）重连也无法解决，
+        直接抛出给调用方
+        
+        Args:
+            messages: [(邮件主题, 邮件内容), ...]
+        
+        Returns:
+            int: 发送成功的数量
+        """
+        import smtplib
+
+        sent = 0
+        with self._lock:
+            try:
+                for subject, message in messages:
+                    msg = self._build_message(subject, message)
+                    for attempt in range(2):
+                        try:
+                            self._connect().send_message(msg)
+                            print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ 邮件发送成功: {self.receiver_email}")
+                            sent += 1
+                            break
+                        except (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused):
+                            raise
+                        except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError) as e:
+                            # 连接被服务器关闭或超时，关闭后重连一次
+                            self._close()
+                            if attempt:
+                                print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ 邮件发送失败: {e}")
+                        except Exception as e:
+                            print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ 邮件发送失败: {e}")
+                            break
+            finally:
+                if self._server is not None:
+                    self._schedule_idle_close()
+        return sent
 
 
 class ServerChanNotifier:
@@ -173,15 +268,263 @@ class DingTalkNotifier:
             return False
 
 
+def timed_send(name, notifier, title, message):
+    """调用 notifier.send 并记录该通知方式的发送耗时和失败次数"""
+    start = time.perf_counter()
+    try:
+        with tracing.span("notify.channel", channel=name):
+            ok = notifier.send(title, message)
+    except Exception:
+        telemetry.NOTIFY_FAILURES.inc(name)
+        raise
+    finally:
+        telemetry.NOTIFY_LATENCY.observe(name, value=time.perf_counter() - start)
+    if ok is False:
+        telemetry.NOTIFY_FAILURES.inc(name)
+    return ok
+
+
+class TokenBucket:
+    """令牌桶限流器"""
+    
+    def __init__(self, rate_per_min, burst=None):
+        """
+        Args:
+            rate_per_min: 每分钟补充的令牌数
+            burst: 桶容量（允许的突发数量），默认为 rate_per_min 的 1/4（至少 1），
+                   第一分钟最多发出 burst + rate_per_min 条，而不是两倍的限额
+        """
+        self.rate = rate_per_min / 60.0
+        self.capacity = burst or max(1, rate_per_min // 4)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self):
+        """距离有可用令牌还需等待的秒数（0 表示现在可用）"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+    
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+# 去重时忽略消息中的时间（同一告警每次的时间不同）
+_TIME_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+
+
+class CoalescingNotifier:
+    """
+    合并通知 - 包装一个通知方式：窗口内的消息合并为一条摘要，相同告警去重，
+    并按令牌桶限制发送频率；紧急消息不等待合并窗口，排在普通消息之前发送，但同样消耗令牌
+
+    摘要按字符数和条数拆分，不超过通知方式的消息长度限制；发送失败的消息放回队首，
+    等待后重试，最多尝试 max_attempts 次。
+    """
+    
+    def __init__(self, name, notifier, window=10, rate_per_min=20, max_chars=4000, max_entries=20,
+                 max_attempts=3, retry_delay=None):
+        """
+        Args:
+            name: 通知方式名称
+            notifier: 被包装的通知器（需要有 send(title, content) 方法）
+            window: 合并窗口（秒）：第一条消息到达后等待多久再发送摘要
+            rate_per_min: 每分钟最多发送的消息数
+            max_chars: 一条摘要内容的最大字符数，超过时拆成多条（单条消息过长时截断）
+            max_entries: 一条摘要最多合并的消息数
+            max_attempts: 每条消息最多尝试发送的次数，仍失败则丢弃并计数
+            retry_delay: 发送失败后等待多久再重试（秒），默认等于合并窗口（至少 1 秒）
+        """
+        self.name = name
+        self.notifier = notifier
+        self.window = window
+        self.bucket = TokenBucket(rate_per_min)
+        self.max_chars = max_chars
+        self.max_entries = max_entries
+        self.max_attempts = max_attempts
+        self.retry_delay = max(window, 1) if retry_delay is None else retry_delay
+        self.sent = 0
+        self.merged = 0
+        self.deduped = 0
+        self.failed = 0
+        self.dropped = 0
+        self._pending = []  # [[title, message, 重复次数, 已尝试次数], ...]
+        self._urgent = []   # 同上，有令牌时立即发送
+        self._index = {}
+        self._first_at = None
+        self._retry_at = 0.0
+        self._closing = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f"coalesce-{name}", daemon=True)
+        self._thread.start()
+    
+    @staticmethod
+    def _dedupe_key(title, message):
+        return title, _TIME_PATTERN.sub("", message)
+    
+    def submit(self, messages):
+        """
+        提交消息
+        
+        Args:
+            messages: [(标题, 内容, 是否紧急), ...]
+        """
+        for title, message, urgent in messages:
+            with self._cond:
+                if urgent:
+                    self._urgent.append([title, message, 1, 0])
+                    self._cond.notify()
+                    continue
+                key = self._dedupe_key(title, message)
+                if key in self._index:
+                    self._index[key][2] += 1
+                    self.deduped += 1
+                    continue
+                entry = [title, message, 1, 0]
+                self._index[key] = entry
+                self._pending.append(entry)
+                if self._first_at is None:
+                    self._first_at = time.monotonic()
+                self._cond.notify()
+    
+    def send(self, title, message):
+        self.submit([(title, message, False)])
+        return True
+    
+    def _take(self, entries):
+        """从队首取出不超过摘要长度和条数上限的一组消息，至少一条（调用方持有锁）"""
+        size = 0
+        count = 0
+        for title, message, _, _ in entries:
+            size += len(title) + len(message) + 20  # 20: 小标题和分隔线
+            if count and (count >= self.max_entries or size > self.max_chars):
+                break
+            count += 1
+        taken = entries[:count]
+        del entries[:count]
+        return taken
+    
+    def _digest(self, entries):
+        """把多条消息合并为一条（标题, 内容）"""
+        def label(title, count):
+            return f"{title} (×{count})" if count > 1 else title
+        def clip(message):
+            if len(message) <= self.max_chars:
+                return message
+            return message[:self.max_chars] + "\n\n…（内容过长，已截断）"
+        if len(entries) == 1:
+            title, message, count, _ = entries[0]
+            return label(title, count), clip(message)
+        parts = [f"#### {label(title, count)}\n\n{message}" for title, message, count, _ in entries]
+        return f"📋 {len(entries)}条监控通知", "\n\n---\n\n".join(parts)
+    
+    def _requeue(self, entries, urgent):
+        """发送失败：未超过尝试次数的消息放回队首，retry_delay 秒后重试（调用方持有锁）"""
+        retry = []
+        for entry in entries:
+            entry[3] += 1
+            if entry[3] < self.max_attempts:
+                retry.append(entry)
+                continue
+            self.dropped += 1
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ {self.name}通知 {entry[3]} 次发送失败，已放弃: {entry[0]}")
+        if urgent:
+            self._urgent[:0] = retry
+        else:
+            for entry in retry:
+                # 失败期间又收到的相同告警合并到放回的消息中
+                key = self._dedupe_key(entry[0], entry[1])
+                duplicate = self._index.get(key)
+                if duplicate is not None:
+                    entry[2] += duplicate[2]
+                    self._pending.remove(duplicate)
+                self._index[key] = entry
+            self._pending[:0] = retry
+            if self._pending and self._first_at is None:
+                self._first_at = time.monotonic()
+        self._retry_at = time.monotonic() + self.retry_delay
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if now < self._retry_at and (self._urgent or self._pending):
+                        self._cond.wait(self._retry_at - now)
+                        continue
+                    if self._urgent:
+                        # 紧急消息先于普通消息使用令牌；等待期间到达的紧急消息合并为一条
+                        wait = self.bucket.wait_time()
+                        if wait > 0:
+                            self._cond.wait(wait)
+                            continue
+                        self.bucket.take()
+                        entries, urgent = self._take(self._urgent), True
+                        break
+                    if not self._pending:
+                        if self._closing:
+                            return
+                        self._cond.wait()
+                        continue
+                    due = self._first_at + self.window
+                    if now < due and not self._closing:
+                        self._cond.wait(due - now)
+                        continue
+                    # 没有令牌时继续积累，等有令牌后合并发送，不丢消息
+                    wait = self.bucket.wait_time()
+                    if wait > 0:
+                        self._cond.wait(wait)
+                        continue
+                    self.bucket.take()
+                    entries, urgent = self._take(self._pending), False
+                    for title, message, _, _ in entries:
+                        self._index.pop(self._dedupe_key(title, message), None)
+                    if not self._pending:
+                        self._first_at = None
+                    break
+            try:
+                ok = timed_send(self.name, self.notifier, *self._digest(entries))
+            except Exception as e:
+                ok = False
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ {self.name}通知异常: {e}")
+            with self._cond:
+                if ok is False:
+                    self.failed += 1
+                    self._requeue(entries, urgent)
+                else:
+                    self.sent += 1
+                    self.merged += len(entries) - 1
+    
+    def close(self, timeout=None):
+        """立即发送积累的消息（仍遵守限流）后停止"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        if hasattr(self.notifier, "close"):
+            self.notifier.close()
+
+
 class NotificationManager:
     """通知管理器 - 统一管理多种通知方式"""
     
     def __init__(self):
         self.notifiers = []
+        self.channel_timeout = None
+        self._queue = None
+        self._workers = []
+        self._seq = itertools.count()
     
-    def add_email_notifier(self, smtp_server, smtp_port, sender_email, sender_password, receiver_email):
+    def add_email_notifier(self, smtp_server, smtp_port, sender_email, sender_password, receiver_email, idle_timeout=60):
         """添加邮件通知"""
-        notifier = EmailNotifier(smtp_server, smtp_port, sender_email, sender_password, receiver_email)
+        notifier = EmailNotifier(smtp_server, smtp_port, sender_email, sender_password, receiver_email, idle_timeout)
         self.notifiers.append(('邮件', notifier))
         return self
     
@@ -197,18 +540,167 @@ class NotificationManager:
         self.notifiers.append(('钉钉', notifier))
         return self
     
-    def send_all(self, title, message):
+    def enable_coalescing(self, window=10, rate_limits=None, default_rate=20, char_limits=None,
+                          default_chars=4000, max_entries=20, max_attempts=3):
+        """
+        为每种通知方式启用合并、去重和限流（在添加通知方式之后调用）
+        
+        Args:
+            window: 合并窗口（秒）
+            rate_limits: {通知方式名称: 每分钟最多消息数}
+            default_rate: 未在 rate_limits 中列出的通知方式的限流
+            char_limits: {通知方式名称: 一条摘要的最大字符数}
+            default_chars: 未在 char_limits 中列出的通知方式的摘要长度上限
+            max_entries: 一条摘要最多合并的消息数
+            max_attempts: 每条消息最多尝试发送的次数
+        """
+        rate_limits = rate_limits or {}
+        char_limits = char_limits or {}
+        self.notifiers = [
+            (name, notifier if isinstance(notifier, CoalescingNotifier)
+             else CoalescingNotifier(name, notifier, window, rate_limits.get(name, default_rate),
+                                     char_limits.get(name, default_chars), max_entries, max_attempts))
+            for name, notifier in self.notifiers
+        ]
+        atexit.register(self.stop)
+        return self
+    
+    def start_dispatcher(self, workers=2, queue_size=100, channel_timeout=15):
+        """
+        启用后台发送：send_all 把消息按通知方式拆成发送任务放入队列，由固定数量的工作线程发送，
+        不同通知方式的任务由不同线程同时发送；紧急消息排在队列最前面
+        
+        Args:
+            workers: 工作线程数
+            queue_size: 队列长度上限（条消息）
+            channel_timeout: 队列已满时最多等待多久（秒），之后在当前线程直接发送
+        """
+        if self._queue is not None:
+            return self
+        self.channel_timeout = channel_timeout
+        # 队列元素为 (优先级, 序号, (通知方式名称, 通知器, 消息))，停止标记为 (2, 序号, None)
+        self._queue = queue.PriorityQueue(maxsize=queue_size * max(1, len(self.notifiers)))
+        for i in range(workers):
+            worker = threading.Thread(target=self._worker, name=f"notifier-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        # 退出前发送完队列中的消息，保证最后的通知不会丢失
+        atexit.register(self.stop)
+        return self
+    
+    def _worker(self, max_batch=10):
+        while True:
+            # 取出队列中已积压的任务，同一通知方式的消息一起发送（例如邮件可复用同一连接）；
+            # 其他通知方式的任务放回队列，由其他线程同时发送
+            batch = [self._queue.get()]
+            while batch[-1][2] is not None and len(batch) < max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            channel = batch[0][2] and batch[0][2][0]
+            by_channel = {}
+            for entry in batch:
+                if entry[2] is None:
+                    continue
+                name, notifier, item = entry[2]
+                if name != channel:
+                    try:
+                        self._queue.put_nowait(entry)
+                        continue
+                    except queue.Full:
+                        pass  # 放不回去时由本线程发送
+                by_channel.setdefault(name, (notifier, []))[1].append(item)
+            try:
+                for name, (notifier, messages) in by_channel.items():
+                    self._send_one(name, notifier, messages)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            # 停止标记优先级最低，且由 stop() 在队列清空后才放入
+            if batch[-1][2] is None:
+                return
+    
+    def _send_one(self, name, notifier, messages):
+        try:
+            if isinstance(notifier, CoalescingNotifier):
+                notifier.submit(messages)
+            elif hasattr(notifier, "send_many"):
+                start = time.perf_counter()
+                with tracing.span("notify.channel", channel=name, messages=len(messages)):
+                    sent = notifier.send_many([(title, message) for title, message, _ in messages])
+                telemetry.NOTIFY_LATENCY.observe(name, value=time.perf_counter() - start)
+                if sent < len(messages):
+                    telemetry.NOTIFY_FAILURES.inc(name, amount=len(messages) - sent)
+            else:
+                for title, message, _ in messages:
+                    timed_send(name, notifier, title, message)
+        except Exception as e:
+            telemetry.NOTIFY_FAILURES.inc(name)
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ {name}通知异常: {e}")
+    
+    def send_all(self, title, message, wait=False, urgent=False):
         """
         通过所有配置的通知方式发送消息
         
         Args:
             title: 消息标题
             message: 消息内容
+            wait: 启用后台发送时，是否等待发送完成
+            urgent: 紧急消息（例如任务已关闭）：排在发送队列最前面，不等待合并窗口（仍受限流）
         """
         if not self.notifiers:
             print("⚠️ 未配置任何通知方式")
             return
         
+        item = (title, message, urgent)
         print(f"\n📢 开始发送通知: {title}")
+        if self._queue is None:
+            for name, notifier in self.notifiers:
+                self._send_one(name, notifier, [item])
+            return
         for name, notifier in self.notifiers:
-            notifier.send(title, message)
+            try:
+                self._queue.put((0 if urgent else 1, next(self._seq), (name, notifier, item)),
+                                timeout=self.channel_timeout)
+            except queue.Full:
+                # 队列已满时直接在当前线程发送，不丢消息
+                print(f"⚠️ 通知队列已满，直接发送: {name}")
+                self._send_one(name, notifier, [item])
+        if wait:
+            self.flush()
+    
+    def flush(self, timeout=None):
+        """
+        等待队列中的消息全部发送完成
+        
+        Args:
+            timeout: 最长等待时间（秒），None 表示一直等待
+        
+        Returns:
+            bool: 是否全部发送完成
+        """
+        if self._queue is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+    
+    def stop(self, timeout=None):
+        """发送完队列中的消息后停止工作线程"""
+        if self._queue is not None:
+            self.flush(timeout)
+            for _ in self._workers:
+                self._queue.put((2, next(self._seq), None))
+            for worker in self._workers:
+                worker.join(timeout)
+            self._workers = []
+            self._queue = None
+        for _, notifier in self.notifiers:
+            if hasattr(notifier, "close"):
+                notifier.close()
@@ -0,0 +1,119 @@
+"""
+响应录制 - 把监控程序收到的真实 API 响应逐行写入 JSONL，供 fake_starlight.py 回放
+
+每行一个 JSON 对象：
+    {"ts": ..., "method": "GET", "path": "/api/monitor/metric", "params": {...},
+     "status": 200, "elapsed": 0.123, "body": {...}}
+
+请求头（含 bihu-token）不记录；登录响应中的 Token 替换为 "<redacted>"。
+
+用法：
+    python recorder.py responses.jsonl            # 录制 engine.py 的运行
+    python recorder.py responses.jsonl --discover
+    python fake_starlight.py --replay responses.jsonl
+"""
+import json
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from http_client import get_client
+
+REDACTED = "<redacted>"
+# 响应中需要隐藏的字段（Token、密码等）
+SECRET_KEYS = ("token", "password", "secret", "spec")
+
+
+class Recorder:
+    """通过 requests 的 response hook 录制 get_client() 会话上的所有响应"""
+
+    def __init__(self, path, client=None):
+        """
+        Args:
+            path: 输出的 JSONL 文件
+            client: http_client.StarlightClient，默认全局客户端
+        """
+        self.path = path
+        self.client = client or get_client()
+        self.recorded = 0
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.client.session.hooks["response"].append(self._hook)
+        return self
+
+    def stop(self):
+        hooks = self.client.session.hooks["response"]
+        if self._hook in hooks:
+            hooks.remove(self._hook)
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _hook(self, response, *args, **kwargs):
+        try:
+            record = self.record(response)
+        except Exception as e:
+            print(f"⚠️ 录制响应失败: {e}")
+            return response
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+                self._file.flush()
+                self.recorded += 1
+        return response
+
+    def record(self, response):
+        """把响应转换为一条记录"""
+        url = urlsplit(response.request.url)
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        if url.path.endswith("/keystone/short_term_token/name"):
+            body = redact(body, SECRET_KEYS)
+        else:
+            body = redact(body, SECRET_KEYS[:-1])
+        return {
+            "ts": time.time(),
+            "method": response.request.method,
+            "path": url.path,
+            "params": {key: values[0] for key, values in parse_qs(url.query).items()},
+            "status": response.status_code,
+            "elapsed": response.elapsed.total_seconds(),
+            "body": body,
+        }
+
+
+def redact(value, keys):
+    """递归替换字段名包含 keys 中任一关键字的值"""
+    if isinstance(value, dict):
+        return {
+            k: REDACTED if any(key in str(k).lower() for key in keys) else redact(v, keys)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(v, keys) for v in value]
+    return value
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python recorder.py <输出.jsonl> [--discover]")
+        sys.exit(1)
+    import config
+    import engine
+
+    with Recorder(sys.argv[1]) as recorder:
+        try:
+            engine.main(discover=config.AUTO_DISCOVER or "--discover" in sys.argv[2:])
+        finally:
+            print(f"Recorded {recorder.recorded} response(s) to {sys.argv[1]}")
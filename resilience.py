@@ -0,0 +1,195 @@
+"""
+请求重试策略 - 错误分类、带抖动的指数退避和熔断器
+
+错误分为几类，分别处理：
+- transient: SSL EOF、连接断开、超时等网络错误 -> 幂等请求立即按退避时间快速重试
+- server:    HTTP 5xx / 429 -> 同上，并计入熔断
+- auth:      HTTP 401 / 403 或 API 错误码 401 / 403 -> 刷新 Token 后重试，不计入熔断
+- client:    其他 HTTP 4xx（例如任务已不存在）-> 不重试，连续出现视为永久性错误
+- api:       HTTP 200 但 API 返回错误码 -> 同 client
+- circuit_open: 熔断中，请求没有发出
+
+熔断器：连续 BREAKER_THRESHOLD 次 transient/server 错误后打开，BREAKER_COOLDOWN 秒内所有请求
+直接失败（不再访问平台）；之后放行一个探测请求，成功则恢复，失败则等待时间翻倍（不超过
+BREAKER_MAX_COOLDOWN）。
+"""
+import random
+import threading
+import time
+
+import requests
+
+import config
+import telemetry
+
+TRANSIENT = "transient"
+SERVER = "server"
+AUTH = "auth"
+CLIENT = "client"
+API = "api"
+CIRCUIT_OPEN = "circuit_open"
+
+# 连续出现即停止监控的错误
+PERMANENT = (CLIENT, API)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """熔断中，请求没有发出"""
+
+
+def classify_status(status):
+    """
+    按 HTTP 状态码分类
+
+    Returns:
+        str: 错误类别；成功返回 None
+    """
+    if status in (401, 403):
+        return AUTH
+    if status == 429 or status >= 500:
+        return SERVER
+    if status >= 400:
+        return CLIENT
+    return None
+
+
+def classify_exception(exc):
+    """请求异常的类别"""
+    if isinstance(exc, CircuitOpenError):
+        return CIRCUIT_OPEN
+    return TRANSIENT
+
+
+def classify_api_code(code):
+    """API 响应中错误码（code 字段）的类别"""
+    try:
+        code = int(code)
+    except (TypeError, ValueError):
+        return API
+    if code in (401, 403):
+        return AUTH
+    if code == 429 or code >= 500:
+        return SERVER
+    return API
+
+
+def backoff_delay(attempt, base, cap):
+    """
+    带完全随机抖动的指数退避：在 [0, min(cap, base * 2^attempt)] 中均匀取值
+
+    多个任务（或多个进程）同时失败时，重试时间被打散，不会同时涌向刚恢复的平台。
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """所有 Starlight 请求共用的熔断器"""
+
+    def __init__(self, threshold=None, cooldown=None, max_cooldown=None):
+        """
+        Args:
+            threshold: 连续失败多少次后熔断，默认 config.BREAKER_THRESHOLD
+            cooldown: 熔断后首次探测前的等待时间（秒），默认 config.BREAKER_COOLDOWN
+            max_cooldown: 等待时间上限（秒），默认 config.BREAKER_MAX_COOLDOWN
+        """
+        self.threshold = threshold or config.BREAKER_THRESHOLD
+        self.base_cooldown = cooldown or config.BREAKER_COOLDOWN
+        self.max_cooldown = max_cooldown or config.BREAKER_MAX_COOLDOWN
+        self.cooldown = self.base_cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.opened = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """
+        是否允许发出请求；熔断等待结束后只放行一个探测请求
+
+        Returns:
+            bool
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or time.monotonic() < self.opened_at + self.cooldown:
+                return False
+            self._probing = True
+            return True
+
+    def retry_in(self):
+        """距离下一次探测的秒数（未熔断时为 0）"""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print("✅ Starlight API 已恢复，结束熔断")
+                telemetry.CIRCUIT_OPEN.set(value=0)
+            self.failures = 0
+            self.opened_at = None
+            self.cooldown = self.base_cooldown
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing:
+                # 探测失败：继续熔断，等待时间翻倍
+                self._probing = False
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self.opened_at = time.monotonic()
+            elif self.opened_at is None and self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self.opened += 1
+                telemetry.CIRCUIT_OPEN.set(value=1)
+                print(f"⚠️ Starlight API 连续失败 {self.failures} 次，熔断 {self.cooldown:.0f}s")
+
+
+class RetryState:
+    """一个监控循环（monitor.main 或引擎中的一个任务）的连续失败状态"""
+
+    def __init__(self):
+        self.failures = 0
+        self.permanent = 0
+        self.since = None
+
+    def success(self):
+        self.failures = 0
+        self.permanent = 0
+        self.since = None
+
+    def failure(self, kind):
+        """
+        记录一次失败
+
+        Args:
+            kind: 错误类别
+
+        Returns:
+            float: 下一次重试前的等待时间（秒）
+        """
+        if self.since is None:
+            self.since = time.monotonic()
+        self.failures += 1
+        if kind in PERMANENT:
+            self.permanent += 1
+        else:
+            self.permanent = 0
+        return backoff_delay(self.failures - 1, config.RETRY_BASE_DELAY, config.RETRY_INTERVAL)
+
+    @property
+    def outage(self):
+        """连续失败已持续的时间（秒）"""
+        return 0.0 if self.since is None else time.monotonic() - self.since
+
+    def exhausted(self):
+        """连续永久性错误超过 MAX_FAIL_COUNT 次，或故障持续超过 MAX_OUTAGE 秒"""
+        return self.permanent > config.MAX_FAIL_COUNT or self.outage > config.MAX_OUTAGE
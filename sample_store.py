@@ -0,0 +1,285 @@
+"""
+GPU 采样存储 - 把每个任务/设备的采样保存到本地，便于调整阈值和审计关闭记录
+
+- 采样以定长记录 (timestamp f64, value f32, series u32) 追加写入 samples.dat，
+  读取时通过 mmap 映射文件并用 NumPy 按列过滤，不把整个文件读入 Python 对象
+- 序列（任务, 设备, 指标）与编号的对应关系保存在 series.json
+- 最近的采样窗口由 idle_detect.IdleDetector 保存在内存中，这里只负责落盘
+- forget() 在任务结束后停止追踪其序列；compact() 删除超过保留期的记录，并丢弃已结束
+  且没有剩余记录的序列（重新编号），长时间运行时内存和 series.json 不增长
+- 写入只持有 _lock 很短的时间；新序列的 series.json 在 flush() 时批量写入（不持有 _lock），
+  先于对应的记录落盘；range() 和 compact() 的扫描在 _file_lock 下进行，不阻塞轮询路径的
+  append_many()，compact() 只在最后替换文件时短暂持有 _lock，并在同一步中重新编号
+
+用法（查看某个任务的采样，例如审计一次自动关闭）：
+    python sample_store.py JOB_ID [--hours 24] [--metric gpu_memory]
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+import config
+
+RECORD = struct.Struct("<dfI")
+RECORD_DTYPE = np.dtype([("timestamp", "<f8"), ("value", "<f4"), ("series", "<u4")])
+
+
+class SampleStore:
+    """追加写入的采样存储"""
+
+    def __init__(self, directory=None):
+        """
+        初始化采样存储
+
+        Args:
+            directory: 存储目录，默认 config.SAMPLE_STORE_DIR
+        """
+        self.directory = directory or config.SAMPLE_STORE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.data_path = os.path.join(self.directory, "samples.dat")
+        self.series_path = os.path.join(self.directory, "series.json")
+        self._lock = threading.Lock()       # 追加写入、序列编号
+        self._file_lock = threading.Lock()  # 读取文件与 compact() 替换文件互斥
+        self._save_lock = threading.Lock()  # 写 series.json（先于 _lock 获取）
+        self._dirty = False  # 有尚未写入 series.json 的新序列
+        self._names = []   # id -> (job_id, device, metric)，包含已结束但文件中仍有记录的序列
+        self._ids = {}     # (job_id, device, metric) -> id，与 _names 对应
+        self._series = {}  # 本进程仍在追踪的序列，forget() 后移除
+        self._load_series()
+        self._file = open(self.data_path, "ab", buffering=64 * 1024)
+
+    def _load_series(self):
+        try:
+            with open(self.series_path, encoding="utf-8") as f:
+                names = json.load(f)
+        except (OSError, ValueError):
+            names = []
+        self._names = [tuple(name) for name in names]
+        self._ids = {name: i for i, name in enumerate(self._names)}
+
+    def _write_series(self, names):
+        tmp_path = f"{self.series_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(names, f, ensure_ascii=False)
+        os.replace(tmp_path, self.series_path)
+
+    def _save_series(self):
+        """把新序列写入 series.json；只在复制序列名时持有 _lock，写文件期间不阻塞 append()"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                names = list(self._names)
+                self._dirty = False
+            self._write_series(names)
+
+    def _series_id(self, job_id, device, metric):
+        key = (str(job_id), str(device), str(metric))
+        series_id = self._series.get(key)
+        if series_id is None:
+            series_id = self._ids.get(key)
+            if series_id is None:
+                series_id = len(self._names)
+                self._names.append(key)
+                self._ids[key] = series_id
+                self._dirty = True
+            self._series[key] = series_id
+        return series_id
+
+    def append(self, job_id, device, metric, timestamp, value):
+        """追加一个采样（写入缓冲区，flush 后落盘）"""
+        with self._lock:
+            series_id = self._series_id(job_id, device, metric)
+            self._file.write(RECORD.pack(timestamp, value, series_id))
+
+    def append_many(self, samples):
+        """
+        批量追加并落盘
+
+        Args:
+            samples: [(job_id, device, metric, timestamp, value), ...]
+        """
+        for sample in samples:
+            self.append(*sample)
+        self.flush()
+
+    def flush(self):
+        """先写入新序列再落盘记录，文件中的记录总能找到对应的序列名"""
+        self._save_series()
+        with self._lock:
+            self._file.flush()
+
+    def forget(self, job_id):
+        """任务结束后停止追踪其序列；文件中的记录保留到过期，之后由 compact() 一并丢弃编号"""
+        job_id = str(job_id)
+        with self._lock:
+            for key in [key for key in self._series if key[0] == job_id]:
+                del self._series[key]
+
+    def _records(self):
+        """
+        flush 后映射当前文件中的完整记录（调用方持有 _file_lock）
+
+        Returns:
+            tuple: (mmap 或 None, 记录数组, 当时的序列名列表)
+        """
+        self._save_series()
+        with self._lock:
+            self._file.flush()
+            names = list(self._names)
+        size = os.path.getsize(self.data_path)
+        size -= size % RECORD.size
+        if not size:
+            return None, np.empty(0, dtype=RECORD_DTYPE), names
+        with open(self.data_path, "rb") as f:
+            data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        return data, np.frombuffer(data, dtype=RECORD_DTYPE), names
+
+    def range(self, job_id=None, device=None, metric=None, start=None, end=None):
+        """
+        从文件读取时间范围内的采样
+
+        Args:
+            job_id / device / metric: 过滤条件，None 表示不过滤
+            start / end: 时间范围（UNIX 秒），None 表示不限
+
+        Returns:
+            dict: {(job_id, device, metric): [(timestamp, value), ...]}
+        """
+        with self._file_lock:
+            data, records, names = self._records()
+            try:
+                wanted = [
+                    series_id for series_id, (j, d, m) in enumerate(names)
+                    if (job_id is None or j == str(job_id))
+                    and (device is None or d == str(device))
+                    and (metric is None or m == str(metric))
+                ]
+                if not wanted or not len(records):
+                    return {}
+                mask = np.isin(records["series"], wanted)
+                if start is not None:
+                    mask &= records["timestamp"] >= start
+                if end is not None:
+                    mask &= records["timestamp"] <= end
+                selected = records[mask]
+                result = {}
+                for series_id in np.unique(selected["series"]):
+                    rows = selected[selected["series"] == series_id]
+                    result[names[series_id]] = list(zip(rows["timestamp"].tolist(), rows["value"].tolist()))
+                return result
+            finally:
+                del records
+                if data is not None:
+                    data.close()
+
+    def compact(self, retention_seconds=None):
+        """
+        删除超过保留期的记录，并丢弃已结束且没有剩余记录的序列
+
+        过滤和写临时文件时不持有写入锁；替换文件前把这期间追加的记录一并复制过去。
+        扫描期间被 forget() 后又重新追加、或新建的序列在替换时分配新编号。
+
+        Args:
+            retention_seconds: 保留时长（秒），默认 config.SAMPLE_RETENTION_DAYS 天
+
+        Returns:
+            int: 删除的记录数
+        """
+        if retention_seconds is None:
+            retention_seconds = config.SAMPLE_RETENTION_DAYS * 86400
+        cutoff = time.time() - retention_seconds
+        tmp_path = f"{self.data_path}.tmp"
+        with self._file_lock:
+            data, records, names = self._records()
+            try:
+                keep = records[(records["timestamp"] >= cutoff) & (records["series"] < len(names))]
+                removed = len(records) - len(keep)
+                with self._lock:
+                    active = set(self._series.values())
+                live = active | set(np.unique(keep["series"]).tolist())
+                if not removed and len(live) == len(names):
+                    return 0
+                # 按原顺序重新编号仍在使用的序列
+                renumber = {old: new for new, old in enumerate(sorted(live))}
+                mapping = np.zeros(len(names), dtype="<u4")
+                for old, new in renumber.items():
+                    mapping[old] = new
+                keep = keep.copy()
+                keep["series"] = mapping[keep["series"]]
+                copied = len(records) * RECORD.size
+                with open(tmp_path, "wb") as out:
+                    out.write(keep.tobytes())
+            finally:
+                del records
+                if data is not None:
+                    data.close()
+
+            with self._save_lock, self._lock:
+                # 扫描期间追加的记录和新建的序列
+                self._file.flush()
+                with open(self.data_path, "rb") as f:
+                    f.seek(copied)
+                    tail = f.read()
+                tail = tail[:len(tail) - len(tail) % RECORD.size]
+                tail = np.frombuffer(tail, dtype=RECORD_DTYPE).copy()
+                # 扫描后仍被引用、但不在 renumber 中的旧编号（例如 forget() 后又重新追加）按顺序分配新编号
+                referenced = set(self._series.values()) | set(np.unique(tail["series"]).tolist())
+                referenced.update(range(len(names), len(self._names)))
+                for old in sorted(referenced - set(renumber)):
+                    renumber[old] = len(renumber)
+                with open(tmp_path, "ab") as out:
+                    if len(tail):
+                        tail["series"] = [renumber[int(old)] for old in tail["series"]]
+                        out.write(tail.tobytes())
+                    out.flush()
+                    os.fsync(out.fileno())
+                names = [None] * len(renumber)
+                for old, new in renumber.items():
+                    names[new] = self._names[old]
+                # 在同一次持锁中替换序列名、数据文件和编号
+                self._write_series(names)
+                self._file.close()
+                os.replace(tmp_path, self.data_path)
+                self._file = open(self.data_path, "ab", buffering=64 * 1024)
+                self._names = names
+                self._ids = {name: i for i, name in enumerate(names)}
+                self._series = {key: renumber[old] for key, old in self._series.items()}
+                self._dirty = False
+            return removed
+
+    def close(self):
+        """关闭文件；正在进行的 compact() 结束后才关闭"""
+        with self._file_lock:
+            self._save_series()
+            with self._lock:
+                self._file.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description="查看保存的 GPU 采样")
+    parser.add_argument("job_id", help="任务ID")
+    parser.add_argument("--hours", type=float, default=24, help="最近多少小时，默认 24")
+    parser.add_argument("--metric", default=None, help="只看某个指标，例如 gpu_memory")
+    parser.add_argument("--dir", default=None, help="存储目录，默认 config.SAMPLE_STORE_DIR")
+    args = parser.parse_args()
+
+    store = SampleStore(args.dir)
+    series = store.range(args.job_id, metric=args.metric, start=time.time() - args.hours * 3600)
+    store.close()
+    if not series:
+        print(f"No samples for job {args.job_id}")
+    for (job_id, device, metric), points in sorted(series.items()):
+        values = np.array([value for _, value in points])
+        print(f"{job_id} {device} {metric}: {len(points)} samples, "
+              f"min {values.min():.1f} / p50 {np.percentile(values, 50):.1f} / max {values.max():.1f}")
+        for timestamp, value in points:
+            print(f"  {datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S}  {value:.1f}")
@@ -0,0 +1,80 @@
+"""
+自适应轮询调度 - 按任务状态和闲置接近程度调整每个任务的检查间隔
+
+- 排队中的任务：间隔按指数退避增长（带抖动），直到 QUEUED_MAX_INTERVAL
+- 显存远高于阈值的任务：连续繁忙次数越多间隔越长，直到 SCHEDULER_MAX_INTERVAL
+- 显存接近阈值或处于关闭倒计时的任务：使用最短间隔 SCHEDULER_MIN_INTERVAL
+- 唤醒时间对齐到 SCHEDULER_SLOT 秒的时间槽：任务分散到不同时间槽，
+  同一时间槽内的任务仍合并为一次批量查询
+"""
+import math
+import random
+import time
+
+import config
+
+
+class AdaptiveScheduler:
+    """每个任务的轮询间隔"""
+
+    def __init__(self, base_interval=None, min_interval=None, max_interval=None,
+                 backoff=None, jitter=None, slot=None):
+        """
+        Args:
+            base_interval: 运行中任务的默认间隔（秒），默认 config.CHECK_INTERVAL
+            min_interval: 接近闲置或倒计时中的间隔（秒），默认 config.SCHEDULER_MIN_INTERVAL
+            max_interval: 繁忙任务的最长间隔（秒），默认 config.SCHEDULER_MAX_INTERVAL
+            backoff: 每次退避的倍数，默认 config.SCHEDULER_BACKOFF
+            jitter: 抖动比例（0.1 表示 ±10%），默认 config.SCHEDULER_JITTER
+            slot: 唤醒时间槽（秒），默认 config.SCHEDULER_SLOT
+        """
+        self.base_interval = base_interval or config.CHECK_INTERVAL
+        self.min_interval = min_interval or config.SCHEDULER_MIN_INTERVAL
+        self.max_interval = max_interval or config.SCHEDULER_MAX_INTERVAL
+        self.backoff = backoff or config.SCHEDULER_BACKOFF
+        self.jitter = config.SCHEDULER_JITTER if jitter is None else jitter
+        self.slot = config.SCHEDULER_SLOT if slot is None else slot
+        self._queued_polls = {}
+        self._busy_streak = {}
+
+    def _finish(self, delay):
+        """加抖动并对齐到时间槽，返回需要等待的秒数"""
+        delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        if self.slot:
+            now = time.time()
+            delay = math.ceil((now + delay) / self.slot) * self.slot - now
+        return max(delay, 0)
+
+    def initial_delay(self):
+        """任务首次检查前的随机延迟，避免启动时所有任务同时请求"""
+        return random.uniform(0, config.SCHEDULER_STARTUP_SPREAD)
+
+    def queued_delay(self, job_id):
+        """排队中的任务：每次检查后间隔按 backoff 增长"""
+        polls = self._queued_polls.get(job_id, 0)
+        self._queued_polls[job_id] = polls + 1
+        delay = min(config.QUEUED_CHECK_INTERVAL * self.backoff ** polls, config.QUEUED_MAX_INTERVAL)
+        return self._finish(delay)
+
+    def running_delay(self, job_id, usage, urgent=False):
+        """
+        运行中的任务
+
+        Args:
+            job_id: 任务ID
+            usage: 本次显存读数（MB），获取失败为 None
+            urgent: 是否处于闲置计数或关闭倒计时中
+        """
+        self._queued_polls.pop(job_id, None)
+        if urgent or usage is None or usage < config.SCHEDULER_NEAR_MB:
+            self._busy_streak[job_id] = 0
+            delay = self.min_interval if (urgent or usage is not None) else self.base_interval
+        else:
+            streak = self._busy_streak.get(job_id, 0)
+            self._busy_streak[job_id] = streak + 1
+            delay = min(self.base_interval * self.backoff ** streak, self.max_interval)
+        return self._finish(delay)
+
+    def forget(self, job_id):
+        self._queued_polls.pop(job_id, None)
+        self._busy_streak.pop(job_id, None)
@@ -0,0 +1,251 @@
+"""
+监控程序自身的运行指标 - 以 Prometheus 文本格式通过 HTTP 导出
+
+在 config.py 中设置 METRICS_PORT 后，monitor.py / engine.py 启动时会开启
+http://METRICS_HOST:METRICS_PORT/metrics，可直接被 Prometheus 抓取或用浏览器查看：
+
+- starlight_api_request_seconds      各接口的请求耗时（直方图）
+- starlight_api_errors_total         各接口的错误数（ssl / connection / timeout / http / api_code / circuit_open）
+- starlight_api_retries_total        各接口的快速重试次数
+- starlight_circuit_open             熔断器状态（1 表示熔断中）
+- monitor_token_failures_total       Token 获取失败次数
+- monitor_idle_counter               各任务当前的连续闲置计数
+- monitor_gpu_memory_mb              各任务最近一次的显存占用
+- monitor_notification_seconds       各通知方式的发送耗时（直方图）
+- monitor_notification_failures_total 各通知方式的发送失败次数
+- monitor_metric_cache_total         节点级指标缓存的命中 / 未命中 / 合并 / 淘汰次数
+- monitor_shutdowns_total            触发的自动关闭次数（success / failure）
+
+不依赖 prometheus_client，指标只在内存中累加，未开启端口时开销可以忽略。
+"""
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import config
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """带标签的指标基类"""
+
+    type = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} 需要标签 {self.labels}")
+        return tuple(str(v) for v in labels)
+
+    def remove(self, *labels):
+        """删除一组标签的值（例如任务结束后）"""
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def samples(self):
+        """[(名称后缀, 标签值, 额外标签, 值), ...]"""
+        with self._lock:
+            return [("", key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        samples = super().samples()
+        # 没有标签的计数器从 0 开始导出
+        return samples or ([("", (), (), 0)] if not self.labels else [])
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, *labels, value):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, *labels, value):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    result.append(("_bucket", key, (("le", _format_value(bound)),), cumulative))
+                result.append(("_sum", key, (), total))
+                result.append(("_count", key, (), count))
+        return result
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+API_LATENCY = REGISTRY.register(Histogram(
+    "starlight_api_request_seconds", "Starlight API request latency in seconds", ("endpoint", "method")))
+API_ERRORS = REGISTRY.register(Counter(
+    "starlight_api_errors_total", "Starlight API errors by endpoint and type", ("endpoint", "type")))
+API_RETRIES = REGISTRY.register(Counter(
+    "starlight_api_retries_total", "Starlight API request retries by endpoint", ("endpoint",)))
+CIRCUIT_OPEN = REGISTRY.register(Gauge(
+    "starlight_circuit_open", "1 while the Starlight API circuit breaker is open"))
+TOKEN_FAILURES = REGISTRY.register(Counter(
+    "monitor_token_failures_total", "Failed attempts to obtain a bihu-token"))
+IDLE_COUNTER = REGISTRY.register(Gauge(
+    "monitor_idle_counter", "Consecutive idle checks per job", ("job",)))
+GPU_MEMORY = REGISTRY.register(Gauge(
+    "monitor_gpu_memory_mb", "Latest GPU memory usage per job in MB", ("job",)))
+NOTIFY_LATENCY = REGISTRY.register(Histogram(
+    "monitor_notification_seconds", "Notification send latency per channel in seconds", ("channel",)))
+NOTIFY_FAILURES = REGISTRY.register(Counter(
+    "monitor_notification_failures_total", "Failed notification sends per channel", ("channel",)))
+METRIC_CACHE = REGISTRY.register(Counter(
+    "monitor_metric_cache_total", "Per-node metric cache lookups by result", ("metric", "result")))
+SHUTDOWNS = REGISTRY.register(Counter(
+    "monitor_shutdowns_total", "Automatic job shutdowns by result", ("result",)))
+
+# URL 中的集群名和任务ID替换为占位符，避免每个任务产生一组新的标签
+_JOB_PATH = re.compile(r"^(.*/job/running)(/[^/]+)?(/[^/]+)?$")
+
+
+def endpoint_label(url):
+    """把请求 URL 归一化为接口名，例如 /api/job/running/{cluster}/{job_id}"""
+    path = urlsplit(url).path
+    match = _JOB_PATH.match(path)
+    if match:
+        path = match.group(1) + ("/{cluster}" if match.group(2) else "") + ("/{job_id}" if match.group(3) else "")
+    return path
+
+
+def forget_job(job_id):
+    """任务结束后删除其 Gauge"""
+    IDLE_COUNTER.remove(job_id)
+    GPU_MEMORY.remove(job_id)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if urlsplit(self.path).path not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_server(port=None, host=None):
+    """
+    在后台线程中开启 /metrics 端点（重复调用只开启一次）
+
+    Args:
+        port: 端口，默认 config.METRICS_PORT；为 0 或 None 时不开启
+        host: 监听地址，默认 config.METRICS_HOST
+
+    Returns:
+        ThreadingHTTPServer；未开启时返回 None
+    """
+    global _server
+    port = config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host or config.METRICS_HOST, port), _Handler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"Metrics endpoint: http://{_server.server_address[0]}:{_server.server_address[1]}/metrics")
+        return _server
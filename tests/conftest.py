@@ -0,0 +1,71 @@
+"""
+测试公共夹具 - 用 fake_starlight.FakeStarlight 在本地模拟 Starlight API
+
+每个测试使用独立的 HTTP 客户端、Token 缓存和临时目录，config 的修改在测试结束后恢复。
+"""
+import sys
+import time
+import types
+
+import pytest
+
+import config
+import fake_starlight
+import get_token
+import http_client
+import monitor
+from jobs import Job
+
+_URLS = ("API_BASE", "LOGIN_URL", "METRIC_URL", "JOB_LIST_URL", "JOB_STATUS_URL", "DELETE_URL")
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch, tmp_path):
+    """每个测试独立的全局状态：HTTP 客户端、Token、缓存文件和较短的重试等待"""
+    monkeypatch.setitem(sys.modules, "private_config", types.SimpleNamespace(username="test", password_plain=""))
+    monkeypatch.setattr(http_client, "_client", None)
+    monkeypatch.setattr(get_token, "_token_cache", None)
+    monkeypatch.setattr(monitor, "HEADERS", {})
+    monkeypatch.setattr(config, "TOKEN_CACHE_FILE", str(tmp_path / "token.json"))
+    monkeypatch.setattr(config, "HTTP_RETRY_BASE", 0.01)
+    monkeypatch.setattr(config, "HTTP_RETRY_MAX_DELAY", 0.05)
+    monkeypatch.setattr(config, "STOP_POLL_INTERVAL", 0.05)
+    for name in _URLS:
+        monkeypatch.setattr(config, name, getattr(config, name))
+    yield
+    if http_client._client is not None:
+        http_client._client.session.close()
+
+
+@pytest.fixture
+def starlight():
+    """
+    启动模拟服务的工厂：starlight(jobs, **Scenario 参数) -> FakeStarlight
+
+    jobs 为 FakeJob 列表；服务启动后 config 中的接口地址指向它，并已登录（monitor.HEADERS 可用）。
+    """
+    servers = []
+
+    def start(jobs=(), login=True, **kwargs):
+        server = fake_starlight.FakeStarlight(fake_starlight.Scenario(list(jobs), **kwargs)).start()
+        servers.append(server)
+        fake_starlight.use_server(server.api_base)
+        if login:
+            monitor.update_headers(get_token.get_cached_token())
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def fake_job(index, curve=None, **kwargs):
+    """第 index 个模拟任务（Pod 名按 jobs.Job.from_log 的规则可还原出任务ID）"""
+    job_id = f"fakejob-{index:05d}"
+    kwargs.setdefault("started", time.time() - 600)
+    return fake_starlight.FakeJob(job_id, f"{job_id}-{index:05x}", f"an{index}", curve, **kwargs)
+
+
+def as_job(fake):
+    """FakeJob 对应的 jobs.Job"""
+    return Job(fake.job_id, fake.pod_name, fake.node_name)
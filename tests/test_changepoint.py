@@ -0,0 +1,41 @@
+"""进程退出检测：断崖下降并保持低位才判定，缓慢下降和短暂低谷不判定"""
+from changepoint import CrashDetector, PollWindow, step_down
+
+
+def _series(values, interval=30):
+    return [(i * interval, value) for i, value in enumerate(values)]
+
+
+def test_sharp_drop_held_low_is_a_crash():
+    result = step_down(_series([20000] * 6 + [0] * 3), min_drop=1000, low=3, hold=60)
+    assert result["confidence"] == 1.0
+    assert result["since"] == 180 and result["held"] == 60
+
+
+def test_confidence_grows_with_hold_time():
+    short = step_down(_series([20000] * 6 + [0] * 2), min_drop=1000, low=3, hold=60)
+    assert 0 < short["confidence"] < 1
+
+
+def test_gradual_decline_and_dip_are_not_crashes():
+    decline = [20000 - i * 2500 for i in range(9)] + [0, 0, 0]
+    result = step_down(_series(decline), min_drop=1000, low=3, hold=60)
+    assert result is None or result["confidence"] < 0.9
+    dip = [20000] * 4 + [0] + [20000] * 3
+    assert step_down(_series(dip), min_drop=1000, low=3, hold=60) is None
+
+
+def test_every_device_must_drop():
+    detector = CrashDetector(min_drop=1000, low=3, hold=60, threshold=0.9)
+    crashed = _series([20000] * 6 + [0] * 3)
+    assert detector.crashed({"gpu0": crashed, "gpu1": crashed})[0]
+    assert not detector.crashed({"gpu0": crashed, "gpu1": _series([20000] * 9)})[0]
+
+
+def test_poll_window_keeps_readings_before_the_drop():
+    window = PollWindow(window_seconds=120, hold=60)
+    for ts, value in _series([20000] * 10 + [0] * 2, interval=120):
+        window.add(ts, value)
+    # 一个检查间隔只有一个读数：窗口仍保留变点前的 2 个读数
+    assert [value for _, value in window.series()["gpu"]] == [20000, 20000, 0, 0]
+    assert CrashDetector(min_drop=1000, low=3, hold=60).crashed(window.series())[0]
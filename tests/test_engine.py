@@ -0,0 +1,71 @@
+"""多任务引擎：后台任务的生命周期，检查点的删除不阻塞事件循环，批量合并查询"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import engine
+import metrics
+from checkpoint import CheckpointStore
+from conftest import as_job, fake_job
+from notifier import NotificationManager
+
+
+def test_run_cancels_background_tasks(monkeypatch, tmp_path, starlight):
+    monkeypatch.setattr(config, "SAMPLE_STORE_DIR", str(tmp_path / "samples"))
+    monkeypatch.setattr(config, "CHECKPOINT_DIR", "")
+    monkeypatch.setattr(config, "PROFILE_TRIGGER_FILE", "")
+    starlight()
+    eng = engine.MonitorEngine([], NotificationManager())
+    asyncio.run(eng.run())
+    assert eng._compact_task.done() and eng._refresh_task.done()
+    assert eng.store._file.closed
+
+
+def test_stop_watcher_discards_checkpoint_in_executor(tmp_path):
+    job = as_job(fake_job(1))
+    eng = engine.MonitorEngine([job], NotificationManager())
+    eng._executor = ThreadPoolExecutor(2)
+    eng.checkpoints = CheckpointStore(str(tmp_path))
+    eng.checkpoints.save(job.job_id, {"idle_counter": 1})
+    threads = []
+    discard = eng.checkpoints.discard
+
+    def recording(job_id):
+        threads.append(threading.current_thread())
+        discard(job_id)
+
+    eng.checkpoints.discard = recording
+    asyncio.run(eng.stop_watcher(job.job_id))
+    eng._executor.shutdown()
+    assert threads and threads[0] is not threading.main_thread()
+    assert eng.checkpoints.load(job.job_id) is None
+
+
+def test_handover_keeps_checkpoint(tmp_path):
+    job = as_job(fake_job(1))
+    eng = engine.MonitorEngine([job], NotificationManager())
+    eng._executor = ThreadPoolExecutor(2)
+    eng.checkpoints = CheckpointStore(str(tmp_path))
+    eng.checkpoints.save(job.job_id, {"idle_counter": 1})
+    asyncio.run(eng.stop_watcher(job.job_id, finished=False))
+    eng._executor.shutdown()
+    assert eng.checkpoints.load(job.job_id)["idle_counter"] == 1
+
+
+def test_batcher_merges_concurrent_queries(monkeypatch, starlight):
+    monkeypatch.setattr(metrics, "watermarks", metrics.Watermarks())
+    fakes = [fake_job(i, {"type": "constant", "value": 1000 * (i + 1)}) for i in range(5)]
+    server = starlight(fakes)
+    jobs = [as_job(fake) for fake in fakes]
+    eng = engine.MonitorEngine(jobs, NotificationManager())
+    eng._executor = ThreadPoolExecutor(2)
+
+    async def go():
+        eng.batcher = engine.MetricBatcher(eng, window=0.05)
+        return await asyncio.gather(*(eng.batcher.get(job) for job in jobs))
+
+    snapshots = asyncio.run(go())
+    eng._executor.shutdown()
+    assert server.stats()["GET /api/monitor/metric"] == len(eng.metrics)
+    assert [round(s["gpu_memory"]["latest"], -3) for s in snapshots] == [1000, 2000, 3000, 4000, 5000]
@@ -0,0 +1,78 @@
+"""分片监控的租约：独占获取、过期接管、原地续约"""
+import time
+
+import config
+from fleet import Fleet, rendezvous_owner
+
+
+def _pair(tmp_path, ttl=60):
+    return Fleet(str(tmp_path), "a", ttl), Fleet(str(tmp_path), "b", ttl)
+
+
+def _owner(fleet, job_id):
+    return fleet._read(fleet._lease_path(job_id))["owner"]
+
+
+def test_lease_is_exclusive(tmp_path):
+    a, b = _pair(tmp_path)
+    assert a.acquire("job1")
+    assert not b.acquire("job1")
+    assert a.acquire("job1")  # 重复获取自己的租约即续约
+    assert _owner(a, "job1") == "a"
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    a, b = _pair(tmp_path, ttl=0.2)
+    assert a.acquire("job1")
+    time.sleep(0.3)
+    assert b.acquire("job1")
+    assert not a.renew("job1") and "job1" not in a.held
+    assert _owner(b, "job1") == "b"
+
+
+def test_renew_in_place_leaves_no_gap(tmp_path):
+    a, b = _pair(tmp_path)
+    assert a.acquire("job1")
+    before = a._read(a._lease_path("job1"))["expires"]
+    write = a._write
+    raced = []
+
+    def racing_write(path, record):
+        # 续约写入前另一个进程尝试获取：租约文件一直存在且未过期，必须失败
+        raced.append(b.acquire("job1"))
+        write(path, record)
+
+    a._write = racing_write
+    time.sleep(0.01)
+    assert a.renew("job1")
+    assert raced == [False]
+    assert _owner(a, "job1") == "a"
+    assert a._read(a._lease_path("job1"))["expires"] > before
+
+
+def test_renew_near_expiry_uses_take_over(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "FLEET_RENEW_MARGIN", 3600)
+    a, b = _pair(tmp_path)
+    assert a.acquire("job1")
+    a._write = None  # 不应原地写入
+    assert a.renew("job1")
+    assert _owner(a, "job1") == "a"
+
+
+def test_finished_lease_is_not_taken_over(tmp_path):
+    a, b = _pair(tmp_path, ttl=0.2)
+    assert a.acquire("job1")
+    a.finish("job1")
+    time.sleep(0.3)
+    assert not b.acquire("job1")
+    b.release("job1", finished=True)
+    assert b.acquire("job1")
+
+
+def test_rendezvous_moves_few_jobs():
+    jobs = [f"job{i}" for i in range(200)]
+    before = {job: rendezvous_owner(job, ["a", "b", "c"]) for job in jobs}
+    after = {job: rendezvous_owner(job, ["a", "b", "c", "d"]) for job in jobs}
+    moved = [job for job in jobs if before[job] != after[job]]
+    assert all(after[job] == "d" for job in moved)
+    assert 20 < len(moved) < 80
@@ -0,0 +1,105 @@
+"""窗口闲置检测：策略组合、检测延迟（与只看最新值比较）、引擎的闲置计数"""
+import asyncio
+
+import numpy as np
+
+import benchmark
+import config
+import engine
+from conftest import as_job, fake_job
+from idle_detect import IdleDetector, build_policy
+from notifier import NotificationManager
+
+
+def _windows(**devices):
+    return {"gpu_memory": {device: np.array(values, dtype=float) for device, values in devices.items()}}
+
+
+def test_policies_require_every_device_idle():
+    policy = build_policy({"policy": "percentile", "metric": "gpu_memory", "threshold": 3, "q": 50})
+    assert policy.is_idle(_windows(gpu0=[0, 0, 20000], gpu1=[0, 1, 0]))
+    assert not policy.is_idle(_windows(gpu0=[0, 0, 20000], gpu1=[0, 20000, 20000]))
+    assert policy.is_idle({}) is None
+
+
+def test_any_ignores_metrics_without_data():
+    policy = build_policy({"any": [
+        {"policy": "percentile", "metric": "gpu_memory", "threshold": 3, "q": 50},
+        {"policy": "fraction", "metric": "gpu_util", "threshold": 5, "fraction": 0.9},
+    ]})
+    assert policy.is_idle(_windows(gpu0=[0, 0, 0]))
+    assert policy.is_idle(_windows(gpu0=[20000, 20000, 20000])) is False
+
+
+def test_detector_trims_window_and_needs_min_samples():
+    detector = IdleDetector([{"policy": "max", "metric": "gpu_memory", "threshold": 3}],
+                            window_seconds=60, min_samples=3)
+    detector.add("job", "gpu_memory", [("gpu", ts, 20000) for ts in (0, 30)])
+    assert detector.evaluate("job")[0] is None
+    detector.add("job", "gpu_memory", [("gpu", ts, 0) for ts in (60, 90, 120)])
+    idle, stats = detector.evaluate("job")
+    assert idle and stats["gpu_memory"]["gpu"]["count"] == 3
+
+
+def _delays(**kwargs):
+    interval = config.CHECK_INTERVAL
+    drop = 20 * interval
+    return [benchmark.replay_idle(lambda ts: 0.0 if ts >= drop else 20000.0, drop, phase=interval * i / 12, **kwargs)
+            for i in range(12)]
+
+
+def test_window_detection_no_slower_than_last_point():
+    last_point = _delays()
+    current = _delays(policy=config.IDLE_POLICIES, window_seconds=config.IDLE_WINDOW_SECONDS)
+    before = _delays(policy=[{"policy": "percentile", "metric": "gpu_memory", "threshold": 3, "q": 90}],
+                     window_seconds=300, count_window=True)
+    assert None not in current
+    assert max(current) <= max(last_point)
+    assert min(before) > max(last_point)
+
+
+def test_window_decides_without_consecutive_count(monkeypatch):
+    monkeypatch.setattr(config, "MAX_IDLE_COUNT", 3)
+    interval = config.CHECK_INTERVAL
+    drop = 20 * interval
+    kwargs = {"policy": config.IDLE_POLICIES, "window_seconds": config.IDLE_WINDOW_SECONDS}
+    current = benchmark.replay_idle(lambda ts: 0.0 if ts >= drop else 20000.0, drop, **kwargs)
+    counted = benchmark.replay_idle(lambda ts: 0.0 if ts >= drop else 20000.0, drop, count_window=True, **kwargs)
+    assert current < counted
+
+
+def test_single_noise_reading_is_not_idle():
+    interval = config.CHECK_INTERVAL
+    drop = 20 * interval
+    for i in range(12):
+        assert benchmark.replay_idle(lambda ts: 0.0 if ts == drop else 20000.0, None, phase=interval * i / 12,
+                                     policy=config.IDLE_POLICIES, window_seconds=config.IDLE_WINDOW_SECONDS,
+                                     horizon=drop + 10 * interval) is None
+
+
+def test_engine_window_verdict_reaches_max_idle_count(monkeypatch):
+    monkeypatch.setattr(config, "MAX_IDLE_COUNT", 3)
+    monkeypatch.setattr(config, "CRASH_DETECT", False)
+    job = as_job(fake_job(1))
+    eng = engine.MonitorEngine([job], NotificationManager())
+    watcher = engine.JobWatcher(eng, job)
+    notified = []
+
+    async def notify(title, message, urgent=False):
+        notified.append(title)
+
+    watcher.notify = notify
+    points = [("gpu", ts, 0.0) for ts in range(0, 120, 30)]
+    asyncio.run(watcher.on_snapshot({"gpu_memory": {"latest": 0.0, "points": points}}))
+    assert watcher.idle_counter == config.MAX_IDLE_COUNT
+    assert notified == ["⚠️ GPU任务即将自动关闭"]
+
+
+def test_engine_latest_value_fallback_still_counts(monkeypatch):
+    monkeypatch.setattr(config, "MAX_IDLE_COUNT", 3)
+    monkeypatch.setattr(config, "CRASH_DETECT", False)
+    job = as_job(fake_job(1))
+    eng = engine.MonitorEngine([job], NotificationManager())
+    watcher = engine.JobWatcher(eng, job)
+    asyncio.run(watcher.on_snapshot({"gpu_memory": {"latest": 0.0, "points": [("gpu", 0, 0.0)]}}))
+    assert watcher.idle_counter == 1
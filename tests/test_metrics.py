@@ -0,0 +1,63 @@
+"""批量指标查询：按集群分批、高水位增量查询，以及流式解析"""
+import json
+from datetime import datetime, timedelta, timezone
+
+import metrics
+import monitor
+from conftest import as_job, fake_job
+from jobs import Job
+from metric_stream import parse_metric_stream
+
+
+def test_chunks_never_mix_clusters(monkeypatch):
+    calls = []
+
+    def query_metric(jobs, metric="gpu_memory", start=None, now=None):
+        calls.append({job.cluster for job in jobs})
+        return []
+
+    monkeypatch.setattr(metrics, "query_metric", query_metric)
+    jobs = [Job(f"job{i}", f"job{i}-x", f"an{i}", cluster="a" if i % 2 else "b") for i in range(6)]
+    by_pod = metrics.fetch_devices(jobs, batch_size=10, marks=metrics.Watermarks())
+    assert sorted(map(sorted, calls)) == [["a"], ["b"]]
+    assert set(by_pod) == {job.pod_name for job in jobs}
+
+
+def test_window_start_is_timezone_aware():
+    marks = metrics.Watermarks(window_minutes=60)
+    job = Job("job1", "job1-x", "an1")
+    now = datetime.now(timezone.utc)
+    assert marks.window_start([job], now) == now - timedelta(minutes=60)
+    marks.update(job.pod_name, [{"device": "gpu0", "data": [[now.timestamp() - 30, 1.0]]}], now)
+    start = marks.window_start([job], now)
+    assert start.tzinfo is not None
+    assert abs(start.timestamp() - (now.timestamp() - 30)) < 1e-3
+    assert monitor.utc_iso(start) == start.replace(tzinfo=None).isoformat() + "Z"
+
+
+def test_batch_returns_only_new_points(starlight):
+    fakes = [fake_job(i, {"type": "constant", "value": 1000 * (i + 1)}) for i in range(3)]
+    server = starlight(fakes, sample_interval=1)
+    jobs = [as_job(fake) for fake in fakes]
+    marks = metrics.Watermarks()
+    first = metrics.fetch_metric_batch(jobs, marks=marks)
+    assert server.stats()["GET /api/monitor/metric"] == 1
+    assert [round(first[job.job_id]["latest"], -3) for job in jobs] == [1000, 2000, 3000]
+    assert all(first[job.job_id]["points"] for job in jobs)
+    newest = {job.job_id: max(ts for _, ts, _ in first[job.job_id]["points"]) for job in jobs}
+    second = metrics.fetch_metric_batch(jobs, marks=marks)
+    for job in jobs:
+        assert all(ts > newest[job.job_id] for _, ts, _ in second[job.job_id]["points"])
+
+
+def test_stream_parser_keeps_last_points():
+    body = {"code": 200, "spec": {"device": [
+        {"device": f"gpu{d}", "data": [[ts, float(ts * 10 + d)] for ts in range(100)]} for d in range(4)
+    ]}}
+    raw = json.dumps(body).encode()
+    chunks = [raw[i:i + 7] for i in range(0, len(raw), 7)]
+    parsed = parse_metric_stream(chunks, keep=2)
+    assert parsed["code"] == 200
+    for dev, full in zip(parsed["spec"]["device"], body["spec"]["device"]):
+        assert dev["device"] == full["device"]
+        assert dev["data"] == full["data"][-2:]
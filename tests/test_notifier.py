@@ -0,0 +1,226 @@
+"""通知合并、拆分、失败重试和令牌桶限流，邮件连接的重连"""
+import smtplib
+import threading
+import time
+
+import pytest
+
+from notifier import CoalescingNotifier, DingTalkNotifier, EmailNotifier, NotificationManager, TokenBucket
+
+
+class Recorder:
+    """记录发送内容的通知器；fail 次数内返回 False"""
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.calls = []
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, title, content):
+        with self._lock:
+            self.calls.append((title, content))
+            if self.fail > 0:
+                self.fail -= 1
+                return False
+            self.sent.append((title, content))
+            return True
+
+
+def _wait(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_token_bucket_burst_is_a_fraction_of_rate():
+    bucket = TokenBucket(20)
+    assert bucket.capacity == 5
+    for _ in range(5):
+        assert bucket.wait_time() == 0
+        bucket.take()
+    assert bucket.wait_time() > 2.5  # 每 3 秒补充一个令牌
+
+
+def test_window_merges_and_dedupes():
+    recorder = Recorder()
+    notifier = CoalescingNotifier("test", recorder, window=0.1, rate_per_min=600)
+    notifier.submit([("A", "时间: 2024-01-01 00:00:00", False), ("A", "时间: 2024-01-01 00:00:05", False),
+                     ("B", "b", False)])
+    notifier.close(5)
+    assert len(recorder.sent) == 1
+    title, content = recorder.sent[0]
+    assert title == "📋 2条监控通知" and "A (×2)" in content
+    assert notifier.deduped == 1 and notifier.merged == 1
+
+
+def test_digest_is_split_at_entry_and_size_limits():
+    recorder = Recorder()
+    notifier = CoalescingNotifier("test", recorder, window=0.1, rate_per_min=6000, max_chars=500, max_entries=4)
+    notifier.submit([(f"告警{i}", "x" * 100, False) for i in range(10)])
+    notifier.submit([("很长", "y" * 2000, False)])
+    notifier.close(5)
+    assert sum(len(content.split("---")) for _, content in recorder.sent) == 11
+    assert all(len(content) <= 500 + 50 for _, content in recorder.sent)
+    assert all(content.count("####") <= 4 for _, content in recorder.sent)
+
+
+def test_failed_digest_is_retried_not_dropped():
+    recorder = Recorder(fail=2)
+    notifier = CoalescingNotifier("test", recorder, window=0.05, rate_per_min=6000, max_attempts=3,
+                                  retry_delay=0.2)
+    notifier.submit([("A", "a", False), ("B", "b", False)])
+    assert _wait(lambda: recorder.calls)
+    # 等待重试期间收到的相同告警合并到放回的消息中
+    notifier.submit([("A", "a", False)])
+    notifier.close(5)
+    assert len(recorder.calls) == 3 and len(recorder.sent) == 1
+    assert "A (×2)" in recorder.sent[0][1] and "B" in recorder.sent[0][1]
+    assert notifier.failed == 2 and notifier.dropped == 0
+
+
+def test_retries_are_bounded():
+    recorder = Recorder(fail=100)
+    notifier = CoalescingNotifier("test", recorder, window=0.01, rate_per_min=6000, max_attempts=3,
+                                  retry_delay=0.01)
+    notifier.submit([("A", "a", True)])
+    notifier.close(5)
+    assert len(recorder.calls) == 3 and notifier.dropped == 1
+
+
+def test_urgent_messages_use_tokens_and_go_first():
+    recorder = Recorder()
+    notifier = CoalescingNotifier("test", recorder, window=0.05, rate_per_min=60)
+    notifier.bucket = TokenBucket(60, burst=1)  # 每秒一个令牌
+    notifier.submit([("urgent0", "u", True)])
+    assert _wait(lambda: recorder.sent)
+    start = time.monotonic()
+    notifier.submit([("normal", "n", False)])
+    notifier.submit([(f"urgent{i}", "u", True) for i in range(1, 4)])
+    notifier.close(10)
+    titles = [title for title, _ in recorder.sent]
+    # 等令牌期间到达的紧急消息合并为一条，先于普通消息发送
+    assert titles == ["urgent0", "📋 3条监控通知", "normal"]
+    assert time.monotonic() - start > 1.5
+
+
+def test_dingtalk_outage_is_retried(starlight):
+    server = starlight(login=False)
+    dingtalk = DingTalkNotifier(server.webhook_url)
+    notifier = CoalescingNotifier("钉钉", dingtalk, window=0.05, rate_per_min=6000, retry_delay=0.3)
+    server.outage(0.2)
+    notifier.submit([("⚠️ GPU任务即将自动关闭", "任务ID: a", False)])
+    notifier.close(5)
+    assert notifier.failed == 1 and notifier.sent == 1
+    assert server.stats()["POST /robot/send"] == 2
+
+
+class Slow(Recorder):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def send(self, title, content):
+        time.sleep(self.delay)
+        return super().send(title, content)
+
+
+def test_dispatcher_uses_fixed_workers_per_channel():
+    slow, fast = Slow(0.3), Recorder()
+    notif_mgr = NotificationManager()
+    notif_mgr.notifiers = [("slow", slow), ("fast", fast)]
+    notif_mgr.start_dispatcher(workers=2, queue_size=10, channel_timeout=1)
+    threads = threading.active_count()
+    for i in range(5):
+        notif_mgr.send_all(f"m{i}", "x")
+    # 快的通知方式不等慢的通知方式
+    assert _wait(lambda: len(fast.sent) == 5, timeout=0.5)
+    assert threading.active_count() == threads
+    assert notif_mgr.flush(5)
+    notif_mgr.stop(5)
+    assert [title for title, _ in slow.sent] == [f"m{i}" for i in range(5)]
+
+
+def test_dispatcher_sends_urgent_first():
+    slow = Slow(0.2)
+    notif_mgr = NotificationManager()
+    notif_mgr.notifiers = [("slow", slow)]
+    notif_mgr.start_dispatcher(workers=1, queue_size=10, channel_timeout=1)
+    notif_mgr.send_all("first", "x")
+    time.sleep(0.05)  # 第一条正在发送
+    for i in range(3):
+        notif_mgr.send_all(f"normal{i}", "x")
+    notif_mgr.send_all("urgent", "x", urgent=True)
+    notif_mgr.stop(5)
+    # 积压的任务一起取出，紧急消息排在最前面
+    assert [title for title, _ in slow.sent][:2] == ["first", "urgent"]
+
+
+class FakeSMTP:
+    """smtplib.SMTP_SSL 的替身：errors 为每次 send_message 依次抛出的异常（None 表示成功）"""
+
+    instances = []
+    errors = []
+    login_error = None
+
+    def __init__(self, host, port, timeout=None):
+        self.closed = False
+        self.sent = []
+        FakeSMTP.instances.append(self)
+
+    def login(self, user, password):
+        if FakeSMTP.login_error is not None:
+            raise FakeSMTP.login_error
+
+    def noop(self):
+        if self.closed:
+            raise smtplib.SMTPServerDisconnected("closed")
+        return 250, b"ok"
+
+    def send_message(self, msg):
+        error = FakeSMTP.errors.pop(0) if FakeSMTP.errors else None
+        if error is not None:
+            raise error
+        self.sent.append(msg["Subject"])
+
+    def quit(self):
+        raise smtplib.SMTPServerDisconnected("connection lost")
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_smtp(monkeypatch):
+    monkeypatch.setattr(smtplib, "SMTP_SSL", FakeSMTP)
+    monkeypatch.setattr(FakeSMTP, "instances", [])
+    monkeypatch.setattr(FakeSMTP, "errors", [])
+    monkeypatch.setattr(FakeSMTP, "login_error", None)
+    notifier = EmailNotifier("smtp.example.com", 465, "a@example.com", "secret", "b@example.com")
+    yield notifier
+    notifier.close()
+
+
+def test_email_reconnects_after_disconnect_and_closes_old_socket(fake_smtp):
+    FakeSMTP.errors = [smtplib.SMTPServerDisconnected("gone")]
+    assert fake_smtp.send_many([("A", "a"), ("B", "b")]) == 2
+    old, new = FakeSMTP.instances
+    assert old.closed and not new.closed
+    assert new.sent == ["A", "B"] and fake_smtp.logins == 2
+
+
+def test_email_recipient_refused_is_not_retried(fake_smtp):
+    FakeSMTP.errors = [smtplib.SMTPRecipientsRefused({"b@example.com": (550, b"no such user")})]
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        fake_smtp.send_many([("A", "a")])
+    assert fake_smtp.logins == 1 and len(FakeSMTP.instances) == 1
+
+
+def test_email_auth_error_is_raised_and_socket_closed(fake_smtp):
+    FakeSMTP.login_error = smtplib.SMTPAuthenticationError(535, b"bad password")
+    with pytest.raises(smtplib.SMTPAuthenticationError):
+        fake_smtp.send_many([("A", "a")])
+    assert [server.closed for server in FakeSMTP.instances] == [True]
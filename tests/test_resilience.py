@@ -0,0 +1,77 @@
+"""请求层重试、熔断和认证失败后刷新 Token（对照模拟服务的故障）"""
+import time
+
+import pytest
+
+import config
+import monitor
+import resilience
+from http_client import get_client
+
+
+def test_idempotent_requests_retry_then_return_last_response(starlight):
+    server = starlight()
+    server.outage(60)
+    response = get_client().get(f"{config.JOB_LIST_URL}/{config.CLUSTER}", headers=monitor.HEADERS)
+    assert response.status_code == 503
+    assert get_client().retried == config.HTTP_MAX_RETRIES
+    assert get_client().last_error(f"{config.JOB_LIST_URL}/{config.CLUSTER}") == resilience.SERVER
+
+
+def test_non_idempotent_requests_are_not_retried(starlight):
+    server = starlight()
+    server.outage(60)
+    response = get_client().post(config.LOGIN_URL, json={})
+    assert response.status_code == 503
+    assert get_client().retried == 0
+
+
+def test_auth_failure_refreshes_token_once(starlight):
+    server = starlight()
+    old = monitor.HEADERS["bihu-token"]
+    server.expire_tokens()
+    response = get_client().get(f"{config.JOB_LIST_URL}/{config.CLUSTER}", headers=monitor.HEADERS)
+    assert response.status_code == 200
+    assert monitor.HEADERS["bihu-token"] != old
+    assert server.stats()["POST /api/keystone/short_term_token/name"] == 2
+
+
+def test_breaker_opens_and_probes_once():
+    breaker = resilience.CircuitBreaker(threshold=2, cooldown=0.1, max_cooldown=1)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+    time.sleep(0.12)
+    assert breaker.allow() and not breaker.allow()  # 只放行一个探测请求
+    breaker.record_failure()
+    assert breaker.cooldown == pytest.approx(0.2)
+    time.sleep(0.22)
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.cooldown == pytest.approx(0.1)
+
+
+def test_open_breaker_short_circuits_requests(starlight):
+    server = starlight()
+    client = get_client()
+    client.breaker = resilience.CircuitBreaker(threshold=1, cooldown=60)
+    client.breaker.record_failure()
+    before = sum(server.stats().values())
+    with pytest.raises(resilience.CircuitOpenError):
+        client.get(f"{config.JOB_LIST_URL}/{config.CLUSTER}", headers=monitor.HEADERS)
+    assert sum(server.stats().values()) == before
+
+
+def test_retry_state_stops_on_permanent_errors_only(monkeypatch):
+    monkeypatch.setattr(config, "RETRY_BASE_DELAY", 1)
+    monkeypatch.setattr(config, "RETRY_INTERVAL", 4)
+    state = resilience.RetryState()
+    for _ in range(10):
+        assert 0 <= state.failure(resilience.SERVER) <= 4
+    assert not state.exhausted()
+    for _ in range(config.MAX_FAIL_COUNT + 1):
+        state.failure(resilience.CLIENT)
+    assert state.exhausted()
+    state.success()
+    assert not state.exhausted() and state.failures == 0
@@ -0,0 +1,84 @@
+"""采样存储：批量写入序列名、过期清理与重新编号（包括清理期间并发追加）"""
+import builtins
+import json
+import time
+
+import sample_store
+from sample_store import SampleStore
+
+
+def _names(store):
+    with open(store.series_path, encoding="utf-8") as f:
+        return [tuple(name) for name in json.load(f)]
+
+
+def test_new_series_written_on_flush(tmp_path):
+    store = SampleStore(str(tmp_path))
+    now = time.time()
+    store.append("job1", "gpu0", "gpu_memory", now, 1.0)
+    store.append("job1", "gpu1", "gpu_memory", now, 2.0)
+    assert not (tmp_path / "series.json").exists()
+    store.flush()
+    assert _names(store) == [("job1", "gpu0", "gpu_memory"), ("job1", "gpu1", "gpu_memory")]
+    store.close()
+    reopened = SampleStore(str(tmp_path))
+    assert reopened.range("job1") == {
+        ("job1", "gpu0", "gpu_memory"): [(now, 1.0)],
+        ("job1", "gpu1", "gpu_memory"): [(now, 2.0)],
+    }
+    reopened.close()
+
+
+def test_compact_drops_expired_and_renumbers(tmp_path):
+    store = SampleStore(str(tmp_path))
+    now = time.time()
+    old = now - 10 * 86400
+    store.append_many([
+        ("job1", "gpu0", "gpu_memory", old, 1.0),
+        ("job2", "gpu0", "gpu_memory", old, 2.0),
+        ("job2", "gpu0", "gpu_memory", now, 3.0),
+    ])
+    store.forget("job1")
+    assert store.compact(retention_seconds=86400) == 2
+    assert _names(store) == [("job2", "gpu0", "gpu_memory")]
+    assert store.range() == {("job2", "gpu0", "gpu_memory"): [(now, 3.0)]}
+    # 压缩后继续追加，编号与文件一致
+    store.append_many([("job2", "gpu0", "gpu_memory", now + 1, 4.0), ("job3", "gpu0", "gpu_memory", now, 5.0)])
+    assert store.range("job2")[("job2", "gpu0", "gpu_memory")] == [(now, 3.0), (now + 1, 4.0)]
+    assert store.range("job3") == {("job3", "gpu0", "gpu_memory"): [(now, 5.0)]}
+    store.close()
+
+
+def test_compact_tolerates_series_appended_during_scan(tmp_path, monkeypatch):
+    store = SampleStore(str(tmp_path))
+    now = time.time()
+    old = now - 10 * 86400
+    store.append_many([
+        ("job1", "gpu0", "gpu_memory", old, 1.0),
+        ("job2", "gpu0", "gpu_memory", now, 2.0),
+    ])
+    store.forget("job1")  # 扫描时 job1 既不在追踪中，也没有未过期的记录
+    real_open = builtins.open
+
+    def hooked(path, mode="r", *args, **kwargs):
+        if str(path).endswith(".tmp") and mode == "wb":
+            # 扫描结束、替换文件之前：已结束的序列重新出现，以及新建的序列
+            store.append_many([
+                ("job1", "gpu0", "gpu_memory", now, 3.0),
+                ("job3", "gpu0", "gpu_memory", now, 4.0),
+            ])
+        return real_open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(sample_store, "open", hooked, raising=False)
+    assert store.compact(retention_seconds=86400) == 1
+    monkeypatch.undo()
+    assert store.range() == {
+        ("job1", "gpu0", "gpu_memory"): [(now, 3.0)],
+        ("job2", "gpu0", "gpu_memory"): [(now, 2.0)],
+        ("job3", "gpu0", "gpu_memory"): [(now, 4.0)],
+    }
+    assert sorted(_names(store)) == sorted(store.range())
+    store.close()
+    reopened = SampleStore(str(tmp_path))
+    assert reopened.range("job1") == {("job1", "gpu0", "gpu_memory"): [(now, 3.0)]}
+    reopened.close()
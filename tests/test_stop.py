@@ -0,0 +1,117 @@
+"""关闭确认：monitor.stop_job、bulk_stop.stop_jobs 和引擎中的关闭"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bulk_stop
+import config
+import engine
+import monitor
+from conftest import as_job, fake_job
+from http_client import get_client
+from notifier import NotificationManager
+
+
+def test_stop_job_confirms_after_platform_removes_job(starlight):
+    fake = fake_job(1)
+    server = starlight([fake], stop_delay=0.2)
+    assert monitor.stop_job(as_job(fake), timeout=5) is True
+    stats = server.stats()
+    assert stats["DELETE /api/job/running/{cluster}/{job_id}"] == 1
+    assert stats["GET /api/job/running/{cluster}/{job_id}"] >= 2
+
+
+def test_stop_job_gives_up_at_deadline_without_request_layer_retries(starlight):
+    fake = fake_job(1)
+    server = starlight([fake])
+    server.outage(30)
+    start = time.monotonic()
+    assert monitor.stop_job(as_job(fake), timeout=0.3) is False
+    assert time.monotonic() - start < monitor.stop_call_timeout(0.3)
+    # DELETE 和状态查询都由确认循环重发，请求层不重试
+    assert get_client().retried == 0
+    assert server.stats()["503 /api/job/running/{cluster}/{job_id}"] >= 2
+
+
+def test_stop_job_requests_do_not_overrun_deadline(starlight):
+    fake = fake_job(1)
+    server = starlight([fake], slow_latency=3)
+    server.scenario.slow_rate = 1.0  # 登录之后的请求都很慢
+    start = time.monotonic()
+    assert monitor.stop_job(as_job(fake), timeout=0.5) is False
+    # 每个请求的读取超时不超过剩余时间，不会等满 3 秒的慢响应
+    assert time.monotonic() - start < 2
+
+
+def test_bulk_stop_reports_each_job(starlight):
+    fakes = [fake_job(i) for i in range(1, 6)]
+    starlight(fakes, stop_delay=0.1)
+    report = bulk_stop.stop_jobs([as_job(fake) for fake in fakes], concurrency=4, timeout=5)
+    assert {entry["result"] for entry in report.values()} == {bulk_stop.STOPPED}
+    assert all(entry["attempts"] == 1 for entry in report.values())
+
+
+def _engine(job):
+    eng = engine.MonitorEngine([job], NotificationManager())
+    eng._executor = ThreadPoolExecutor(4)
+    return eng
+
+
+def test_engine_runs_one_stop_per_job(monkeypatch):
+    job = as_job(fake_job(1))
+    eng = _engine(job)
+    release = threading.Event()
+    calls = []
+
+    def stop_job(job):
+        calls.append(job.job_id)
+        release.wait(5)
+        return True
+
+    monkeypatch.setattr(monitor, "stop_job", stop_job)
+    watcher = engine.JobWatcher(eng, job)
+
+    async def go():
+        first = asyncio.create_task(watcher.shutdown())
+        await asyncio.sleep(0.1)
+        await watcher.shutdown()  # 第一次关闭仍在进行
+        release.set()
+        await first
+
+    asyncio.run(go())
+    eng._executor.shutdown()
+    assert calls == [job.job_id]
+    assert watcher.stopped
+
+
+def test_engine_stop_timeout_does_not_report_failure(monkeypatch):
+    job = as_job(fake_job(1))
+    eng = _engine(job)
+    eng.stop_timeout = 0.1
+    done = threading.Event()
+
+    def stop_job(job):
+        time.sleep(0.3)
+        done.set()
+        return True
+
+    monkeypatch.setattr(monitor, "stop_job", stop_job)
+    watcher = engine.JobWatcher(eng, job)
+    notified = []
+
+    async def notify(title, message, urgent=False):
+        notified.append(title)
+
+    watcher.notify = notify
+    asyncio.run(watcher.shutdown())
+    assert notified == [] and not watcher.stopped
+    assert done.wait(2)
+    eng._executor.shutdown()
+    # 线程结束后才允许再次关闭
+    assert job.job_id not in eng._stopping
+
+
+def test_engine_stop_timeout_covers_confirmation():
+    eng = engine.MonitorEngine([], NotificationManager())
+    assert eng.stop_timeout >= config.STOP_CONFIRM_TIMEOUT + config.HTTP_CONNECT_TIMEOUT + config.HTTP_READ_TIMEOUT
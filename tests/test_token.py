@@ -0,0 +1,92 @@
+"""Token 缓存的单飞刷新、缓存文件复用，以及多任务引擎在过期前主动刷新"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import config
+import engine
+import get_token
+import monitor
+from notifier import NotificationManager
+from token_cache import TokenCache
+
+
+def _counting_login(delay=0.0):
+    calls = []
+
+    def login():
+        calls.append(time.time())
+        time.sleep(delay)
+        return f"token-{len(calls)}"
+
+    return login, calls
+
+
+def test_concurrent_refresh_logs_in_once(tmp_path):
+    login, calls = _counting_login(delay=0.1)
+    cache = TokenCache(login, path=str(tmp_path / "token.json"), ttl=3600, refresh_margin=60)
+    stale = cache.get()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(stale_token=stale))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 2
+    assert set(results) == {"token-2"}
+
+
+def test_cache_file_reused_by_new_process(tmp_path):
+    path = str(tmp_path / "token.json")
+    login, calls = _counting_login()
+    token = TokenCache(login, path=path, owner="a", ttl=3600).get()
+    assert TokenCache(login, path=path, owner="a", ttl=3600).get() == token
+    assert TokenCache(login, path=path, owner="b", ttl=3600).get() != token
+    assert len(calls) == 2
+
+
+def _authorized():
+    response = requests.get(f"{config.JOB_LIST_URL}/{config.CLUSTER}", headers=monitor.HEADERS, timeout=5)
+    return response.status_code == 200
+
+
+def test_engine_refreshes_token_before_expiry(monkeypatch, starlight):
+    monkeypatch.setattr(config, "TOKEN_REFRESH_MARGIN", 2)
+    monkeypatch.setattr(config, "TOKEN_REFRESH_RETRY", 0.1)
+    server = starlight(token_ttl=4)
+    first = monitor.HEADERS["bihu-token"]
+    eng = engine.MonitorEngine([], NotificationManager())
+    eng._executor = ThreadPoolExecutor(2)
+
+    async def go():
+        task = asyncio.create_task(eng.refresh_token_forever())
+        await asyncio.sleep(4.5)
+        task.cancel()
+
+    asyncio.run(go())
+    eng._executor.shutdown()
+    # 第一个 Token 已在服务端过期，但请求头已换成新 Token，不需要经过一次认证失败
+    assert monitor.HEADERS["bihu-token"] != first
+    assert _authorized()
+    logins = server.stats()["POST /api/keystone/short_term_token/name"]
+    assert 2 <= logins <= 4
+
+
+def test_engine_refresh_waits_for_new_expiry(monkeypatch, starlight):
+    monkeypatch.setattr(config, "TOKEN_REFRESH_RETRY", 0.1)
+    server = starlight()
+    eng = engine.MonitorEngine([], NotificationManager())
+    eng._executor = ThreadPoolExecutor(2)
+
+    async def go():
+        task = asyncio.create_task(eng.refresh_token_forever())
+        await asyncio.sleep(0.5)
+        task.cancel()
+
+    asyncio.run(go())
+    eng._executor.shutdown()
+    assert get_token.token_refresh_at() > time.time()
+    assert server.stats()["POST /api/keystone/short_term_token/name"] == 1
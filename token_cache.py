@@ -0,0 +1,131 @@
+"""
+Token 缓存 - 把 bihu-token 及其过期时间保存在本地，重启后直接复用
+
+- 缓存文件权限为 0600，写入时先写临时文件再替换
+- 距离过期不足 TOKEN_REFRESH_MARGIN 秒时提前刷新
+- 多个线程同时需要刷新时只发送一次登录请求
+"""
+import base64
+import json
+import os
+import threading
+import time
+
+import config
+import telemetry
+
+
+def token_expiry(token, default_ttl):
+    """
+    计算 Token 的过期时间：JWT 取 exp 字段，否则按 default_ttl 估算
+
+    Returns:
+        float: 过期时间（UNIX 秒）
+    """
+    parts = str(token).split(".")
+    if len(parts) == 3:
+        try:
+            payload = parts[1] + "=" * (-len(parts[1]) % 4)
+            exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+            if exp:
+                return float(exp)
+        except (ValueError, AttributeError):
+            pass
+    return time.time() + default_ttl
+
+
+class TokenCache:
+    """持久化的 Token 缓存（单飞刷新）"""
+
+    def __init__(self, login, path=None, owner="", ttl=None, refresh_margin=None):
+        """
+        初始化 Token 缓存
+
+        Args:
+            login: 登录函数，返回 Token 字符串，失败返回 None
+            path: 缓存文件路径，默认 config.TOKEN_CACHE_FILE
+            owner: 账号标识（用户名），账号变化时不复用旧缓存
+            ttl: 无法从 Token 解析过期时间时使用的有效期（秒），默认 config.TOKEN_TTL
+            refresh_margin: 提前刷新的时间（秒），默认 config.TOKEN_REFRESH_MARGIN
+        """
+        self.login = login
+        self.path = path or config.TOKEN_CACHE_FILE
+        self.owner = owner
+        self.ttl = config.TOKEN_TTL if ttl is None else ttl
+        self.refresh_margin = config.TOKEN_REFRESH_MARGIN if refresh_margin is None else refresh_margin
+        self.token = None
+        self.expires_at = 0
+        self.logins = 0
+        self._lock = threading.Lock()
+
+    def _fresh(self):
+        return self.token is not None and time.time() < self.expires_at - self.refresh_margin
+
+    def _load(self):
+        """从缓存文件读取 Token（可能已被其他进程刷新）"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("owner") == self.owner and data.get("expires_at", 0) > self.expires_at:
+            self.token = data.get("token")
+            self.expires_at = data["expires_at"]
+
+    def _save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"  # 多个监控进程共用缓存文件时互不覆盖
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"owner": self.owner, "token": self.token, "expires_at": self.expires_at}, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Token 缓存写入失败: {e}")
+
+    def get(self, force_refresh=False, stale_token=None):
+        """
+        获取有效的 Token
+
+        Args:
+            force_refresh: 强制重新登录（例如接口返回认证失败）
+            stale_token: 调用方认为已失效的 Token；如果缓存中的 Token 已经不是它，
+                         说明别的调用方刚刷新过，直接返回新 Token
+
+        Returns:
+            str: Token，登录失败且没有可用 Token 时返回 None
+        """
+        with self._lock:
+            if stale_token is None and not force_refresh:
+                if not self._fresh():
+                    self._load()
+                if self._fresh():
+                    return self.token
+            elif not force_refresh:
+                # 别的线程或进程（通过缓存文件）可能已经换了新 Token
+                self._load()
+                if self.token not in (None, stale_token) and time.time() < self.expires_at:
+                    return self.token
+
+            token = self.login()
+            self.logins += 1
+            if not token:
+                telemetry.TOKEN_FAILURES.inc()
+                # 登录失败时，尚未过期的旧 Token 仍可使用
+                if not force_refresh and self.token not in (None, stale_token) and time.time() < self.expires_at:
+                    return self.token
+                return None
+            self.token = token
+            self.expires_at = token_expiry(token, self.ttl)
+            self._save()
+            return self.token
+
+    def clear(self):
+        """清除缓存（内存和文件）"""
+        with self._lock:
+            self.token = None
+            self.expires_at = 0
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
@@ -0,0 +1,261 @@
+"""
+热点路径追踪与按需性能采样
+
+追踪：设置 config.TRACE_FILE 后，轮询循环和 API 调用的各个阶段（HTTP 请求、解析、
+Token 刷新、通知发送等）以 JSON lines 写入该文件，每行一个 span：
+    {"ts": 开始时间, "name": "api.gpu_memory", "ms": 耗时, "id": ..., "parent": ..., "thread": ..., 其他属性}
+未设置时 span() 直接返回一个共用的空 span，几乎没有开销。
+
+采样：运行中的程序收到 SIGUSR1（Linux/macOS），或工作目录下出现 PROFILE_TRIGGER_FILE
+文件（所有平台，文件内容可写采样秒数）时，在后台线程中对所有线程的调用栈采样
+PROFILE_SECONDS 秒，结果写入 PROFILE_DIR：
+- profile-<时间>.folded：折叠调用栈（可用 flamegraph.pl / speedscope 生成火焰图）
+- profile-<时间>.txt：按自身耗时和累计耗时排序的函数列表
+不需要重启程序。
+"""
+import contextvars
+import functools
+import itertools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+import config
+
+
+class _NoopSpan:
+    """未开启追踪时使用的空 span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+_current = contextvars.ContextVar("span", default=None)
+_ids = itertools.count(1)
+_writer_lock = threading.Lock()
+_writer = None
+_writer_path = None
+
+
+def enabled():
+    return bool(config.TRACE_FILE)
+
+
+def _write(record):
+    global _writer, _writer_path
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _writer_lock:
+        if _writer is None or _writer_path != config.TRACE_FILE:
+            if _writer is not None:
+                _writer.close()
+            _writer_path = config.TRACE_FILE
+            _writer = open(_writer_path, "a", encoding="utf-8", buffering=1)
+        _writer.write(line + "\n")
+
+
+class Span:
+    """一个计时阶段；可在结束前用 set() 补充属性（例如状态码）"""
+
+    __slots__ = ("name", "attrs", "id", "parent", "start", "_wall", "_token")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.id = next(_ids)
+        self.parent = None
+        self.start = None
+        self._wall = None
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _current.get()
+        self.parent = parent.id if parent is not None else None
+        self._token = _current.set(self)
+        self._wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _current.reset(self._token)
+        record = {
+            "ts": round(self._wall, 6),
+            "name": self.name,
+            "ms": round(elapsed * 1000, 3),
+            "id": self.id,
+            "parent": self.parent,
+            "thread": threading.current_thread().name,
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        record.update(self.attrs)
+        try:
+            _write(record)
+        except OSError:
+            pass
+        return False
+
+
+def span(name, **attrs):
+    """
+    记录一个阶段的耗时
+
+    用法：
+        with tracing.span("api.job_status", job=job.job_id) as s:
+            ...
+            s.set(status=200)
+
+    未开启追踪时返回共用的空 span。
+    """
+    if not config.TRACE_FILE:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def traced(name=None):
+    """函数装饰器：每次调用记录一个 span"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not config.TRACE_FILE:
+                return func(*args, **kwargs)
+            with Span(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StackSampler:
+    """按固定间隔采样所有线程的调用栈"""
+
+    def __init__(self, interval=None):
+        self.interval = interval or config.PROFILE_INTERVAL
+        self.stacks = Counter()
+        self.samples = 0
+
+    def sample(self):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self, seconds):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.sample()
+            time.sleep(self.interval)
+
+    def folded(self):
+        """折叠调用栈格式：每行 "线程;帧;帧 次数" """
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def summary(self, limit=40):
+        """按自身（栈顶）和累计（出现在栈中）采样数排序的函数"""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = [f.rsplit(":", 1)[0] for f in stack.split(";")[1:]]
+            if frames:
+                own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        samples = max(sum(self.stacks.values()), 1)
+        lines = [f"{self.samples} samples every {self.interval * 1000:.0f}ms", "", "self%  function"]
+        lines += [f"{n / samples:6.1%}  {f}" for f, n in own.most_common(limit)]
+        lines += ["", "total%  function"]
+        lines += [f"{n / samples:6.1%}  {f}" for f, n in total.most_common(limit)]
+        return "\n".join(lines) + "\n"
+
+
+_profile_lock = threading.Lock()
+
+
+def profile(seconds=None, directory=None):
+    """
+    采样 seconds 秒并写入结果文件（同一时间只运行一个采样）
+
+    Returns:
+        str: 折叠调用栈文件路径；已有采样在运行时返回 None
+    """
+    if not _profile_lock.acquire(blocking=False):
+        print("⚠️ 已有性能采样在运行")
+        return None
+    try:
+        seconds = seconds or config.PROFILE_SECONDS
+        directory = directory or config.PROFILE_DIR
+        print(f"🔍 开始性能采样 {seconds}s")
+        sampler = StackSampler()
+        sampler.run(seconds)
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}")
+        with open(f"{base}.folded", "w", encoding="utf-8") as f:
+            f.write(sampler.folded())
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(sampler.summary())
+        print(f"🔍 性能采样完成: {base}.folded / {base}.txt")
+        return f"{base}.folded"
+    finally:
+        _profile_lock.release()
+
+
+def _start_profile(seconds=None):
+    threading.Thread(target=profile, args=(seconds,), name="profiler", daemon=True).start()
+
+
+def _watch_trigger_file(path, poll=1.0):
+    while True:
+        time.sleep(poll)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                content = f.read().strip()
+            os.remove(path)
+        except OSError:
+            continue
+        try:
+            seconds = float(content) if content else None
+        except ValueError:
+            seconds = None
+        _start_profile(seconds)
+
+
+_installed = False
+
+
+def install_profiler():
+    """注册 SIGUSR1 和触发文件（重复调用只注册一次）"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda signum, frame: _start_profile())
+    if config.PROFILE_TRIGGER_FILE:
+        threading.Thread(
+            target=_watch_trigger_file, args=(config.PROFILE_TRIGGER_FILE,), name="profile-trigger", daemon=True
+        ).start()